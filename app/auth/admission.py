@@ -0,0 +1,118 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+from app.metrics import registry
+
+wait_seconds = registry.histogram(
+    "auth_hash_admission_wait_seconds", "Time password hashing waited for memory budget."
+)
+
+# time (seconds) between the checks of a background operation for an idle slot
+BACKGROUND_POLL = 0.01
+
+
+class Overloaded(BaseException):
+    """No capacity to take the operation, retry after 'retry_after' seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds concurrent memory-hungry operations (password hashing) by a memory budget.
+
+    An operation runs only if its memory fits the budget next to the running
+    ones, otherwise it waits in a queue up to 'max_wait' seconds. When the queue
+    is full or the wait times out 'Overloaded' is raised, so the request can be
+    rejected quickly instead of the process running out of memory.
+
+    Background operations (bulk imports) take a slot only while it is free
+    and no other operation waits for one. They wait without a deadline, are
+    never rejected and do not count in the queue, so they only use the
+    capacity interactive requests leave idle.
+
+    Args:
+        memory_budget: memory (bytes) the operations are allowed to use together
+        operation_memory: memory (bytes) used by a single operation
+        max_queue: max number of operations waiting for a slot
+        max_wait: time (seconds) an operation may wait for a slot
+
+    Example:
+        >>> admission = AdmissionController(64 * 2**20, 32 * 2**20)
+        >>> async with admission.admit():
+        >>>    ...
+    """
+
+    def __init__(
+        self,
+        memory_budget: int,
+        operation_memory: int,
+        max_queue: int = 32,
+        max_wait: float = 2,
+    ):
+        self.slots = max(memory_budget // operation_memory, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retry_after = max(math.ceil(max_wait), 1)
+        self._semaphore = asyncio.Semaphore(self.slots)
+        self.active = 0
+        self.waiting = 0
+        self.background_waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @asynccontextmanager
+    async def admit(self, background: bool = False):
+        if background:
+            await self._acquire_idle()
+        else:
+            await self._acquire()
+
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    async def _acquire(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.retry_after)
+
+        self.waiting += 1
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded(self.retry_after)
+        finally:
+            self.waiting -= 1
+            wait_seconds.observe(time.perf_counter() - start_time)
+
+    async def _acquire_idle(self):
+        self.background_waiting += 1
+        try:
+            while self.waiting or self._semaphore.locked():
+                await asyncio.sleep(BACKGROUND_POLL)
+            # free, taken without suspending
+            await self._semaphore.acquire()
+        finally:
+            self.background_waiting -= 1
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "background_waiting": self.background_waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
@@ -1,29 +1,121 @@
+import logging
+import time
+from contextlib import contextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import clear_mappers
 
 from app.auth import dependencies as deps
-from app.auth.routes import auth_router
+from app.auth.config import grpc_config, log_config, pg_config
+from app.auth.monitoring import MetricsMiddleware, RequestIdMiddleware
+from app.auth.routes import auth_router, keys_router, monitoring_router
 from app.logger import setup_logger
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
 
-setup_logger(log_level=20)
+# of the slowest worker
+startup_seconds = registry.gauge(
+    "auth_startup_seconds", "Time spent in the startup steps.", ["step"], multiprocess="max"
+)
 
 
 def create_app():
     fastapi_app = FastAPI(
-        title="Auth server"
+        title="Auth server",
+        default_response_class=ORJSONResponse,
     )
     fastapi_app.include_router(auth_router)
+    fastapi_app.include_router(keys_router)
+    fastapi_app.include_router(monitoring_router)
+    fastapi_app.add_middleware(MetricsMiddleware)
+    # outermost, the request id is set for every log record of the request
+    fastapi_app.add_middleware(RequestIdMiddleware)
     return fastapi_app
 
 
 app = create_app()
 
 
+@contextmanager
+def startup_step(name: str):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        startup_seconds.set(name, value=elapsed)
+        logger.info(f"Startup step '{name}' took {elapsed * 1000:.0f} ms")
+
+
 @app.on_event("startup")
 async def startup_event():
-    deps.register_mapping()
+    """Every expensive initialization, so the first request pays none of it.
+
+    Runs in each worker process after the fork, as connections, process pools
+    and tasks cannot be shared with the server process.
+    """
+    setup_logger(
+        log_config.level,
+        json_format=log_config.json,
+        sampling=log_config.sampling,
+        queue_size=log_config.queue_size,
+    )
+    with startup_step("total"):
+        with startup_step("mapping"):
+            deps.register_mapping()
+        with startup_step("providers"):
+            dao = deps.get_dao_provider()
+            token = deps.get_token_provider()
+            deps.get_jwks()
+            emails = deps.get_email_filter()
+        with startup_step("database"):
+            try:
+                await dao.startup(pg_config.warm_up_connections)
+                # compiles the login query and prepares its statement
+                await dao.get_credentials("warm-up@example.invalid")
+            except Exception as e:
+                logger.warning(f"Connection pool warm-up failed: {e!r}")
+            await deps.get_idempotency_cleanup().start()
+        with startup_step("hashing"):
+            await deps.get_auth_provider().startup()
+        with startup_step("tokens"):
+            # loads the signing backend of the algorithm
+            token.verify_token(token.create_token({"email": "warm-up@example.invalid"}))
+            await deps.get_token_revocations().start()
+        if emails:
+            with startup_step("email_filter"):
+                await emails.start()
+        for throttle in (deps.get_login_throttle(), deps.get_sign_up_throttle()):
+            if throttle:
+                await throttle.start()
+        if grpc_config.in_process:
+            with startup_step("grpc"):
+                # grpcio is only needed to serve gRPC
+                from app.auth.grpc_server import get_server
+
+                await get_server().start()
+        await registry.start_sharing()
+    # ready for traffic from now on
+    await deps.get_health_monitor().start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await deps.get_health_monitor().stop()
+    if grpc_config.in_process:
+        from app.auth.grpc_server import get_server
+
+        await get_server().stop(grpc_config.grace)
+    await registry.stop_sharing()
+    await deps.get_token_revocations().stop()
+    await deps.get_idempotency_cleanup().stop()
+    for throttle in (deps.get_login_throttle(), deps.get_sign_up_throttle()):
+        if throttle:
+            await throttle.stop()
     clear_mappers()
+    await deps.get_auth_provider().shutdown()
+    if emails := deps.get_email_filter():
+        await emails.stop()
+    await deps.get_dao_provider().shutdown()
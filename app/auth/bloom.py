@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Optional
+
+from app.auth.dao import AuthDao
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Probabilistic set: membership test may give false positives, never false negatives.
+
+    Args:
+        capacity: expected number of items
+        error_rate: false positive probability once 'capacity' items are added
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # double hashing: k positions derived from two independent 64-bit hashes
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def memory(self) -> int:
+        return len(self.bits)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """Estimated for the current number of items."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class EmailFilter:
+    """Bloom filter of registered emails kept in sync with the users table.
+
+    The filter is built by streaming every email from the database (a read
+    replica if any) and is rebuilt every 'rebuild_interval' seconds. Users
+    registered through other workers or pods, or missing on the replica, are
+    caught up from the primary: the users with an id above the greatest one
+    seen, less 'id_overlap' for ids committed out of order. A build catches
+    up once done, a miss of 'might_be_registered' before it is trusted.
+    Until the first build completes every email is reported as possibly
+    existing.
+
+    Args:
+        dao: storage to load emails from
+        capacity: minimal expected number of users, grows with the table
+        error_rate: target false positive probability
+        rebuild_interval: time (seconds) between rebuilds
+        id_overlap: user ids below the greatest one seen read again by a catch-up
+    """
+
+    def __init__(
+        self,
+        dao: AuthDao,
+        capacity: int = 1_000_000,
+        error_rate: float = 0.01,
+        rebuild_interval: float = 300,
+        id_overlap: int = 1000,
+    ):
+        self.dao = dao
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.id_overlap = id_overlap
+        self.build_time: Optional[float] = None
+        self.last_id = 0
+        self._filter: Optional[BloomFilter] = None
+        self._building: Optional[BloomFilter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Optional[asyncio.Future] = None
+        self._pending: Optional[asyncio.Future] = None
+        self.catch_ups = 0
+        self.catch_up_failures = 0
+
+    def might_exist(self, email: str) -> bool:
+        """False means the email was not registered when the filter last caught up."""
+        return self._filter is None or email in self._filter
+
+    async def might_be_registered(self, email: str) -> bool:
+        """False means the email is definitely not registered, through any pod.
+
+        A miss is checked again after catching up with the users registered
+        since; concurrent misses share the catch-up.
+        """
+        if self.might_exist(email):
+            return True
+        try:
+            await self.catch_up()
+        except Exception as e:
+            logger.warning(f"Email filter catch-up failed: {e!r}")
+            return True
+        return self.might_exist(email)
+
+    async def catch_up(self):
+        """Add the users registered since the last catch-up started."""
+        # a catch-up already running may have read the users table before the
+        # caller's user was committed, the next one waits for it
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._catch_up_after(self._running))
+        await asyncio.shield(self._pending)
+
+    async def _catch_up_after(self, previous: Optional[asyncio.Future]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        self._running, self._pending = self._pending, None
+        try:
+            await self._catch_up(self._filter)
+        except Exception:
+            self.catch_up_failures += 1
+            raise
+
+    async def _catch_up(self, bloom: Optional[BloomFilter]):
+        users = await self.dao.get_users_after(max(self.last_id - self.id_overlap, 0))
+        self.catch_ups += 1
+        for user_id, email in users:
+            self.last_id = max(self.last_id, user_id)
+            for target in (bloom, self._building):
+                # the overlap is read again, count every email once
+                if target is not None and email not in target:
+                    target.add(email)
+
+    def add(self, email: str):
+        for bloom in (self._filter, self._building):
+            if bloom is not None:
+                bloom.add(email)
+
+    async def rebuild(self):
+        start_time = time.perf_counter()
+        count = self._filter.count if self._filter else 0
+        building = self._building = BloomFilter(max(self.capacity, count * 2), self.error_rate)
+        try:
+            last_id = 0
+            async for user_id, email in self.dao.iter_users():
+                building.add(email)
+                last_id = max(last_id, user_id)
+            # users the replica lacks and the ones registered meanwhile
+            self.last_id = last_id
+            await self._catch_up(None)
+            self._filter = building
+        finally:
+            self._building = None
+        self.build_time = time.perf_counter() - start_time
+        logger.info(f"Email filter rebuilt: {self.stats()}")
+
+    async def start(self):
+        try:
+            await self.rebuild()
+        except Exception as e:
+            logger.warning(f"Email filter build failed, filter disabled until next rebuild: {e!r}")
+        self._task = asyncio.create_task(self._rebuild_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _rebuild_periodically(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.warning(f"Email filter rebuild failed: {e!r}")
+
+    def stats(self) -> dict:
+        bloom = self._filter
+        return {
+            "ready": bloom is not None,
+            "items": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else 0,
+            "memory_bytes": bloom.memory if bloom else 0,
+            "hashes": bloom.hashes if bloom else 0,
+            "false_positive_rate": bloom.false_positive_rate if bloom else 0.0,
+            "build_time": self.build_time,
+            "catch_ups": self.catch_ups,
+            "catch_up_failures": self.catch_up_failures,
+        }
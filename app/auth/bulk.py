@@ -0,0 +1,147 @@
+import asyncio
+import json
+from typing import AsyncIterable, AsyncIterator, NamedTuple, Optional
+
+from pydantic import ValidationError
+
+from app.auth.bloom import EmailFilter
+from app.auth.dao import AuthDao
+from app.auth.orm import users_table
+from app.auth.schema import UserCredentials
+from app.auth.security import AuthProvider
+
+# passwords of a batch hashed at once, enough to keep the hashing workers busy
+HASH_CONCURRENCY = 8
+# EmailStr allows longer emails than the column stores
+MAX_EMAIL_LENGTH = users_table.c.email.type.length
+
+
+class ImportRow(NamedTuple):
+    line: int
+    email: Optional[str]
+    status: str  # "created", "exists" or "error"
+    detail: Optional[str] = None
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a stream of byte chunks into lines without buffering the whole body."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+def parse_line(line_no: int, line: bytes) -> UserCredentials | ImportRow:
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        return ImportRow(line_no, None, "error", f"invalid JSON: {e}")
+
+    try:
+        cred = UserCredentials.parse_obj(data)
+    except ValidationError as e:
+        email = data.get("email") if isinstance(data, dict) else None
+        detail = "; ".join(f"{err['loc'][0]}: {err['msg']}" for err in e.errors())
+        return ImportRow(line_no, email, "error", detail)
+    if len(cred.email) > MAX_EMAIL_LENGTH:
+        detail = f"email: ensure this value has at most {MAX_EMAIL_LENGTH} characters"
+        return ImportRow(line_no, cred.email, "error", detail)
+    return cred
+
+
+async def import_users(
+    lines: AsyncIterable[bytes],
+    dao: AuthDao,
+    auth: AuthProvider,
+    batch_size: int = 1000,
+    emails: Optional[EmailFilter] = None,
+) -> AsyncIterator[ImportRow]:
+    """Import NDJSON credentials ({"email": ..., "password": ...} per line).
+
+    Lines are validated as they arrive and registered in batches: passwords of a
+    batch are hashed concurrently by the auth provider workers and written with
+    one multi-row insert per table. Only a single batch is held in memory. A
+    batch the database rejects is written again row by row, the rejected rows
+    are errors.
+
+    Yields a result for every non-empty input line.
+    """
+    batch: dict[str, tuple[int, UserCredentials]] = {}
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+
+        cred = parse_line(line_no, line)
+        if isinstance(cred, ImportRow):
+            yield cred
+        elif cred.email in batch:
+            yield ImportRow(line_no, cred.email, "exists", "duplicated in input")
+        else:
+            batch[cred.email] = (line_no, cred)
+
+        if len(batch) >= batch_size:
+            for row in await _import_batch(batch, dao, auth, emails):
+                yield row
+            batch = {}
+
+    if batch:
+        for row in await _import_batch(batch, dao, auth, emails):
+            yield row
+
+
+async def _hash_password(
+    password: str, auth: AuthProvider, limit: asyncio.Semaphore
+) -> str:
+    # background hashes wait for slots no interactive request waits for,
+    # they neither fill the admission queue nor fail on overload
+    async with limit:
+        return await auth.ahash_password(password, background=True)
+
+
+async def _import_batch(
+    batch: dict[str, tuple[int, UserCredentials]],
+    dao: AuthDao,
+    auth: AuthProvider,
+    emails: Optional[EmailFilter],
+) -> list[ImportRow]:
+    limit = asyncio.Semaphore(HASH_CONCURRENCY)
+    hashes = await asyncio.gather(
+        *(_hash_password(cred.password, auth, limit) for _, cred in batch.values())
+    )
+    users = list(zip(batch, hashes))
+    failed: dict[str, str] = {}
+    try:
+        created = await dao.create_users(users)
+    except dao.write_errors:
+        # a row the database rejects fails only its own line
+        created = {}
+        for user in users:
+            try:
+                created.update(await dao.create_users([user]))
+            except dao.write_errors as e:
+                failed[user[0]] = str(getattr(e, "orig", e)).splitlines()[0]
+    if emails is not None:
+        for email in created:
+            emails.add(email)
+    return [
+        ImportRow(line_no, email, "error", failed[email])
+        if email in failed
+        else ImportRow(line_no, email, "created" if email in created else "exists")
+        for email, (line_no, _) in batch.items()
+    ]
+
+
+async def summarize(rows: AsyncIterable[ImportRow], max_errors: int = 1000) -> dict:
+    """Count import results, keeping at most 'max_errors' rejected rows."""
+    summary = {"created": 0, "exists": 0, "error": 0, "rejected": []}
+    async for row in rows:
+        summary[row.status] += 1
+        if row.status != "created" and len(summary["rejected"]) < max_errors:
+            summary["rejected"].append(row._asdict())
+    return summary
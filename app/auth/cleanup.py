@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.auth.dao import AuthDao
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyKeysCleanup:
+    """Deletes the sign-up idempotency keys older than the DAO 'idempotency_ttl'.
+
+    Expired keys are never honoured, deleting them only bounds the table.
+    Every pod runs it, a deletion finding nothing to delete is cheap.
+
+    Args:
+        dao: storage of the idempotency keys
+        interval: time (seconds) between deletions
+    """
+
+    def __init__(self, dao: AuthDao, interval: float = 3600):
+        self.dao = dao
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.deleted = 0
+        self.failures = 0
+
+    async def cleanup(self) -> int:
+        deleted = await self.dao.delete_expired_idempotency_keys()
+        self.runs += 1
+        self.deleted += deleted
+        return deleted
+
+    async def start(self):
+        self._task = asyncio.create_task(self._cleanup_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _cleanup_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.cleanup()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Idempotency keys cleanup failed: {e!r}")
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "deleted": self.deleted, "failures": self.failures}
@@ -0,0 +1,213 @@
+"""Auth service maintenance commands.
+
+Usage:
+    python -m app.auth.cli import-users users.ndjson > results.ndjson
+    python -m app.auth.cli generate-key --algorithm RS256 --kid 2026-10 keys/
+    python -m app.auth.cli calibrate --max-latency-ms 100 --max-memory-mib 16
+    python -m app.auth.cli seed-users --count 10000 --create-tables
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from app.auth import bulk
+from app.auth import dependencies as deps
+from app.auth.config import import_config, jwt_config, argon2_config, pg_config, Argon2Config
+from app.auth.orm import metadata
+from app.auth.security import Argon2Auth, argon2_hasher
+
+
+async def read_lines(file: BinaryIO) -> AsyncIterator[bytes]:
+    for line in file:
+        yield line
+
+
+async def import_users(args: argparse.Namespace) -> int:
+    dao = deps.get_dao_provider()
+    auth = deps.get_auth_provider()
+    await auth.startup()
+
+    counts = {"created": 0, "exists": 0, "error": 0}
+    try:
+        with open(args.path, "rb") as file:
+            rows = bulk.import_users(read_lines(file), dao, auth, args.batch_size)
+            async for row in rows:
+                counts[row.status] += 1
+                print(json.dumps(row._asdict()))
+    finally:
+        await auth.shutdown()
+        await dao.shutdown()
+
+    print(json.dumps(counts), file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+
+def generate_private_key(algorithm: str):
+    if algorithm.startswith(("RS", "PS")):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    raise ValueError(f"Unsupported algorithm: {algorithm}")
+
+
+async def generate_key(args: argparse.Namespace) -> int:
+    """Write a new "<kid>.pem" signing key. To retire the previous one, replace
+    its private key file with the public one ("<kid>.pub.pem")."""
+    key = generate_private_key(args.algorithm)
+    path = Path(args.keys_dir) / f"{args.kid}.pem"
+    pem = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as file:
+        file.write(pem)
+    print(path)
+    return 0
+
+
+def seed_email(prefix: str, number: int) -> str:
+    """Email of the seeded user 'number', the load test scenarios log in as them."""
+    return f"{prefix}-{number}@example.com"
+
+
+async def seed_users(args: argparse.Namespace) -> int:
+    """Register 'count' load test users sharing one password.
+
+    The password is hashed once, so seeding a large user set takes seconds.
+    Already registered users are skipped, so it can run before every load test.
+    """
+    if args.create_tables:
+        # the sqlite stand-in, Postgres schema is created by the migrations
+        async with deps.get_engine().begin() as conn:
+            await conn.run_sync(metadata.create_all)
+    dao = deps.get_dao_provider()
+    pwdhash = Argon2Auth.hash_password(args.password)
+
+    created = 0
+    try:
+        for start in range(0, args.count, args.batch_size):
+            numbers = range(start, min(start + args.batch_size, args.count))
+            users = [(seed_email(args.prefix, number), pwdhash) for number in numbers]
+            created += len(await dao.create_users(users))
+    finally:
+        await dao.shutdown()
+
+    print(json.dumps({"created": created, "exists": args.count - created}), file=sys.stderr)
+    return 0
+
+
+def hash_latency(config: Argon2Config, samples: int) -> float:
+    """Median time (seconds) to hash a password with the given settings."""
+    hasher = argon2_hasher(config)
+    timings = []
+    for _ in range(samples):
+        start_time = time.perf_counter()
+        hasher.hash("calibration-p@ssw0rd")
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings)
+
+
+async def calibrate(args: argparse.Namespace) -> int:
+    """Find the strongest Argon2 settings fitting latency and memory budgets.
+
+    Memory cost is tried from the budget down in powers of two; for each one the
+    time cost grows until the latency budget is exceeded. The candidate with the
+    highest memory * time cost wins. Run it on the target machine (pod), since
+    the result depends on its CPU.
+    """
+    max_latency = args.max_latency_ms / 1000
+    best, best_latency = None, None
+    memory_cost = args.max_memory_mib * 1024
+    while memory_cost >= args.min_memory_mib * 1024:
+        for time_cost in range(1, args.max_time_cost + 1):
+            config = Argon2Config(
+                workers=argon2_config.workers,
+                memory_cost=memory_cost,
+                time_cost=time_cost,
+                parallelism=args.parallelism,
+            )
+            latency = hash_latency(config, args.samples)
+            print(
+                f"memory_cost={memory_cost} time_cost={time_cost}: {latency * 1000:.1f} ms",
+                file=sys.stderr,
+            )
+            if latency > max_latency:
+                break
+            if best is None or (
+                memory_cost * time_cost > best.memory_cost * best.time_cost
+            ):
+                best, best_latency = config, latency
+        memory_cost //= 2
+
+    if best is None:
+        print("No settings fit the latency budget", file=sys.stderr)
+        return 1
+
+    print(f"# {best_latency * 1000:.1f} ms per hash")
+    print(f"ARGON2_MEMORY_COST={best.memory_cost}")
+    print(f"ARGON2_TIME_COST={best.time_cost}")
+    print(f"ARGON2_PARALLELISM={best.parallelism}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.auth.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser(
+        "import-users", help="register users from an NDJSON credentials file"
+    )
+    importer.add_argument("path", help='file with {"email": ..., "password": ...} lines')
+    importer.add_argument("--batch-size", type=int, default=import_config.batch_size)
+    importer.set_defaults(handler=import_users)
+
+    keygen = commands.add_parser("generate-key", help="create a JWT signing key")
+    keygen.add_argument("keys_dir", help="directory to write '<kid>.pem' to")
+    keygen.add_argument("--kid", required=True, help="key id, e.g. creation date")
+    keygen.add_argument("--algorithm", default=jwt_config.algorithm)
+    keygen.set_defaults(handler=generate_key)
+
+    calibration = commands.add_parser(
+        "calibrate", help="benchmark Argon2 settings on this machine"
+    )
+    calibration.add_argument("--max-latency-ms", type=float, default=100)
+    calibration.add_argument("--max-memory-mib", type=int, default=32)
+    calibration.add_argument("--min-memory-mib", type=int, default=4)
+    calibration.add_argument("--max-time-cost", type=int, default=10)
+    calibration.add_argument("--parallelism", type=int, default=1)
+    calibration.add_argument("--samples", type=int, default=5)
+    calibration.set_defaults(handler=calibrate)
+
+    seeding = commands.add_parser(
+        "seed-users", help="register the users of the load test scenarios"
+    )
+    seeding.add_argument("--count", type=int, default=10000)
+    seeding.add_argument("--prefix", default="load")
+    seeding.add_argument("--password", default="load-password")
+    seeding.add_argument("--batch-size", type=int, default=import_config.batch_size)
+    seeding.add_argument(
+        "--create-tables",
+        action="store_true",
+        help=f"create missing tables first (sqlite stand-in), database: {pg_config.database}",
+    )
+    seeding.set_defaults(handler=seed_users)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import logging
 import os
 from typing import NamedTuple, Optional
 
@@ -9,16 +10,84 @@ class PostgresConfig(NamedTuple):
     port: Optional[str] = os.getenv("POSTGRES_PORT", default="32768")
     database: Optional[str] = os.getenv("POSTGRES_DATABASE")
     schema: Optional[str] = os.getenv("POSTGRES_SCHEMA")
-    driver: Optional[str] = "postgresql+asyncpg"
+    # "sqlite+aiosqlite": local stand-in (load tests), 'database' is the file path
+    driver: Optional[str] = os.getenv("POSTGRES_DRIVER", default="postgresql+asyncpg")
     app_name: Optional[str] = os.getenv("POSTGRES_APP_NAME")
     timeout: Optional[int] = int(os.getenv("POSTGRES_TIMEOUT", default=3))
+    # "sqlalchemy" or "asyncpg" (AsyncpgAuthDao, bypasses the ORM)
+    dao: str = os.getenv("POSTGRES_DAO", default="sqlalchemy")
+    # connection pool
+    pool_size: int = int(os.getenv("POSTGRES_POOL_SIZE", default=5))
+    max_overflow: int = int(os.getenv("POSTGRES_MAX_OVERFLOW", default=10))
+    pool_recycle: int = int(os.getenv("POSTGRES_POOL_RECYCLE", default=1800))
+    pool_timeout: float = float(os.getenv("POSTGRES_POOL_TIMEOUT", default=3))
+    # "true": test every connection on checkout (an extra round trip),
+    # "false": rely on pool_recycle and retries of the DAO on a dropped connection
+    pool_pre_ping: bool = os.getenv("POSTGRES_POOL_PRE_PING", default="true").lower() == "true"
+    # connections opened at startup, pool_size if unset
+    pool_warm_up: Optional[str] = os.getenv("POSTGRES_POOL_WARM_UP")
+    # transaction pooling (PgBouncer) does not support prepared statements cache
+    pgbouncer: bool = os.getenv("POSTGRES_PGBOUNCER", default="false").lower() == "true"
+    # read replicas, comma separated "host[:port]"
+    replica_hosts: Optional[str] = os.getenv("POSTGRES_REPLICA_HOSTS")
+    # time (seconds) users written by this process are read from the primary
+    replica_lag_window: float = float(os.getenv("POSTGRES_REPLICA_LAG_WINDOW", default=5))
+    replica_check_interval: float = float(os.getenv("POSTGRES_REPLICA_CHECK_INTERVAL", default=5))
+    replica_max_lag: float = float(os.getenv("POSTGRES_REPLICA_MAX_LAG", default=10))
+    # repeat the user id and password hash lookups that found nothing on a
+    # replica on the primary too; credentials lookups (logins) always are, so
+    # users registered lately through other pods can log in
+    replica_miss_fallback: bool = (
+        os.getenv("POSTGRES_REPLICA_MISS_FALLBACK", default="false").lower() == "true"
+    )
+    # coalesce concurrent email lookups arriving within the window, off if unset
+    coalesce_window_ms: Optional[str] = os.getenv("POSTGRES_COALESCE_WINDOW_MS")
+    # time (seconds) a sign-up idempotency key is kept
+    idempotency_ttl: int = int(os.getenv("POSTGRES_IDEMPOTENCY_TTL", default=86400))
+    # time (seconds) between deletions of expired idempotency keys
+    idempotency_cleanup_interval: float = float(
+        os.getenv("POSTGRES_IDEMPOTENCY_CLEANUP_INTERVAL", default=3600)
+    )
+
+    @property
+    def coalesce_window(self) -> Optional[float]:
+        if self.coalesce_window_ms is None:
+            return None
+        return float(self.coalesce_window_ms) / 1000
+
+    @property
+    def warm_up_connections(self) -> int:
+        if self.pool_warm_up is None:
+            return self.pool_size
+        return min(int(self.pool_warm_up), self.pool_size + self.max_overflow)
+
+    @property
+    def replicas(self) -> list["PostgresConfig"]:
+        """Same settings for every replica host."""
+        configs = []
+        for address in (self.replica_hosts or "").split(","):
+            if address := address.strip():
+                host, _, port = address.partition(":")
+                configs.append(self._replace(host=host, port=port or self.port, replica_hosts=None))
+        return configs
+
+    @property
+    def dsn(self):
+        """Connection string for asyncpg."""
+        return f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.driver.startswith("sqlite")
 
     @property
     def url(self):
+        if self.is_sqlite:
+            return f"{self.driver}:///{self.database}"
         return f"{self.driver}://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
 
     def __str__(self):
-        excluded_attr = ("count", "index", "url", "password")
+        excluded_attr = ("count", "index", "url", "dsn", "password", "replicas", "is_sqlite")
         attrs = [
             f"{attr}={getattr(self, attr)}"
             for attr in dir(self)
@@ -32,10 +101,134 @@ class JWTConfig(NamedTuple):
     key: Optional[str] = os.getenv("JWT_KEY")
     issuer: Optional[str] = os.getenv("JWT_ISSUER")
     expire_min: Optional[int] = int(os.getenv("JWT_EXPIRE_MIN", default=60))
+    # asymmetric signing keys (see security.SigningKeys), replace 'key' if set
+    keys_dir: Optional[str] = os.getenv("JWT_KEYS_DIR")
+    kid: Optional[str] = os.getenv("JWT_KID")
+    jwks_max_age: int = int(os.getenv("JWT_JWKS_MAX_AGE", default=3600))
+    # verified tokens cache, disabled if size is 0
+    cache_size: int = int(os.getenv("JWT_CACHE_SIZE", default=10000))
+    cache_ttl: int = int(os.getenv("JWT_CACHE_TTL", default=300))
+    # time (seconds) a token revoked through another pod may still be accepted
+    revocation_sync_interval: float = float(os.getenv("JWT_REVOCATION_SYNC_INTERVAL", default=1))
+
+    def __str__(self):
+        return (
+            f"JWTConfig(algorithm={self.algorithm}, issuer={self.issuer}, "
+            f"expire_min={self.expire_min}, keys_dir={self.keys_dir}, kid={self.kid})"
+        )
+
+
+class Argon2Config(NamedTuple):
+    workers: int = int(os.getenv("ARGON2_WORKERS", default=1))
+    # hashing cost, see 'python -m app.auth.cli calibrate'
+    memory_cost: int = int(os.getenv("ARGON2_MEMORY_COST", default=32768))  # KiB
+    time_cost: int = int(os.getenv("ARGON2_TIME_COST", default=3))
+    parallelism: int = int(os.getenv("ARGON2_PARALLELISM", default=4))
+    # admission control: concurrent hashes must fit the memory budget
+    memory_budget_mib: int = int(os.getenv("ARGON2_MEMORY_BUDGET_MIB", default=64))
+    max_queue: int = int(os.getenv("ARGON2_MAX_QUEUE", default=32))
+    max_wait: float = float(os.getenv("ARGON2_MAX_WAIT", default=2))
+
+
+class ImportConfig(NamedTuple):
+    token: Optional[str] = os.getenv("IMPORT_TOKEN")
+    batch_size: int = int(os.getenv("IMPORT_BATCH_SIZE", default=1000))
+    max_errors: int = int(os.getenv("IMPORT_MAX_ERRORS", default=1000))
 
     def __str__(self):
-        return f"JWTConfig(algorithm={self.algorithm}, issuer={self.issuer}, expire_min={self.expire_min})"
+        return f"ImportConfig(batch_size={self.batch_size}, max_errors={self.max_errors})"
+
+
+class BloomConfig(NamedTuple):
+    enabled: bool = os.getenv("BLOOM_ENABLED", default="false").lower() == "true"
+    capacity: int = int(os.getenv("BLOOM_CAPACITY", default=1_000_000))
+    error_rate: float = float(os.getenv("BLOOM_ERROR_RATE", default=0.01))
+    rebuild_interval: float = float(os.getenv("BLOOM_REBUILD_INTERVAL", default=300))
+
+
+class HealthConfig(NamedTuple):
+    check_interval: float = float(os.getenv("HEALTH_CHECK_INTERVAL", default=2))
+    db_timeout: float = float(os.getenv("HEALTH_DB_TIMEOUT", default=1))
+    # not ready while more requests wait for a database connection
+    max_pool_waiting: int = int(os.getenv("HEALTH_MAX_POOL_WAITING", default=10))
+
+
+class ThrottleConfig(NamedTuple):
+    enabled: bool = os.getenv("THROTTLE_ENABLED", default="true").lower() == "true"
+    window: float = float(os.getenv("THROTTLE_WINDOW", default=60))
+    # attempts per window
+    login_email_limit: int = int(os.getenv("THROTTLE_LOGIN_EMAIL_LIMIT", default=10))
+    login_client_limit: int = int(os.getenv("THROTTLE_LOGIN_CLIENT_LIMIT", default=100))
+    sign_up_email_limit: int = int(os.getenv("THROTTLE_SIGN_UP_EMAIL_LIMIT", default=10))
+    sign_up_client_limit: int = int(os.getenv("THROTTLE_SIGN_UP_CLIENT_LIMIT", default=20))
+    # "true": the client is the last "X-Forwarded-For" address, the one the ingress saw
+    trust_forwarded: bool = (
+        os.getenv("THROTTLE_TRUST_FORWARDED", default="false").lower() == "true"
+    )
+    # counters shared by every replica, in-process if unset, e.g. "redis://redis:6379/0"
+    redis_url: Optional[str] = os.getenv("THROTTLE_REDIS_URL")
+
+
+class GrpcConfig(NamedTuple):
+    host: str = os.getenv("GRPC_HOST", default="0.0.0.0")
+    port: int = int(os.getenv("GRPC_PORT", default=50051))
+    # "true": served by every app worker next to the REST API, the workers
+    # share the port; otherwise 'python -m app.auth.grpc_server' serves it
+    in_process: bool = os.getenv("GRPC_IN_PROCESS", default="false").lower() == "true"
+    max_concurrent_rpcs: Optional[str] = os.getenv("GRPC_MAX_CONCURRENT_RPCS")
+    # time (seconds) running calls have to finish on shutdown
+    grace: float = float(os.getenv("GRPC_GRACE", default=5))
+    # "true": the client is the last "x-forwarded-for" metadata address; only
+    # behind a gateway that overwrites the metadata, any caller can set it
+    trust_forwarded: bool = (
+        os.getenv("GRPC_TRUST_FORWARDED", default="false").lower() == "true"
+    )
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+class LogConfig(NamedTuple):
+    level: int = logging.getLevelName(os.getenv("LOG_LEVEL", default="INFO").upper())
+    # "true": one JSON object per line
+    json: bool = os.getenv("LOG_JSON", default="false").lower() == "true"
+    # noisy loggers below WARNING, comma separated "name=records per second"
+    sampling_rates: str = os.getenv(
+        "LOG_SAMPLING", default="sqlalchemy.engine=10,sqlalchemy.pool=10,app.utils=10"
+    )
+    queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", default=10000))
+
+    @property
+    def sampling(self) -> dict[str, float]:
+        rates = {}
+        for entry in filter(None, self.sampling_rates.split(",")):
+            name, rate = entry.split("=")
+            rates[name.strip()] = float(rate)
+        return rates
+
+
+class ServerConfig(NamedTuple):
+    host: str = os.getenv("SERVER_HOST", default="0.0.0.0")
+    port: int = int(os.getenv("SERVER_PORT", default=8080))
+    # processes serving requests, each with its own connection pool and
+    # hashing workers, so size it with the CPU limit and POSTGRES_POOL_SIZE
+    workers: int = int(os.getenv("SERVER_WORKERS", default=1))
+    # import the app once before forking the workers
+    preload: bool = os.getenv("SERVER_PRELOAD", default="true").lower() == "true"
+    timeout: int = int(os.getenv("SERVER_TIMEOUT", default=30))
+    graceful_timeout: int = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", default=30))
+    # time (seconds) between metrics snapshots of the workers
+    metrics_interval: float = float(os.getenv("SERVER_METRICS_INTERVAL", default=5))
 
 
 pg_config = PostgresConfig()
 jwt_config = JWTConfig()
+argon2_config = Argon2Config()
+import_config = ImportConfig()
+bloom_config = BloomConfig()
+health_config = HealthConfig()
+throttle_config = ThrottleConfig()
+log_config = LogConfig()
+grpc_config = GrpcConfig()
+server_config = ServerConfig()
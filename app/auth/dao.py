@@ -1,29 +1,199 @@
-from typing import Optional
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Hashable, Optional, TypeVar
 
-from sqlalchemy import select
+import sqlalchemy as sa
+from sqlalchemy import select, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.auth.orm import users_table, pwdhashes_table
+from app.auth.loader import BatchLoader
+from app.auth.models import Credentials
+from app.auth.orm import (
+    users_table, pwdhashes_table, idempotency_keys_table, revoked_tokens_table,
+)
+from app.auth.pool import warm_up
+from app.auth.replicas import ReplicaSet
+from app.metrics import registry
+from app.utils import Retry, CircuitBreaker
+
+# shared by every database operation, fails fast while the database is down
+db_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=5)
+no_retry_on_error = (DBAPIError, IntegrityError)
+
+# reads are idempotent, retry them promptly
+read_retry = Retry(
+    attempts=3, delay=0.05, backoff=2, max_delay=0.5, jitter=True, deadline=2,
+    breaker=db_breaker,
+)
+write_retry = Retry(
+    attempts=2, delay=0.1, backoff=2, max_delay=1, jitter=True, deadline=3,
+    exclude_exc=no_retry_on_error, breaker=db_breaker,
+)
+
+# replication lag in seconds, 0 on the primary or a replica that replayed all it received
+REPLICA_LAG_QUERY = sa.text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery()"
+    " OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)"
+    " END"
+)
+
+R = TypeVar("R")
+
+# per attempt, a read served by a replica includes the fallback to the primary
+query_seconds = registry.histogram("auth_db_query_seconds", "AuthDao query time.", ["query"])
 
 
 class AuthDao:
-    def __init__(self, sessionmaker: async_sessionmaker[AsyncSession]):
+    """Auth storage access.
+
+    Args:
+        sessionmaker: session factory bound to the database engine
+        coalesce_window: if set, concurrent 'get_user_id'/'get_credentials'
+            calls made within this time (seconds) are coalesced into one query
+        idempotency_ttl: time (seconds) a sign-up idempotency key is honoured
+        replicas: session factories of read replicas, lookups go there unless
+            the user was written lately
+    """
+
+    # raised by a write the database rejected, e.g. a value too long for its column
+    write_errors: tuple[type[Exception], ...] = (DBAPIError,)
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        coalesce_window: Optional[float] = None,
+        idempotency_ttl: float = 86400,
+        replicas: Optional[ReplicaSet] = None,
+    ):
         self.pool = sessionmaker
+        self.idempotency_ttl = idempotency_ttl
+        self.replicas = replicas
+        self.loaders: dict[str, BatchLoader] = {}
+        if coalesce_window is not None:
+            self.loaders = {
+                "get_user_id": BatchLoader(self.get_user_ids, coalesce_window),
+                "get_credentials": BatchLoader(
+                    self.get_many_credentials, coalesce_window
+                ),
+            }
+
+    def loader_stats(self) -> dict[str, dict]:
+        return {name: loader.stats() for name, loader in self.loaders.items()}
+
+    def replica_stats(self) -> dict:
+        return self.replicas.stats() if self.replicas else {}
+
+    async def startup(self, connections: int = 0):
+        """Open 'connections' ahead of the first requests."""
+        if self.replicas:
+            await self.replicas.start(self.replica_lag)
+            # a replica failing here is marked down by its health check
+            await asyncio.gather(
+                *(warm_up(r.pool.kw["bind"], connections) for r in self.replicas.replicas),
+                return_exceptions=True,
+            )
+        await warm_up(self.pool.kw["bind"], connections)
+
+    async def shutdown(self):
+        await self.pool.kw["bind"].dispose()
+        if self.replicas:
+            await self.replicas.stop()
+            for replica in self.replicas.replicas:
+                await replica.pool.kw["bind"].dispose()
+
+    async def ping(self):
+        """Round trip to the primary, raises if it is not reachable."""
+        async with self.pool() as session:
+            await session.execute(sa.text("SELECT 1"))
+
+    def pool_stats(self) -> dict:
+        """Connection pool usage, empty if the pool does not record it."""
+        pool = self.pool.kw["bind"].pool
+        return pool.stats() if hasattr(pool, "stats") else {}
+
+    @staticmethod
+    async def replica_lag(pool: async_sessionmaker[AsyncSession]) -> float:
+        async with pool() as session:
+            if session.bind.dialect.name != "postgresql":
+                await session.execute(sa.text("SELECT 1"))
+                return 0.0
+            return float((await session.execute(REPLICA_LAG_QUERY)).scalar())
+
+    @staticmethod
+    def _is_disconnect(e: Exception) -> bool:
+        return isinstance(e, (OSError, asyncio.TimeoutError)) or getattr(
+            e, "connection_invalidated", False
+        )
+
+    async def _read(
+        self,
+        query: Callable[..., Awaitable[R]],
+        keys: list[Hashable],
+        fallback: bool = False,
+        must_find: bool = False,
+    ) -> R:
+        """Run 'query(pool, keys)' on a read replica, or on the primary while
+        some of 'keys' (emails, user ids) may not be replicated yet or the
+        replica read failed.
+
+        With 'fallback' a replica result missing some keys (None, or a dict
+        without them) is completed from the primary if the replica set has
+        'miss_fallback' on. With 'must_find' it always is: keys are only
+        remembered as written by the process writing them, a login served by
+        another worker or pod within the replica lag must not fail on a miss.
+        """
+        replica = self.replicas.pick(*keys) if self.replicas else None
+        if replica is None:
+            return await query(self.pool, keys)
+        try:
+            result = await query(replica.pool, keys)
+        except Exception as e:
+            # served by the primary, the failure counts for the replica breaker only
+            self.replicas.read_failed(replica, e, self._is_disconnect(e))
+            return await query(self.pool, keys)
+        self.replicas.read_succeeded(replica)
+        if not (must_find or (fallback and self.replicas.miss_fallback)):
+            return result
+        if isinstance(result, dict):
+            if missing := [key for key in keys if key not in result]:
+                self.replicas.fallbacks += 1
+                result.update(await query(self.pool, missing))
+        elif result is None:
+            self.replicas.fallbacks += 1
+            result = await query(self.pool, keys)
+        return result
 
+    def _written(self, *keys: Hashable):
+        if self.replicas:
+            self.replicas.written(*keys)
+
+    @read_retry
+    @query_seconds.timed("get_pwdhash_value")
     async def get_pwdhash_value(self, user_id: int) -> str:
         expr = select(pwdhashes_table.c.value).where(
             pwdhashes_table.c.user_id == user_id
         )
-        async with self.pool() as session:
-            user_coro = await session.execute(expr)
-            return user_coro.scalar()  # type: ignore
 
+        async def query(pool, _):
+            async with pool() as session:
+                user_coro = await session.execute(expr)
+                return user_coro.scalar()  # type: ignore
+
+        return await self._read(query, [user_id], fallback=True)
+
+    @write_retry
+    @query_seconds.timed("add_one")
     async def add_one(self, item) -> int:
         async with self.pool() as session:
             session.add(item)
             await session.commit()
             return item.id
 
+    @write_retry
+    @query_seconds.timed("add_all")
     async def add_all(self, items: list) -> list:
         async with self.pool() as session:
             session.add_all(items)
@@ -31,7 +201,307 @@ class AuthDao:
             return items
 
     async def get_user_id(self, email: str) -> Optional[int]:
+        if "get_user_id" in self.loaders:
+            return await self.loaders["get_user_id"].load(email)
+        return await self._get_user_id(email)
+
+    @read_retry
+    @query_seconds.timed("get_user_id")
+    async def _get_user_id(self, email: str) -> Optional[int]:
         expr = select(users_table.c.id).where(users_table.c.email == email)
+
+        async def query(pool, _):
+            async with pool() as session:
+                user_id_coro = await session.execute(expr)
+                return user_id_coro.scalar()
+
+        return await self._read(query, [email], fallback=True)
+
+    async def get_credentials(self, email: str) -> Optional[Credentials]:
+        """Fetch user id and password hash by email in a single round trip."""
+        if "get_credentials" in self.loaders:
+            return await self.loaders["get_credentials"].load(email)
+        return await self._get_credentials(email)
+
+    @read_retry
+    @query_seconds.timed("get_credentials")
+    async def _get_credentials(self, email: str) -> Optional[Credentials]:
+        expr = (
+            select(users_table.c.id, pwdhashes_table.c.value)
+            .join(pwdhashes_table, pwdhashes_table.c.user_id == users_table.c.id)
+            .where(users_table.c.email == email)
+        )
+
+        async def query(pool, _):
+            async with pool() as session:
+                row = (await session.execute(expr)).first()
+                return Credentials(*row) if row else None
+
+        return await self._read(query, [email], must_find=True)
+
+    async def iter_users(self, batch_size: int = 10000) -> AsyncIterator[tuple[int, str]]:
+        """Stream the (id, email) of every user without loading the whole table."""
+        expr = select(users_table.c.id, users_table.c.email).execution_options(
+            yield_per=batch_size
+        )
+        replica = self.replicas.pick() if self.replicas else None
+        async with (replica.pool if replica else self.pool)() as session:
+            async for user_id, email in await session.stream(expr):
+                yield user_id, email
+
+    @read_retry
+    @query_seconds.timed("get_users_after")
+    async def get_users_after(self, user_id: int) -> list[tuple[int, str]]:
+        """(id, email) of the users with a greater id, read from the primary."""
+        expr = select(users_table.c.id, users_table.c.email).where(users_table.c.id > user_id)
+        async with self.pool() as session:
+            return [tuple(row) for row in await session.execute(expr)]
+
+    @read_retry
+    @query_seconds.timed("get_user_ids")
+    async def get_user_ids(self, emails: list[str]) -> dict[str, int]:
+        async def query(pool, emails):
+            async with pool() as session:
+                expr = select(users_table.c.email, users_table.c.id).where(
+                    self._email_in(session, emails)
+                )
+                return dict((await session.execute(expr)).all())
+
+        return await self._read(query, emails, fallback=True)
+
+    @read_retry
+    @query_seconds.timed("get_many_credentials")
+    async def get_many_credentials(self, emails: list[str]) -> dict[str, Credentials]:
+        async def query(pool, emails):
+            async with pool() as session:
+                expr = (
+                    select(users_table.c.email, users_table.c.id, pwdhashes_table.c.value)
+                    .join(pwdhashes_table, pwdhashes_table.c.user_id == users_table.c.id)
+                    .where(self._email_in(session, emails))
+                )
+                rows = await session.execute(expr)
+                return {email: Credentials(user_id, value) for email, user_id, value in rows}
+
+        return await self._read(query, emails, must_find=True)
+
+    @staticmethod
+    def _email_in(session: AsyncSession, emails: list[str]):
+        if session.bind.dialect.name == "postgresql":
+            # a single array parameter keeps one prepared statement for any batch size
+            return users_table.c.email == sa.any_(
+                sa.bindparam("emails", emails, type_=postgresql.ARRAY(sa.String))
+            )
+        return users_table.c.email.in_(emails)
+
+    @write_retry
+    @query_seconds.timed("update_pwdhash")
+    async def update_pwdhash(self, user_id: int, value: str):
+        expr = (
+            pwdhashes_table.update()
+            .where(pwdhashes_table.c.user_id == user_id)
+            .values(value=value)
+        )
+        async with self.pool() as session:
+            await session.execute(expr)
+            await session.commit()
+        self._written(user_id)
+
+    @read_retry
+    @query_seconds.timed("get_idempotent_result")
+    async def get_idempotent_result(self, key: str) -> Optional[str]:
+        """Email registered by the sign-up made with the given idempotency key."""
+        expire = datetime.now(timezone.utc) - timedelta(seconds=self.idempotency_ttl)
+        expr = (
+            select(users_table.c.email)
+            .join(idempotency_keys_table)
+            .where(idempotency_keys_table.c.key == key)
+            .where(idempotency_keys_table.c.created_at > expire)
+        )
+        async with self.pool() as session:
+            return (await session.execute(expr)).scalar()
+
+    @write_retry
+    @query_seconds.timed("create_user")
+    async def create_user(
+        self, email: str, pwdhash: str, idempotency_key: Optional[str] = None
+    ) -> Optional[int]:
+        """Atomically register a user with its password hash.
+
+        Returns new user id or None if the email is already registered.
+        The idempotency key, if given, is stored in the same transaction.
+        A retry of a call whose commit succeeded but whose reply was lost
+        finds the user registered with 'pwdhash' and returns its id.
+        """
+        async with self.pool() as session:
+            if session.bind.dialect.name == "postgresql":
+                expr = self._create_user_expr(email, pwdhash)
+                user_id = (await session.execute(expr)).scalar()
+            else:
+                user_id = await self._create_user_fallback(session, email, pwdhash)
+            if user_id is None:
+                # the key of a retried call was stored by the committed attempt
+                user_id = (await self._registered_with(session, {email: pwdhash})).get(email)
+            elif idempotency_key is not None:
+                expr = self._idempotency_key_expr(session, idempotency_key, user_id)
+                if (await session.execute(expr)).scalar() is None:
+                    # a concurrent sign-up holds the live key, it is not ours
+                    await session.rollback()
+                    return None
+            await session.commit()
+        if user_id is not None:
+            self._written(email, user_id)
+        return user_id
+
+    def _idempotency_key_expr(self, session: AsyncSession, key: str, user_id: int):
+        dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+        expr = dialect.insert(idempotency_keys_table).values(
+            key=key, user_id=user_id, created_at=sa.func.now()
+        )
+        # an expired key may be reused, a live one returns no row
+        expire = datetime.now(timezone.utc) - timedelta(seconds=self.idempotency_ttl)
+        return expr.on_conflict_do_update(
+            index_elements=[idempotency_keys_table.c.key],
+            set_={"user_id": user_id, "created_at": sa.func.now()},
+            where=idempotency_keys_table.c.created_at <= expire,
+        ).returning(idempotency_keys_table.c.user_id)
+
+    @staticmethod
+    def _create_user_expr(email: str, pwdhash: str):
+        new_user = (
+            postgresql.insert(users_table)
+            .values(email=email)
+            .on_conflict_do_nothing(index_elements=[users_table.c.email])
+            .returning(users_table.c.id)
+            .cte("new_user")
+        )
+        return (
+            pwdhashes_table.insert()
+            .from_select(
+                ["user_id", "value"], select(new_user.c.id, literal(pwdhash))
+            )
+            .returning(pwdhashes_table.c.user_id)
+        )
+
+    @staticmethod
+    async def _create_user_fallback(
+        session: AsyncSession, email: str, pwdhash: str
+    ) -> Optional[int]:
+        # backends without data-modifying CTEs (sqlite): same semantics,
+        # two statements in one transaction
+        expr = (
+            sqlite.insert(users_table)
+            .values(email=email)
+            .on_conflict_do_nothing(index_elements=[users_table.c.email])
+            .returning(users_table.c.id)
+        )
+        user_id = (await session.execute(expr)).scalar()
+        if user_id is not None:
+            await session.execute(
+                pwdhashes_table.insert().values(user_id=user_id, value=pwdhash)
+            )
+        return user_id
+
+    @write_retry
+    @query_seconds.timed("create_users")
+    async def create_users(self, users: list[tuple[str, str]]) -> dict[str, int]:
+        """Register a batch of (email, password hash) pairs.
+
+        Already registered emails are skipped. Returns ids of the created
+        users by email.
+        """
+        async with self.pool() as session:
+            dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+            expr = (
+                dialect.insert(users_table)
+                .on_conflict_do_nothing(index_elements=[users_table.c.email])
+                .returning(users_table.c.id, users_table.c.email)
+            )
+            rows = await session.execute(expr, [{"email": email} for email, _ in users])
+            created = {email: user_id for user_id, email in rows}
+            # the first occurrence of an email repeated in the batch wins
+            pending = dict(created)
+            hashes = [
+                {"user_id": pending.pop(email), "value": value}
+                for email, value in users
+                if email in pending
+            ]
+            if hashes:
+                await session.execute(pwdhashes_table.insert(), hashes)
+            skipped: dict[str, str] = {}
+            for email, value in users:
+                if email not in created:
+                    skipped.setdefault(email, value)
+            if skipped:
+                created.update(await self._registered_with(session, skipped))
+            await session.commit()
+        self._written(*created.keys(), *created.values())
+        return created
+
+    async def _registered_with(
+        self, session: AsyncSession, users: dict[str, str]
+    ) -> dict[str, int]:
+        """Ids of the users of 'users' (email: password hash) stored with that hash.
+
+        Hashes are salted, the same hash was stored by an earlier attempt of
+        the same registration, not by another sign-up.
+        """
+        expr = (
+            select(users_table.c.email, users_table.c.id, pwdhashes_table.c.value)
+            .join(pwdhashes_table, pwdhashes_table.c.user_id == users_table.c.id)
+            .where(self._email_in(session, list(users)))
+        )
+        rows = await session.execute(expr)
+        return {email: user_id for email, user_id, value in rows if users[email] == value}
+
+    @write_retry
+    @query_seconds.timed("revoke_token")
+    async def revoke_token(self, jti: str, expires_at: datetime):
+        async with self.pool() as session:
+            dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+            expr = (
+                dialect.insert(revoked_tokens_table)
+                .values(jti=jti, expires_at=expires_at)
+                .on_conflict_do_nothing(index_elements=[revoked_tokens_table.c.jti])
+            )
+            await session.execute(expr)
+            await session.commit()
+
+    # no retry nor breaker, the periodic sync is the retry and its failures
+    # must not open the breaker of the requests
+    @query_seconds.timed("get_revocations")
+    async def get_revocations(
+        self, since: Optional[datetime] = None
+    ) -> list[tuple[str, datetime, datetime]]:
+        """(jti, expires_at, revoked_at) of tokens revoked after 'since', not expired yet.
+
+        Read from the primary, a replica lagging behind would delay revocations.
+        """
+        table = revoked_tokens_table
+        expr = select(table.c.jti, table.c.expires_at, table.c.revoked_at).where(
+            table.c.expires_at > datetime.now(timezone.utc)
+        )
+        if since is not None:
+            expr = expr.where(table.c.revoked_at > since)
+        async with self.pool() as session:
+            return [tuple(row) for row in await session.execute(expr)]
+
+    @query_seconds.timed("delete_expired_revocations")
+    async def delete_expired_revocations(self) -> int:
+        expr = revoked_tokens_table.delete().where(
+            revoked_tokens_table.c.expires_at <= datetime.now(timezone.utc)
+        )
         async with self.pool() as session:
-            user_id_coro = await session.execute(expr)
-            return user_id_coro.scalar()
+            result = await session.execute(expr)
+            await session.commit()
+        return result.rowcount
+
+    @query_seconds.timed("delete_expired_idempotency_keys")
+    async def delete_expired_idempotency_keys(self) -> int:
+        expire = datetime.now(timezone.utc) - timedelta(seconds=self.idempotency_ttl)
+        expr = idempotency_keys_table.delete().where(
+            idempotency_keys_table.c.created_at <= expire
+        )
+        async with self.pool() as session:
+            result = await session.execute(expr)
+            await session.commit()
+        return result.rowcount
@@ -1,34 +1,237 @@
+import hashlib
+import json
 from functools import lru_cache
+from typing import Optional
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 
-from app.auth.config import pg_config, jwt_config
+from app.auth.admission import AdmissionController
+from app.auth.bloom import EmailFilter
+from app.auth.cache import TTLCache
+from app.auth.cleanup import IdempotencyKeysCleanup
+from app.auth.config import (
+    PostgresConfig, pg_config, jwt_config, argon2_config, bloom_config, health_config,
+    throttle_config,
+)
 from app.auth.dao import AuthDao
+from app.auth.health import HealthMonitor
 from app.auth.orm import register_mapping
-from app.auth.security import JWTToken, BaseAuth, Argon2Auth
+from app.auth.pgdao import AsyncpgAuthDao, PgPool
+from app.auth.pool import InstrumentedPool
+from app.auth.replicas import ReplicaSet
+from app.auth.revocation import TokenRevocations
+from app.auth.security import JWTToken, BaseAuth, AsyncArgon2Auth, CachedJWTToken
+from app.auth.throttle import (
+    LocalWindowCounters, RedisWindowCounters, SlidingWindowLimiter, Throttle, WindowCounters,
+)
 
 
 @lru_cache(maxsize=1)
 def get_auth_provider() -> BaseAuth:
-    return Argon2Auth()
+    admission = AdmissionController(
+        memory_budget=argon2_config.memory_budget_mib * 2**20,
+        operation_memory=argon2_config.memory_cost * 2**10,
+        max_queue=argon2_config.max_queue,
+        max_wait=argon2_config.max_wait,
+    )
+    return AsyncArgon2Auth(workers=argon2_config.workers, admission=admission)
+
+
+@lru_cache(maxsize=1)
+def get_token_revocations() -> TokenRevocations:
+    return TokenRevocations(
+        get_dao_provider(), sync_interval=jwt_config.revocation_sync_interval
+    )
+
+
+@lru_cache(maxsize=1)
+def get_idempotency_cleanup() -> IdempotencyKeysCleanup:
+    return IdempotencyKeysCleanup(
+        get_dao_provider(), interval=pg_config.idempotency_cleanup_interval
+    )
 
 
 @lru_cache(maxsize=1)
 def get_token_provider() -> JWTToken:
-    return JWTToken(config=jwt_config)
+    revoked = get_token_revocations()
+    if not jwt_config.cache_size:
+        return JWTToken(config=jwt_config, revoked=revoked)
+    cache = TTLCache(maxsize=jwt_config.cache_size, ttl=jwt_config.cache_ttl)
+    return CachedJWTToken(config=jwt_config, cache=cache, revoked=revoked)
 
 
 @lru_cache(maxsize=1)
-def get_dao_provider() -> AuthDao:
+def get_jwks() -> tuple[bytes, str]:
+    """Serialized JWK set with its ETag."""
+    body = json.dumps(get_token_provider().jwks()).encode()
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def create_sqlite_engine(config: PostgresConfig) -> AsyncEngine:
+    """Local stand-in for Postgres, the schema is the same file attached by name."""
+    engine = create_async_engine(
+        config.url,
+        connect_args={"timeout": config.timeout},
+        poolclass=InstrumentedPool,
+        pool_size=config.pool_size,
+        max_overflow=config.max_overflow,
+        pool_timeout=config.pool_timeout,
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def attach_schema(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"attach database '{config.database}' as {config.schema}")
+        # readers do not wait for the writer
+        cursor.execute(f"pragma {config.schema}.journal_mode=wal")
+        cursor.close()
+
+    return engine
+
+
+def create_engine(config: PostgresConfig) -> AsyncEngine:
+    if config.is_sqlite:
+        return create_sqlite_engine(config)
     options = {
-        "timeout": pg_config.timeout,
-        "server_settings": {"application_name": pg_config.app_name},
+        "timeout": config.timeout,
+        "server_settings": {"application_name": config.app_name},
     }
-    engine = create_async_engine(
-        pg_config.url, connect_args=options, echo=False, pool_pre_ping=True
+    url = config.url
+    if config.pgbouncer:
+        # statements prepared on one server connection are unknown to the next
+        options["statement_cache_size"] = 0
+        url += "?prepared_statement_cache_size=0"
+    return create_async_engine(
+        url,
+        connect_args=options,
+        echo=False,
+        poolclass=InstrumentedPool,
+        pool_size=config.pool_size,
+        max_overflow=config.max_overflow,
+        pool_recycle=config.pool_recycle,
+        pool_timeout=config.pool_timeout,
+        pool_pre_ping=config.pool_pre_ping,
+    )
+
+
+def create_pg_pool(config: PostgresConfig) -> PgPool:
+    return PgPool(
+        config.dsn,
+        max_size=config.pool_size + config.max_overflow,
+        acquire_timeout=config.pool_timeout,
+        max_inactive_lifetime=config.pool_recycle,
+        prepare=not config.pgbouncer,
+        timeout=config.timeout,
+        server_settings={"application_name": config.app_name},
+    )
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> AsyncEngine:
+    return create_engine(pg_config)
+
+
+def replica_set(pools: dict) -> Optional[ReplicaSet]:
+    if not pools:
+        return None
+    return ReplicaSet(
+        pools,
+        lag_window=pg_config.replica_lag_window,
+        check_interval=pg_config.replica_check_interval,
+        max_lag=pg_config.replica_max_lag,
+        miss_fallback=pg_config.replica_miss_fallback,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_dao_provider() -> AuthDao:
+    if pg_config.dao == "asyncpg":
+        replicas = {
+            f"{config.host}:{config.port}": create_pg_pool(config)
+            for config in pg_config.replicas
+        }
+        return AsyncpgAuthDao(
+            create_pg_pool(pg_config),
+            coalesce_window=pg_config.coalesce_window,
+            idempotency_ttl=pg_config.idempotency_ttl,
+            replicas=replica_set(replicas),
+        )
+    replicas = {
+        f"{config.host}:{config.port}": async_sessionmaker(
+            create_engine(config), expire_on_commit=False
+        )
+        for config in pg_config.replicas
+    }
+    pool = async_sessionmaker(get_engine(), expire_on_commit=False)
+    return AuthDao(
+        pool,
+        coalesce_window=pg_config.coalesce_window,
+        idempotency_ttl=pg_config.idempotency_ttl,
+        replicas=replica_set(replicas),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_email_filter() -> Optional[EmailFilter]:
+    if not bloom_config.enabled:
+        return None
+    return EmailFilter(
+        get_dao_provider(),
+        capacity=bloom_config.capacity,
+        error_rate=bloom_config.error_rate,
+        rebuild_interval=bloom_config.rebuild_interval,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_health_monitor() -> HealthMonitor:
+    return HealthMonitor(
+        get_dao_provider(),
+        get_auth_provider(),
+        interval=health_config.check_interval,
+        db_timeout=health_config.db_timeout,
+        max_pool_waiting=health_config.max_pool_waiting,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_redis():
+    from redis.asyncio import Redis
+
+    return Redis.from_url(throttle_config.redis_url)
+
+
+def window_counters(prefix: str) -> WindowCounters:
+    if throttle_config.redis_url is None:
+        return LocalWindowCounters()
+    return RedisWindowCounters(get_redis(), f"auth:throttle:{prefix}", throttle_config.window)
+
+
+def create_throttle(endpoint: str, email_limit: int, client_limit: int) -> Throttle:
+    window = throttle_config.window
+    return Throttle(
+        email=SlidingWindowLimiter(email_limit, window, window_counters(f"{endpoint}:email")),
+        client=SlidingWindowLimiter(client_limit, window, window_counters(f"{endpoint}:client")),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_login_throttle() -> Optional[Throttle]:
+    if not throttle_config.enabled:
+        return None
+    return create_throttle(
+        "login", throttle_config.login_email_limit, throttle_config.login_client_limit
+    )
+
+
+@lru_cache(maxsize=1)
+def get_sign_up_throttle() -> Optional[Throttle]:
+    if not throttle_config.enabled:
+        return None
+    return create_throttle(
+        "sign_up", throttle_config.sign_up_email_limit, throttle_config.sign_up_client_limit
     )
-    pool = async_sessionmaker(engine, expire_on_commit=False)
-    return AuthDao(pool)
 
 
 def map_orm():
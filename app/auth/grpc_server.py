@@ -0,0 +1,310 @@
+"""gRPC interface of the auth service, for gateway-to-service calls.
+
+The same handlers, storage, hashing and tokens as the REST routes, without
+HTTP/1.1 parsing and JSON. Served either by the app workers next to the REST
+API ('GRPC_IN_PROCESS') or by a process of its own.
+
+Usage:
+    python -m app.auth.grpc_server
+"""
+import asyncio
+import functools
+import logging
+import signal
+import time
+import uuid
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import unquote
+
+import grpc
+from pydantic import ValidationError
+
+from app.auth import dependencies as deps
+from app.auth import handlers
+from app.auth.admission import Overloaded
+from app.auth.bloom import EmailFilter
+from app.auth.config import grpc_config
+from app.auth.dao import AuthDao
+from app.auth.proto import auth_pb2, auth_pb2_grpc
+from app.auth.schema import UserCredentials
+from app.auth.security import AuthProvider, TokenProvider
+from app.auth.throttle import Throttle, Throttled
+from app.logger import request_id
+from app.metrics import registry
+from app.utils import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+requests_total = registry.counter(
+    "auth_grpc_requests_total", "gRPC calls.", ["method", "code"]
+)
+request_seconds = registry.histogram(
+    "auth_grpc_request_seconds", "gRPC call time.", ["method"]
+)
+streamed_tokens = registry.counter(
+    "auth_grpc_streamed_tokens_total", "Tokens verified by VerifyTokens calls."
+)
+
+# results are serialized when sent, one instance serves every invalid token
+invalid_token_result = auth_pb2.VerifyResult(valid=False)
+
+
+def metadata_value(context: grpc.aio.ServicerContext, key: str) -> Optional[str]:
+    for item in context.invocation_metadata() or ():
+        if item.key == key:
+            return item.value
+    return None
+
+
+def client_address(
+    context: grpc.aio.ServicerContext, trust_forwarded: bool = False
+) -> Optional[str]:
+    if trust_forwarded:
+        # the gateway replaces the metadata with the address of its client
+        if forwarded := metadata_value(context, "x-forwarded-for"):
+            return forwarded.rsplit(",", 1)[-1].strip()
+    # "ipv4:10.0.0.1:5123", "ipv6:%5B::1%5D:5123"
+    kind, _, address = unquote(context.peer()).partition(":")
+    if kind not in ("ipv4", "ipv6"):
+        return None
+    return address.rsplit(":", 1)[0].strip("[]")
+
+
+def rpc(method):
+    """Sets the request id of the call, counts and times it by status code."""
+
+    @functools.wraps(method)
+    async def wrapper(self, request, context: grpc.aio.ServicerContext):
+        token = request_id.set(metadata_value(context, "x-request-id") or uuid.uuid4().hex)
+        code = grpc.StatusCode.OK
+        start_time = time.perf_counter()
+        try:
+            return await method(self, request, context)
+        except grpc.aio.AbortError:
+            code = context.code() or grpc.StatusCode.UNKNOWN
+            raise
+        except asyncio.CancelledError:
+            code = grpc.StatusCode.CANCELLED
+            raise
+        except Exception:
+            code = grpc.StatusCode.UNKNOWN
+            raise
+        finally:
+            requests_total.inc(method.__name__, code.name)
+            request_seconds.observe(time.perf_counter() - start_time, method.__name__)
+            request_id.reset(token)
+
+    return wrapper
+
+
+def rpc_stream(method):
+    """Like 'rpc', for a call streaming its responses; timed until the stream ends."""
+
+    @functools.wraps(method)
+    async def wrapper(self, request_iterator, context: grpc.aio.ServicerContext):
+        token = request_id.set(metadata_value(context, "x-request-id") or uuid.uuid4().hex)
+        code = grpc.StatusCode.OK
+        start_time = time.perf_counter()
+        try:
+            async for response in method(self, request_iterator, context):
+                yield response
+        except grpc.aio.AbortError:
+            code = context.code() or grpc.StatusCode.UNKNOWN
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # GeneratorExit: the client went away and the stream was closed
+            code = grpc.StatusCode.CANCELLED
+            raise
+        except Exception:
+            code = grpc.StatusCode.UNKNOWN
+            raise
+        finally:
+            requests_total.inc(method.__name__, code.name)
+            request_seconds.observe(time.perf_counter() - start_time, method.__name__)
+            request_id.reset(token)
+
+    return wrapper
+
+
+def claims_message(claims: dict) -> auth_pb2.Claims:
+    return auth_pb2.Claims(
+        email=claims.get("email") or "",
+        exp=claims.get("exp") or 0,
+        iat=claims.get("iat") or 0,
+        iss=claims.get("iss") or "",
+        jti=claims.get("jti") or "",
+    )
+
+
+async def abort_unavailable(context: grpc.aio.ServicerContext, e: Overloaded | CircuitOpen):
+    await context.abort(
+        grpc.StatusCode.UNAVAILABLE,
+        "Service overloaded" if isinstance(e, Overloaded) else "Service unavailable",
+        (("retry-after", str(max(round(e.retry_after), 1))),),
+    )
+
+
+class AuthServicer(auth_pb2_grpc.AuthServicer):
+    """Login, SignUp and VerifyToken calls, with the semantics of the REST routes.
+
+    Errors are status codes: INVALID_ARGUMENT for invalid credentials format,
+    UNAUTHENTICATED for wrong credentials or an invalid token, ALREADY_EXISTS,
+    RESOURCE_EXHAUSTED when throttled and UNAVAILABLE when overloaded, the
+    last two with a "retry-after" trailing metadata (seconds).
+
+    Args:
+        dao: storage of the users
+        auth: password hashing provider
+        token: token provider
+        emails: filter of the registered emails, if enabled
+        login_throttle: attempts limits of Login, if enabled
+        sign_up_throttle: attempts limits of SignUp, if enabled
+        trust_forwarded: throttle by the "x-forwarded-for" metadata address,
+            only behind a gateway overwriting it
+    """
+
+    def __init__(
+        self,
+        dao: AuthDao,
+        auth: AuthProvider,
+        token: TokenProvider,
+        emails: Optional[EmailFilter] = None,
+        login_throttle: Optional[Throttle] = None,
+        sign_up_throttle: Optional[Throttle] = None,
+        trust_forwarded: bool = False,
+    ):
+        self.dao = dao
+        self.auth = auth
+        self.token = token
+        self.emails = emails
+        self.login_throttle = login_throttle
+        self.sign_up_throttle = sign_up_throttle
+        self.trust_forwarded = trust_forwarded
+
+    @rpc
+    async def Login(self, request, context):
+        cred = await self._credentials(request, context, self.login_throttle)
+        try:
+            result = await handlers.login_handler(
+                cred, self.dao, self.auth, self.token, self.emails
+            )
+        except handlers.InvalidCredentials:
+            await context.abort(grpc.StatusCode.UNAUTHENTICATED, "Invalid credentials")
+        except (Overloaded, CircuitOpen) as e:
+            await abort_unavailable(context, e)
+        return auth_pb2.Token(**result)
+
+    @rpc
+    async def SignUp(self, request, context):
+        cred = await self._credentials(request, context, self.sign_up_throttle)
+        try:
+            user = await handlers.sign_up_handler(
+                cred, self.dao, self.auth, self.emails, request.idempotency_key or None
+            )
+        except handlers.UserAlreadyExists:
+            await context.abort(grpc.StatusCode.ALREADY_EXISTS, "User already exists")
+        except handlers.IdempotencyKeyReused:
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                "Idempotency key reused with other credentials",
+            )
+        except (Overloaded, CircuitOpen) as e:
+            await abort_unavailable(context, e)
+        return auth_pb2.User(email=user.email)
+
+    @rpc
+    async def VerifyToken(self, request, context):
+        try:
+            claims = handlers.verify_handler(request.token, self.token)
+        except handlers.InvalidToken:
+            await context.abort(grpc.StatusCode.UNAUTHENTICATED, "Invalid token")
+        return claims_message(claims)
+
+    @rpc_stream
+    async def VerifyTokens(self, request_iterator, context):
+        async for request in request_iterator:
+            try:
+                claims = handlers.verify_handler(request.token, self.token)
+            except handlers.InvalidToken:
+                yield invalid_token_result
+            else:
+                yield auth_pb2.VerifyResult(valid=True, claims=claims_message(claims))
+            streamed_tokens.inc()
+
+    async def _credentials(
+        self, request, context, throttle: Optional[Throttle]
+    ) -> UserCredentials:
+        try:
+            cred = UserCredentials(email=request.email, password=request.password)
+        except ValidationError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        if throttle is not None:
+            try:
+                await throttle.check(cred.email, client_address(context, self.trust_forwarded))
+            except Throttled as e:
+                await context.abort(
+                    grpc.StatusCode.RESOURCE_EXHAUSTED,
+                    "Too many attempts",
+                    (("retry-after", str(max(round(e.retry_after), 1))),),
+                )
+        return cred
+
+
+def create_server(
+    servicer: AuthServicer, max_concurrent_rpcs: Optional[int] = None
+) -> grpc.aio.Server:
+    """Server without a port, 'add_insecure_port' it."""
+    server = grpc.aio.server(
+        maximum_concurrent_rpcs=max_concurrent_rpcs,
+        # every worker process listens on the same port
+        options=[("grpc.so_reuseport", 1)],
+    )
+    auth_pb2_grpc.add_AuthServicer_to_server(servicer, server)
+    return server
+
+
+@lru_cache(maxsize=1)
+def get_server() -> grpc.aio.Server:
+    servicer = AuthServicer(
+        deps.get_dao_provider(),
+        deps.get_auth_provider(),
+        deps.get_token_provider(),
+        deps.get_email_filter(),
+        deps.get_login_throttle(),
+        deps.get_sign_up_throttle(),
+        grpc_config.trust_forwarded,
+    )
+    max_concurrent_rpcs = grpc_config.max_concurrent_rpcs
+    server = create_server(servicer, int(max_concurrent_rpcs) if max_concurrent_rpcs else None)
+    server.add_insecure_port(grpc_config.address)
+    return server
+
+
+async def serve():
+    # the startup and shutdown of the app: connections, hashing processes, tasks
+    from app.auth.app import shutdown_event, startup_event
+
+    await startup_event()
+    server = get_server()
+    if not grpc_config.in_process:
+        await server.start()
+    logger.info(f"gRPC server listening on {grpc_config.address}")
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(
+            signum, lambda: asyncio.ensure_future(server.stop(grpc_config.grace))
+        )
+    try:
+        await server.wait_for_termination()
+    finally:
+        await shutdown_event()
+
+
+def main():
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,27 @@
-from sqlalchemy.exc import IntegrityError, DBAPIError
+import logging
+from typing import Optional
+
+import jwt
 
 from app.auth import models as m
+from app.auth.admission import Overloaded
+from app.auth.bloom import EmailFilter
 from app.auth.dao import AuthDao
+from app.auth.revocation import TokenRevocations
 from app.auth.schema import UserCredentials
 from app.auth.security import AuthProvider, TokenProvider
-from app.utils import Retry
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+password_seconds = registry.histogram(
+    "auth_password_seconds",
+    "Password hash and verify time, including the wait for admission.",
+    ["operation"],
+)
+token_seconds = registry.histogram(
+    "auth_token_seconds", "Token creation and verification time.", ["operation"],
+)
 
 
 class InvalidCredentials(BaseException):
@@ -15,44 +32,123 @@ class UserAlreadyExists(BaseException):
     pass
 
 
-@Retry(attempts=3, delay=1.5)
+class InvalidToken(BaseException):
+    pass
+
+
+class IdempotencyKeyReused(BaseException):
+    pass
+
+
+class TokenNotRevocable(BaseException):
+    pass
+
+
+# database calls are retried by AuthDao itself, so the password hashing
+# done by the handlers is never repeated on a transient failure
+
+
 async def login_handler(
     cred: UserCredentials,
     dao: AuthDao,
     auth: AuthProvider,
     token: TokenProvider,
+    emails: Optional[EmailFilter] = None,
 ):
-    user_id = await dao.get_user_id(cred.email)
-    if not user_id:
+    if emails is not None and not await emails.might_be_registered(cred.email):
+        raise InvalidCredentials
+
+    user = await dao.get_credentials(cred.email)
+    if not user:
         raise InvalidCredentials
 
-    hash_value = await dao.get_pwdhash_value(user_id)
-    if not auth.verify_password(cred.password, hash_value):
+    with password_seconds.time("verify"):
+        verified = await auth.averify_password(cred.password, user.value)
+    if not verified:
         raise InvalidCredentials
 
-    return {
-        "access_token": token.create_token({"email": cred.email}),
-        "token_type": token.type,
-    }
+    if auth.needs_update(user.value):
+        await rehash_password(cred, user.user_id, dao, auth)
 
-no_retry_on_error = (DBAPIError, IntegrityError)
+    with token_seconds.time("create"):
+        access_token = token.create_token({"email": cred.email})
+    return {"access_token": access_token, "token_type": token.type}
+
+
+async def rehash_password(
+    cred: UserCredentials, user_id: int, dao: AuthDao, auth: AuthProvider
+):
+    """Upgrade a hash made with outdated settings, never failing the login.
+
+    Without a hashing slot the rehash is skipped, the next login retries it.
+    """
+    try:
+        with password_seconds.time("rehash"):
+            password_hash = await auth.ahash_password(cred.password)
+        await dao.update_pwdhash(user_id, password_hash)
+    except (Exception, Overloaded) as e:
+        logger.warning(f"Password rehash failed for user {user_id}: {e!r}")
 
 
-@Retry(attempts=3, delay=1.5, exclude_exc=no_retry_on_error)
 async def sign_up_handler(
     cred: UserCredentials,
     dao: AuthDao,
     auth: AuthProvider,
+    emails: Optional[EmailFilter] = None,
+    idempotency_key: Optional[str] = None,
 ) -> m.User:
-    user_id = await dao.get_user_id(cred.email)
-    if user_id:
+    """Register a new user.
+
+    A request repeated with the same idempotency key returns the stored
+    result, instead of hashing the password again.
+    """
+    if idempotency_key is not None:
+        if await _idempotent_result(cred, idempotency_key, dao):
+            return m.User(email=cred.email)
+
+    # without a filter the insert itself detects duplicates, with one
+    # a likely duplicate is checked before paying for hashing
+    if emails is not None and emails.might_exist(cred.email):
+        if await dao.get_user_id(cred.email):
+            raise UserAlreadyExists
+
+    with password_seconds.time("hash"):
+        password_hash = await auth.ahash_password(cred.password)
+    user_id = await dao.create_user(cred.email, password_hash, idempotency_key)
+    if user_id is None:
+        # a concurrent request with the same key could have registered it
+        if idempotency_key is not None:
+            if await _idempotent_result(cred, idempotency_key, dao):
+                return m.User(email=cred.email)
         raise UserAlreadyExists
 
-    new_user = m.User(email=cred.email)
-    password_hash = m.PWDHash(value=auth.hash_password(cred.password))
-    password_hash.users = new_user  # type: ignore
+    if emails is not None:
+        emails.add(cred.email)
+    return m.User(email=cred.email)
+
+
+async def _idempotent_result(
+    cred: UserCredentials, idempotency_key: str, dao: AuthDao
+) -> bool:
+    email = await dao.get_idempotent_result(idempotency_key)
+    if email is not None and email != cred.email:
+        raise IdempotencyKeyReused
+    return email is not None
+
+
+def verify_handler(access_token: str, token: TokenProvider) -> dict:
     try:
-        await dao.add_one(password_hash)
-        return new_user
-    except IntegrityError:
-        raise UserAlreadyExists
+        with token_seconds.time("verify"):
+            return token.verify_token(access_token)
+    except jwt.InvalidTokenError:
+        raise InvalidToken
+
+
+async def revoke_handler(
+    access_token: str, token: TokenProvider, revocations: TokenRevocations
+):
+    claims = verify_handler(access_token, token)
+    # issued before tokens had an id
+    if "jti" not in claims:
+        raise TokenNotRevocable
+    await revocations.revoke(claims["jti"], claims["exp"])
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app.auth.dao import AuthDao
+from app.auth.security import BaseAuth
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Readiness of the service, from checks run in the background.
+
+    Probes only read the result of the last check, so they never wait for
+    I/O nor add load to the database. The service is ready once 'start' has
+    been called (after the pool warm-up), the database answered the last
+    check, no more than 'max_pool_waiting' requests wait for a connection and
+    the hashing queue is not full. A result older than three intervals means
+    the checks are stuck and is reported as not ready.
+
+    Args:
+        dao: storage to ping
+        auth: password hashing provider, its admission queue is checked if any
+        interval: time (seconds) between checks
+        db_timeout: time (seconds) the database has to answer
+        max_pool_waiting: max number of requests waiting for a connection
+    """
+
+    def __init__(
+        self,
+        dao: AuthDao,
+        auth: BaseAuth,
+        interval: float = 2,
+        db_timeout: float = 1,
+        max_pool_waiting: int = 10,
+    ):
+        self.dao = dao
+        self.auth = auth
+        self.interval = interval
+        self.db_timeout = db_timeout
+        self.max_pool_waiting = max_pool_waiting
+        self.checks: dict[str, dict] = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self):
+        checks = {"database": await self._check_database()}
+
+        pool = self.dao.pool_stats()
+        checks["pool"] = {
+            "ok": pool.get("waiting", 0) <= self.max_pool_waiting,
+            "checked_out": pool.get("checked_out"),
+            "waiting": pool.get("waiting"),
+        }
+
+        if admission := getattr(self.auth, "admission", None):
+            stats = admission.stats()
+            checks["hashing"] = {
+                "ok": stats["queue_depth"] < admission.max_queue,
+                "active": stats["active"],
+                "queue_depth": stats["queue_depth"],
+            }
+
+        was_ready = self.ready
+        self.checks = checks
+        self.checked_at = time.monotonic()
+        if was_ready and not self.ready:
+            logger.warning(f"Service not ready: {checks}")
+
+    async def _check_database(self) -> dict:
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.dao.ping(), self.db_timeout)
+        except Exception as e:
+            return {"ok": False, "error": repr(e)}
+        return {"ok": True, "latency": time.perf_counter() - start_time}
+
+    @property
+    def ready(self) -> bool:
+        if self.checked_at is None or self._task is None:
+            return False
+        if time.monotonic() - self.checked_at > self.interval * 3:
+            return False
+        return all(check["ok"] for check in self.checks.values())
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "checks": self.checks}
+
+    async def start(self):
+        await self.check()
+        self._task = asyncio.create_task(self._check_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _check_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.warning(f"Health check failed: {e!r}")
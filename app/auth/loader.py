@@ -0,0 +1,89 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """Coalesces concurrent lookups into batched queries.
+
+    Keys requested within 'window' seconds of the first pending one are loaded
+    by a single 'batch_fn' call, and concurrent lookups of the same key share
+    one in-flight result (singleflight). Nothing is cached once a batch is done.
+
+    Args:
+        batch_fn: loads values for a list of unique keys, missing keys are omitted
+        window: time (seconds) to collect keys before a batch is dispatched
+        max_batch: dispatch right away once that many keys are pending
+
+    Example:
+        >>> loader = BatchLoader(dao.get_user_ids, window=0.002)
+        >>> user_id = await loader.load("name@email.com")
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list[K]], Awaitable[dict[K, V]]],
+        window: float = 0.002,
+        max_batch: int = 500,
+    ):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch = max_batch
+        self._futures: dict[K, asyncio.Future] = {}
+        self._queue: list[K] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+        self.keys = 0
+
+    async def load(self, key: K) -> Optional[V]:
+        self.requests += 1
+        future = self._futures.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[key] = future
+            self._enqueue(key)
+        # a cancelled caller must not cancel the lookup shared with the others
+        return await asyncio.shield(future)
+
+    def _enqueue(self, key: K):
+        self._queue.append(key)
+        if len(self._queue) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.window, self._dispatch)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        keys, self._queue = self._queue, []
+        task = asyncio.create_task(self._load_batch(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, keys: list[K]):
+        self.batches += 1
+        self.keys += len(keys)
+        try:
+            values = await self.batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                self._futures.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self._futures.pop(key).set_result(values.get(key))
+
+    def stats(self) -> dict:
+        """Batch size and coalescing ratio (lookups served per query)."""
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "keys": self.keys,
+            "avg_batch_size": self.keys / self.batches if self.batches else 0.0,
+            "coalescing_ratio": self.requests / self.batches if self.batches else 0.0,
+        }
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import NamedTuple
 
 
 @dataclass(unsafe_hash=True)
@@ -10,3 +11,8 @@ class User:
 class PWDHash:
     value: str
     user_id: int | None = None
+
+
+class Credentials(NamedTuple):
+    user_id: int
+    value: str
@@ -0,0 +1,267 @@
+import time
+import uuid
+from typing import Iterable, Optional
+
+from app.auth import dependencies as deps
+from app.auth.dao import db_breaker
+from app.logger import log_stats, request_id
+from app.metrics import Counter, Gauge, Metric, registry
+
+requests_total = registry.counter(
+    "auth_http_requests_total", "HTTP requests.", ["route", "method", "status"]
+)
+request_seconds = registry.histogram(
+    "auth_http_request_seconds", "HTTP request time.", ["route"]
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests by route template, method and status.
+
+    Routes are labeled by their path template, requests not matching any
+    route share one label, so label values stay bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: dict = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        start_time = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self._route(scope)
+            requests_total.inc(route, scope["method"], str(status_code))
+            request_seconds.observe(time.perf_counter() - start_time, route)
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._routes.get(endpoint)
+        if path is None:
+            path = next(
+                (
+                    route.path
+                    for route in scope["app"].routes
+                    if getattr(route, "endpoint", None) is endpoint
+                ),
+                endpoint.__name__,
+            )
+            self._routes[endpoint] = path
+        return path
+
+
+class RequestIdMiddleware:
+    """ASGI middleware setting the request id of the log records.
+
+    The id comes from the "X-Request-ID" header (the ingress sets one) or is
+    generated, and is returned in the same response header.
+    """
+
+    header = b"x-request-id"
+    max_length = 64
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        value = next((v for k, v in scope["headers"] if k == self.header), b"")
+        rid = value[:self.max_length].decode("latin-1") or uuid.uuid4().hex
+        token = request_id.set(rid)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((self.header, rid.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+def stats_metrics(
+    prefix: str,
+    stats: dict,
+    counters: Iterable[str] = (),
+    labelnames: tuple[str, ...] = (),
+    labels: tuple[str, ...] = (),
+    multiprocess: Optional[dict[str, str]] = None,
+) -> list[Metric]:
+    """Gauges (counters for 'counters' keys) from a component 'stats()' dict.
+
+    'multiprocess' is the merge mode of gauges by key, see Gauge, "all" if not set.
+    """
+    counters = set(counters)
+    multiprocess = multiprocess or {}
+    metrics: list[Metric] = []
+    for key, value in stats.items():
+        if not isinstance(value, (int, float)):
+            continue
+        if key in counters:
+            metric = Counter(f"{prefix}_{key}_total", f"{prefix} {key}.", labelnames)
+            metric.inc(*labels, amount=value)
+        else:
+            metric = Gauge(
+                f"{prefix}_{key}", f"{prefix} {key}.", labelnames, multiprocess.get(key, "all")
+            )
+            metric.set(*labels, value=value)
+        metrics.append(metric)
+    return metrics
+
+
+# merge modes of the gauges of several workers, unlisted ones keep a series per worker
+POOL_GAUGES = {
+    "size": "sum",
+    "checked_in": "sum",
+    "checked_out": "sum",
+    "overflow": "sum",
+    "waiting": "sum",
+    "max_wait_time": "max",
+}
+# every worker builds its own filter of the same emails
+FILTER_GAUGES = {
+    "ready": "min",
+    "items": "max",
+    "capacity": "max",
+    "memory_bytes": "sum",
+    "hashes": "max",
+    "false_positive_rate": "max",
+    "build_time": "max",
+}
+
+
+def collect_components() -> list[Metric]:
+    """Current stats of the connection pool, caches, admission control, throttles and logging."""
+    dao = deps.get_dao_provider()
+    metrics = stats_metrics(
+        "auth_db_pool",
+        dao.pool_stats(),
+        ("checkouts", "timeouts"),
+        multiprocess=POOL_GAUGES,
+    )
+
+    circuit_open = Gauge(
+        "auth_db_circuit_open", "Database circuit breaker is open.", multiprocess="max"
+    )
+    circuit_open.set(value=int(db_breaker.state != db_breaker.CLOSED))
+    metrics.append(circuit_open)
+
+    for name, stats in dao.loader_stats().items():
+        metrics += stats_metrics(
+            "auth_db_coalesce", stats, ("requests", "batches", "keys"), ("loader",), (name,)
+        )
+
+    if replica_stats := dao.replica_stats():
+        for name, stats in replica_stats.pop("replicas").items():
+            metrics += stats_metrics(
+                "auth_db_replica",
+                stats,
+                ("reads", "failures"),
+                ("replica",),
+                (name,),
+                {"healthy": "min", "lag": "max", "circuit_open": "max"},
+            )
+        metrics += stats_metrics(
+            "auth_db_replicas",
+            replica_stats,
+            ("primary_reads", "fallbacks", "failovers"),
+            multiprocess={"recently_written": "sum"},
+        )
+
+    if admission := getattr(deps.get_auth_provider(), "admission", None):
+        metrics += stats_metrics(
+            "auth_hash_admission",
+            admission.stats(),
+            ("admitted", "rejected", "timed_out"),
+            multiprocess={
+                "slots": "sum", "active": "sum", "queue_depth": "sum", "background_waiting": "sum"
+            },
+        )
+
+    if cache := getattr(deps.get_token_provider(), "cache", None):
+        metrics += stats_metrics(
+            "auth_token_cache",
+            cache.stats(),
+            ("hits", "misses", "evictions"),
+            multiprocess={"size": "sum", "maxsize": "sum"},
+        )
+
+    metrics += stats_metrics(
+        "auth_token_revocations",
+        deps.get_token_revocations().stats(),
+        ("syncs", "failures"),
+        multiprocess={"size": "max", "sync_age": "max"},
+    )
+    metrics += stats_metrics(
+        "auth_idempotency_cleanup",
+        deps.get_idempotency_cleanup().stats(),
+        ("runs", "deleted", "failures"),
+    )
+
+    if emails := deps.get_email_filter():
+        metrics += stats_metrics(
+            "auth_email_filter",
+            emails.stats(),
+            ("catch_ups", "catch_up_failures"),
+            multiprocess=FILTER_GAUGES,
+        )
+
+    throttles = {"login": deps.get_login_throttle(), "sign_up": deps.get_sign_up_throttle()}
+    for endpoint, throttle in throttles.items():
+        if throttle is None:
+            continue
+        for key, stats in throttle.stats().items():
+            metrics += stats_metrics(
+                "auth_throttle",
+                stats,
+                ("allowed", "throttled"),
+                ("endpoint", "key"),
+                (endpoint, key),
+                {"keys": "sum"},
+            )
+        metrics += stats_metrics(
+            "auth_throttle",
+            {"failures": throttle.failures},
+            ("failures",),
+            ("endpoint",),
+            (endpoint,),
+        )
+
+    metrics += stats_metrics(
+        "auth_log", log_stats(), ("dropped", "sampled_out"), multiprocess={"queue_depth": "sum"}
+    )
+
+    return _merge(metrics)
+
+
+def _merge(metrics: list[Metric]) -> list[Metric]:
+    # series of the same name (e.g. per replica) are exposed as one metric
+    merged: dict[str, Metric] = {}
+    for metric in metrics:
+        if metric.name in merged:
+            merged[metric.name].values.update(metric.values)  # type: ignore
+        else:
+            merged[metric.name] = metric
+    return list(merged.values())
+
+
+registry.add_collector(collect_components)
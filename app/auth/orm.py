@@ -11,7 +11,9 @@ users_table = sa.Table(
     "users",
     metadata,
     sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
-    sa.Column("email", sa.String(40), unique=True, index=True),
+    sa.Column("email", sa.String(40)),
+    # covering index: the login lookup by email is an index-only scan
+    sa.Index("ix_users_email", "email", unique=True, postgresql_include=["id"]),
 )
 
 pwdhashes_table = sa.Table(
@@ -22,10 +24,35 @@ pwdhashes_table = sa.Table(
         "user_id",
         sa.Integer,
         ForeignKey("users.id", ondelete="CASCADE"),
-        unique=True,
-        index=True,
     ),
     sa.Column("value", sa.String(), nullable=False),
+    sa.Index(
+        "ix_pwdhashes_user_id", "user_id", unique=True, postgresql_include=["value"]
+    ),
+)
+
+idempotency_keys_table = sa.Table(
+    "idempotency_keys",
+    metadata,
+    sa.Column("key", sa.String(64), primary_key=True),
+    sa.Column(
+        "user_id", sa.Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    ),
+    sa.Column(
+        "created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+    ),
+)
+
+revoked_tokens_table = sa.Table(
+    "revoked_tokens",
+    metadata,
+    sa.Column("jti", sa.String(64), primary_key=True),
+    sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Column(
+        "revoked_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+    ),
+    # every pod polls the latest revocations
+    sa.Index("ix_revoked_tokens_revoked_at", "revoked_at"),
 )
 
 
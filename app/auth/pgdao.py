@@ -0,0 +1,484 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+
+import asyncpg
+from asyncpg import exceptions as pg_exc
+
+from app.auth.dao import AuthDao, read_retry, db_breaker, REPLICA_LAG_QUERY, query_seconds
+from app.auth.pool import checkout_seconds
+from app.auth.replicas import ReplicaSet
+from app.auth.models import Credentials, User, PWDHash
+from app.auth.orm import (
+    metadata, users_table, pwdhashes_table, idempotency_keys_table, revoked_tokens_table,
+)
+from app.utils import Retry
+
+
+@lru_cache
+def build_queries(schema: Optional[str]) -> dict[str, str]:
+    """Queries of the DAO against the tables of 'schema'."""
+
+    def table(name: str) -> str:
+        return f"{schema}.{name}" if schema else name
+
+    users = table(users_table.name)
+    pwdhashes = table(pwdhashes_table.name)
+    idempotency_keys = table(idempotency_keys_table.name)
+    revoked_tokens = table(revoked_tokens_table.name)
+
+    new_user = f"""
+        new_user AS (
+            INSERT INTO {users} (email) VALUES ($1)
+            ON CONFLICT (email) DO NOTHING RETURNING id
+        )"""
+
+    return {
+        "get_user_id": f"SELECT id FROM {users} WHERE email = $1",
+        "get_pwdhash_value": f"SELECT value FROM {pwdhashes} WHERE user_id = $1",
+        "get_credentials": f"""
+            SELECT u.id, p.value FROM {users} u
+            JOIN {pwdhashes} p ON p.user_id = u.id
+            WHERE u.email = $1""",
+        "get_user_ids": f"SELECT email, id FROM {users} WHERE email = ANY($1::varchar[])",
+        "get_many_credentials": f"""
+            SELECT u.email, u.id, p.value FROM {users} u
+            JOIN {pwdhashes} p ON p.user_id = u.id
+            WHERE u.email = ANY($1::varchar[])""",
+        "get_idempotent_result": f"""
+            SELECT u.email FROM {users} u
+            JOIN {idempotency_keys} k ON k.user_id = u.id
+            WHERE k.key = $1 AND k.created_at > now() - make_interval(secs => $2)""",
+        "update_pwdhash": f"UPDATE {pwdhashes} SET value = $2 WHERE user_id = $1",
+        "add_user": f"INSERT INTO {users} (email) VALUES ($1) RETURNING id",
+        "add_pwdhash": f"INSERT INTO {pwdhashes} (user_id, value) VALUES ($1, $2) RETURNING id",
+        # user and password hash in a single statement, same as AuthDao._create_user_expr
+        "create_user": f"""
+            WITH {new_user}
+            INSERT INTO {pwdhashes} (user_id, value) SELECT id, $2 FROM new_user
+            RETURNING user_id""",
+        # an expired key is reused, a live one returns no key_user_id
+        "create_user_idempotent": f"""
+            WITH {new_user},
+            new_pwdhash AS (
+                INSERT INTO {pwdhashes} (user_id, value) SELECT id, $2 FROM new_user
+                RETURNING user_id
+            ),
+            new_key AS (
+                INSERT INTO {idempotency_keys} AS k (key, user_id, created_at)
+                SELECT $3, user_id, now() FROM new_pwdhash
+                ON CONFLICT (key) DO UPDATE
+                SET user_id = excluded.user_id, created_at = excluded.created_at
+                WHERE k.created_at <= now() - make_interval(secs => $4)
+                RETURNING user_id
+            )
+            SELECT p.user_id, k.user_id AS key_user_id
+            FROM new_pwdhash p LEFT JOIN new_key k ON true""",
+        "create_users": f"""
+            INSERT INTO {users} (email) SELECT unnest($1::varchar[])
+            ON CONFLICT (email) DO NOTHING RETURNING id, email""",
+        "add_pwdhashes": f"""
+            INSERT INTO {pwdhashes} (user_id, value)
+            SELECT unnest($1::integer[]), unnest($2::varchar[])""",
+        "revoke_token": f"""
+            INSERT INTO {revoked_tokens} (jti, expires_at) VALUES ($1, $2)
+            ON CONFLICT (jti) DO NOTHING""",
+        "get_revocations": f"""
+            SELECT jti, expires_at, revoked_at FROM {revoked_tokens}
+            WHERE expires_at > now() AND ($1::timestamptz IS NULL OR revoked_at > $1)""",
+        "iter_users": f"SELECT id, email FROM {users}",
+        "get_users_after": f"SELECT id, email FROM {users} WHERE id > $1",
+        "delete_expired_revocations": f"DELETE FROM {revoked_tokens} WHERE expires_at <= now()",
+        "delete_expired_idempotency_keys": f"""
+            DELETE FROM {idempotency_keys}
+            WHERE created_at <= now() - make_interval(secs => $1)""",
+    }
+
+
+QUERIES = build_queries(metadata.schema)
+
+# asyncpg raises its own exceptions. Retried: no connection, a statement rolled
+# back (serialization failure, deadlock) and a dropped connection. The last may
+# happen after the commit, so the writes retried are idempotent (update_pwdhash,
+# revoke_token), resolve a committed attempt (create_user, create_users) or
+# fail on a unique constraint (add_one, add_all)
+pg_write_retry = Retry(
+    attempts=2, delay=0.1, backoff=2, max_delay=1, jitter=True, deadline=3,
+    on_exc=(
+        ConnectionError,
+        OSError,
+        asyncio.TimeoutError,
+        pg_exc.ConnectionDoesNotExistError,
+        pg_exc.CannotConnectNowError,
+        pg_exc.TooManyConnectionsError,
+        pg_exc.InvalidCachedStatementError,
+        pg_exc.SerializationError,
+        pg_exc.DeadlockDetectedError,
+    ),
+    # ConnectionResetError, BrokenPipeError, ...
+    subclasses=True,
+    breaker=db_breaker,
+)
+
+
+class PgPool:
+    """asyncpg pool opened on first use, recording checkout waits like InstrumentedPool.
+
+    Args:
+        dsn: postgresql:// connection string
+        max_size: max number of connections
+        acquire_timeout: time (seconds) to wait for a connection
+        max_inactive_lifetime: idle connections are closed after that time (seconds)
+        prepare: keep named prepared statements per connection, must be off
+            behind PgBouncer transaction pooling
+        connect_kwargs: passed to asyncpg.connect
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        max_size: int = 10,
+        acquire_timeout: float = 3,
+        max_inactive_lifetime: float = 1800,
+        prepare: bool = True,
+        **connect_kwargs,
+    ):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_inactive_lifetime = max_inactive_lifetime
+        self.prepare = prepare
+        if prepare:
+            # every query is parsed and planned once per connection, later
+            # calls only bind parameters; the DAO runs a few fixed queries
+            connect_kwargs.setdefault("statement_cache_size", len(QUERIES) * 2)
+            connect_kwargs.setdefault("max_cached_statement_lifetime", 0)
+        else:
+            connect_kwargs["statement_cache_size"] = 0
+        self.connect_kwargs = connect_kwargs
+        self._pool: Optional[asyncpg.Pool] = None
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    async def open(self, min_size: int = 0) -> asyncpg.Pool:
+        """Create the pool with 'min_size' connections opened, if not yet created."""
+        async with self._lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(
+                    self.dsn,
+                    min_size=min(min_size, self.max_size),
+                    max_size=self.max_size,
+                    max_inactive_connection_lifetime=self.max_inactive_lifetime,
+                    **self.connect_kwargs,
+                )
+        return self._pool
+
+    async def close(self):
+        async with self._lock:
+            if self._pool is not None:
+                await self._pool.close()
+                self._pool = None
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        pool = self._pool or await self.open()
+        self.waiting += 1
+        start_time = time.perf_counter()
+        try:
+            conn = await pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait_time = time.perf_counter() - start_time
+            checkout_seconds.observe(wait_time)
+            self.waiting -= 1
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    def stats(self) -> dict:
+        size = self._pool.get_size() if self._pool else 0
+        idle = self._pool.get_idle_size() if self._pool else 0
+        return {
+            "size": size,
+            "checked_in": idle,
+            "checked_out": size - idle,
+            "overflow": 0,
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_time": self.wait_time / self.checkouts if self.checkouts else 0.0,
+            "max_wait_time": self.max_wait_time,
+        }
+
+
+class AsyncpgAuthDao(AuthDao):
+    """Auth storage access through the asyncpg pool directly.
+
+    Skips the session, statement compilation and ORM bookkeeping of AuthDao:
+    each method runs one fixed query, prepared once per connection, and returns
+    plain values or Credentials tuples.
+
+    Args:
+        pool: connection pool
+        coalesce_window: see AuthDao
+        idempotency_ttl: see AuthDao
+        replicas: pools of read replicas, see AuthDao
+        schema: schema of the tables, the one of the ORM tables by default
+    """
+
+    write_errors = (pg_exc.PostgresError,)
+
+    def __init__(
+        self,
+        pool: PgPool,
+        coalesce_window: Optional[float] = None,
+        idempotency_ttl: float = 86400,
+        replicas: Optional[ReplicaSet[PgPool]] = None,
+        schema: Optional[str] = metadata.schema,
+    ):
+        super().__init__(pool, coalesce_window, idempotency_ttl, replicas)  # type: ignore
+        self.schema = schema
+        self.queries = build_queries(schema)
+
+    async def startup(self, connections: int = 0):
+        if self.replicas:
+            await self.replicas.start(self.replica_lag)
+        await self.pool.open(min_size=connections)
+
+    async def shutdown(self):
+        await self.pool.close()
+        if self.replicas:
+            await self.replicas.stop()
+            for replica in self.replicas.replicas:
+                await replica.pool.close()
+
+    async def ping(self):
+        async with self.pool.acquire() as conn:
+            await conn.fetchval("SELECT 1")
+
+    def pool_stats(self) -> dict:
+        return self.pool.stats()
+
+    @staticmethod
+    async def replica_lag(pool: PgPool) -> float:
+        async with pool.acquire() as conn:
+            return float(await conn.fetchval(REPLICA_LAG_QUERY.text))
+
+    @staticmethod
+    def _is_disconnect(e: Exception) -> bool:
+        return isinstance(
+            e,
+            (
+                OSError,
+                asyncio.TimeoutError,
+                pg_exc.ConnectionDoesNotExistError,
+                pg_exc.PostgresConnectionError,
+            ),
+        )
+
+    async def _run(self, conn: asyncpg.Connection, method: str, name: str, *args):
+        """Run a query by name with 'fetch', 'fetchrow', 'fetchval' or 'execute'."""
+        return await getattr(conn, method)(self.queries[name], *args)
+
+    async def _query(self, method: str, name: str, *args, pool: Optional[PgPool] = None):
+        async with (pool or self.pool).acquire() as conn:
+            return await self._run(conn, method, name, *args)
+
+    async def _lookup(self, method: str, name: str, key, must_find: bool = False):
+        """Single key lookup, on a read replica if possible."""
+
+        async def query(pool, _):
+            return await self._query(method, name, key, pool=pool)
+
+        return await self._read(query, [key], fallback=True, must_find=must_find)
+
+    @read_retry
+    @query_seconds.timed("get_pwdhash_value")
+    async def get_pwdhash_value(self, user_id: int) -> str:
+        return await self._lookup("fetchval", "get_pwdhash_value", user_id)
+
+    @pg_write_retry
+    @query_seconds.timed("add_one")
+    async def add_one(self, item) -> int:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                return await self._add(conn, item)
+
+    @pg_write_retry
+    @query_seconds.timed("add_all")
+    async def add_all(self, items: list) -> list:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for item in items:
+                    await self._add(conn, item)
+        return items
+
+    async def _add(self, conn: asyncpg.Connection, item) -> int:
+        if isinstance(item, User):
+            item.id = await self._run(conn, "fetchval", "add_user", item.email)
+        elif isinstance(item, PWDHash):
+            user = getattr(item, "users", None)
+            if item.user_id is None and user is not None:
+                item.user_id = await self._add(conn, user)
+            item.id = await self._run(
+                conn, "fetchval", "add_pwdhash", item.user_id, item.value
+            )
+        else:
+            raise TypeError(f"Unsupported item: {item!r}")
+        return item.id
+
+    @read_retry
+    @query_seconds.timed("get_user_id")
+    async def _get_user_id(self, email: str) -> Optional[int]:
+        return await self._lookup("fetchval", "get_user_id", email)
+
+    @read_retry
+    @query_seconds.timed("get_credentials")
+    async def _get_credentials(self, email: str) -> Optional[Credentials]:
+        row = await self._lookup("fetchrow", "get_credentials", email, must_find=True)
+        return Credentials(*row) if row else None
+
+    async def iter_users(self, batch_size: int = 10000) -> AsyncIterator[tuple[int, str]]:
+        replica = self.replicas.pick() if self.replicas else None
+        async with (replica.pool if replica else self.pool).acquire() as conn:
+            async with conn.transaction():
+                query = self.queries["iter_users"]
+                async for row in conn.cursor(query, prefetch=batch_size):
+                    yield row[0], row[1]
+
+    @read_retry
+    @query_seconds.timed("get_users_after")
+    async def get_users_after(self, user_id: int) -> list[tuple[int, str]]:
+        return [tuple(row) for row in await self._query("fetch", "get_users_after", user_id)]
+
+    @read_retry
+    @query_seconds.timed("get_user_ids")
+    async def get_user_ids(self, emails: list[str]) -> dict[str, int]:
+        async def query(pool, emails):
+            return dict(await self._query("fetch", "get_user_ids", emails, pool=pool))
+
+        return await self._read(query, emails, fallback=True)
+
+    @read_retry
+    @query_seconds.timed("get_many_credentials")
+    async def get_many_credentials(self, emails: list[str]) -> dict[str, Credentials]:
+        async def query(pool, emails):
+            rows = await self._query("fetch", "get_many_credentials", emails, pool=pool)
+            return {email: Credentials(user_id, value) for email, user_id, value in rows}
+
+        return await self._read(query, emails, must_find=True)
+
+    @pg_write_retry
+    @query_seconds.timed("update_pwdhash")
+    async def update_pwdhash(self, user_id: int, value: str):
+        await self._query("fetchval", "update_pwdhash", user_id, value)
+        self._written(user_id)
+
+    @read_retry
+    @query_seconds.timed("get_idempotent_result")
+    async def get_idempotent_result(self, key: str) -> Optional[str]:
+        return await self._query(
+            "fetchval", "get_idempotent_result", key, float(self.idempotency_ttl)
+        )
+
+    @pg_write_retry
+    @query_seconds.timed("create_user")
+    async def create_user(
+        self, email: str, pwdhash: str, idempotency_key: Optional[str] = None
+    ) -> Optional[int]:
+        async with self.pool.acquire() as conn:
+            if idempotency_key is None:
+                user_id = await self._run(conn, "fetchval", "create_user", email, pwdhash)
+            else:
+                transaction = conn.transaction()
+                await transaction.start()
+                try:
+                    row = await self._run(
+                        conn, "fetchrow", "create_user_idempotent",
+                        email, pwdhash, idempotency_key, float(self.idempotency_ttl),
+                    )
+                except BaseException:
+                    await transaction.rollback()
+                    raise
+                if row is not None and row["key_user_id"] is None:
+                    # a concurrent sign-up holds the live key, it is not ours
+                    await transaction.rollback()
+                    return None
+                await transaction.commit()
+                user_id = row["user_id"] if row is not None else None
+            if user_id is None:
+                user_id = (await self._registered_with(conn, {email: pwdhash})).get(email)
+        if user_id is not None:
+            self._written(email, user_id)
+        return user_id
+
+    @pg_write_retry
+    @query_seconds.timed("create_users")
+    async def create_users(self, users: list[tuple[str, str]]) -> dict[str, int]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                emails = [email for email, _ in users]
+                rows = await self._run(conn, "fetch", "create_users", emails)
+                created = {email: user_id for user_id, email in rows}
+                # the first occurrence of an email repeated in the batch wins
+                pending = dict(created)
+                hashes = [
+                    (pending.pop(email), value) for email, value in users if email in pending
+                ]
+                if hashes:
+                    user_ids, values = zip(*hashes)
+                    await self._run(
+                        conn, "fetchval", "add_pwdhashes", list(user_ids), list(values)
+                    )
+                skipped: dict[str, str] = {}
+                for email, value in users:
+                    if email not in created:
+                        skipped.setdefault(email, value)
+                if skipped:
+                    created.update(await self._registered_with(conn, skipped))
+        self._written(*created.keys(), *created.values())
+        return created
+
+    async def _registered_with(
+        self, conn: asyncpg.Connection, users: dict[str, str]
+    ) -> dict[str, int]:
+        rows = await self._run(conn, "fetch", "get_many_credentials", list(users))
+        return {email: user_id for email, user_id, value in rows if users[email] == value}
+
+    @pg_write_retry
+    @query_seconds.timed("revoke_token")
+    async def revoke_token(self, jti: str, expires_at: datetime):
+        await self._query("execute", "revoke_token", jti, expires_at)
+
+    # no retry nor breaker, the periodic sync is the retry and its failures
+    # must not open the breaker of the requests
+    @query_seconds.timed("get_revocations")
+    async def get_revocations(
+        self, since: Optional[datetime] = None
+    ) -> list[tuple[str, datetime, datetime]]:
+        return [tuple(row) for row in await self._query("fetch", "get_revocations", since)]
+
+    @query_seconds.timed("delete_expired_revocations")
+    async def delete_expired_revocations(self) -> int:
+        status = await self._query("execute", "delete_expired_revocations")
+        return int(status.split()[-1])
+
+    @query_seconds.timed("delete_expired_idempotency_keys")
+    async def delete_expired_idempotency_keys(self) -> int:
+        status = await self._query(
+            "execute", "delete_expired_idempotency_keys", float(self.idempotency_ttl)
+        )
+        return int(status.split()[-1])
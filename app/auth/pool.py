@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+checkout_seconds = registry.histogram(
+    "auth_db_pool_checkout_seconds", "Time waited for a database connection."
+)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool recording how long callers wait to check out a connection.
+
+    The wait covers both queueing for a free connection and opening a new one,
+    i.e. everything a request pays before its first query is sent.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        self.waiting += 1
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            self.timeouts += 1
+            raise
+        finally:
+            wait_time = time.perf_counter() - start_time
+            checkout_seconds.observe(wait_time)
+            self.waiting -= 1
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_time": self.wait_time / self.checkouts if self.checkouts else 0.0,
+            "max_wait_time": self.max_wait_time,
+        }
+
+
+async def warm_up(engine: AsyncEngine, connections: int):
+    """Opens 'connections' at once and returns them to the pool.
+
+    Connection setup (TCP, TLS, auth) is then paid at startup instead of by
+    the first requests after a rollout.
+    """
+    start_time = time.perf_counter()
+    results = await asyncio.gather(
+        *(engine.connect().start() for _ in range(connections)),
+        return_exceptions=True,
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for conn in results:
+        if not isinstance(conn, BaseException):
+            await conn.close()
+    if errors:
+        raise errors[0]
+    logger.info(
+        f"Connection pool warmed up: {connections} connections "
+        f"in {time.perf_counter() - start_time:.3f} sec."
+    )
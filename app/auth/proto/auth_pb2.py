@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: app/auth/proto/auth.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'app/auth/proto/auth.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x19\x61pp/auth/proto/auth.proto\x12\x07\x61uth.v1\".\n\x0b\x43redentials\x12\r\n\x05\x65mail\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"I\n\rSignUpRequest\x12\r\n\x05\x65mail\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\x17\n\x0fidempotency_key\x18\x03 \x01(\t\"1\n\x05Token\x12\x14\n\x0c\x61\x63\x63\x65ss_token\x18\x01 \x01(\t\x12\x12\n\ntoken_type\x18\x02 \x01(\t\"\x15\n\x04User\x12\r\n\x05\x65mail\x18\x01 \x01(\t\"\x1e\n\rVerifyRequest\x12\r\n\x05token\x18\x01 \x01(\t\"K\n\x06\x43laims\x12\r\n\x05\x65mail\x18\x01 \x01(\t\x12\x0b\n\x03\x65xp\x18\x02 \x01(\x03\x12\x0b\n\x03iat\x18\x03 \x01(\x03\x12\x0b\n\x03iss\x18\x04 \x01(\t\x12\x0b\n\x03jti\x18\x05 \x01(\t\">\n\x0cVerifyResult\x12\r\n\x05valid\x18\x01 \x01(\x08\x12\x1f\n\x06\x63laims\x18\x02 \x01(\x0b\x32\x0f.auth.v1.Claims2\xe1\x01\n\x04\x41uth\x12-\n\x05Login\x12\x14.auth.v1.Credentials\x1a\x0e.auth.v1.Token\x12/\n\x06SignUp\x12\x16.auth.v1.SignUpRequest\x1a\r.auth.v1.User\x12\x36\n\x0bVerifyToken\x12\x16.auth.v1.VerifyRequest\x1a\x0f.auth.v1.Claims\x12\x41\n\x0cVerifyTokens\x12\x16.auth.v1.VerifyRequest\x1a\x15.auth.v1.VerifyResult(\x01\x30\x01\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'app.auth.proto.auth_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_CREDENTIALS']._serialized_start=38
+  _globals['_CREDENTIALS']._serialized_end=84
+  _globals['_SIGNUPREQUEST']._serialized_start=86
+  _globals['_SIGNUPREQUEST']._serialized_end=159
+  _globals['_TOKEN']._serialized_start=161
+  _globals['_TOKEN']._serialized_end=210
+  _globals['_USER']._serialized_start=212
+  _globals['_USER']._serialized_end=233
+  _globals['_VERIFYREQUEST']._serialized_start=235
+  _globals['_VERIFYREQUEST']._serialized_end=265
+  _globals['_CLAIMS']._serialized_start=267
+  _globals['_CLAIMS']._serialized_end=342
+  _globals['_VERIFYRESULT']._serialized_start=344
+  _globals['_VERIFYRESULT']._serialized_end=406
+  _globals['_AUTH']._serialized_start=409
+  _globals['_AUTH']._serialized_end=634
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,227 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+from app.auth.proto import auth_pb2 as app_dot_auth_dot_proto_dot_auth__pb2
+
+GRPC_GENERATED_VERSION = '1.84.0'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + ' but the generated code in app/auth/proto/auth_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class AuthStub:
+    """Missing associated documentation comment in .proto file."""
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.Login = channel.unary_unary(
+                '/auth.v1.Auth/Login',
+                request_serializer=app_dot_auth_dot_proto_dot_auth__pb2.Credentials.SerializeToString,
+                response_deserializer=app_dot_auth_dot_proto_dot_auth__pb2.Token.FromString,
+                _registered_method=True)
+        self.SignUp = channel.unary_unary(
+                '/auth.v1.Auth/SignUp',
+                request_serializer=app_dot_auth_dot_proto_dot_auth__pb2.SignUpRequest.SerializeToString,
+                response_deserializer=app_dot_auth_dot_proto_dot_auth__pb2.User.FromString,
+                _registered_method=True)
+        self.VerifyToken = channel.unary_unary(
+                '/auth.v1.Auth/VerifyToken',
+                request_serializer=app_dot_auth_dot_proto_dot_auth__pb2.VerifyRequest.SerializeToString,
+                response_deserializer=app_dot_auth_dot_proto_dot_auth__pb2.Claims.FromString,
+                _registered_method=True)
+        self.VerifyTokens = channel.stream_stream(
+                '/auth.v1.Auth/VerifyTokens',
+                request_serializer=app_dot_auth_dot_proto_dot_auth__pb2.VerifyRequest.SerializeToString,
+                response_deserializer=app_dot_auth_dot_proto_dot_auth__pb2.VerifyResult.FromString,
+                _registered_method=True)
+
+
+class AuthServicer:
+    """Missing associated documentation comment in .proto file."""
+
+    def Login(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SignUp(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def VerifyToken(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def VerifyTokens(self, request_iterator, context):
+        """One result per token, in the order the tokens were sent.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_AuthServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'Login': grpc.unary_unary_rpc_method_handler(
+                    servicer.Login,
+                    request_deserializer=app_dot_auth_dot_proto_dot_auth__pb2.Credentials.FromString,
+                    response_serializer=app_dot_auth_dot_proto_dot_auth__pb2.Token.SerializeToString,
+            ),
+            'SignUp': grpc.unary_unary_rpc_method_handler(
+                    servicer.SignUp,
+                    request_deserializer=app_dot_auth_dot_proto_dot_auth__pb2.SignUpRequest.FromString,
+                    response_serializer=app_dot_auth_dot_proto_dot_auth__pb2.User.SerializeToString,
+            ),
+            'VerifyToken': grpc.unary_unary_rpc_method_handler(
+                    servicer.VerifyToken,
+                    request_deserializer=app_dot_auth_dot_proto_dot_auth__pb2.VerifyRequest.FromString,
+                    response_serializer=app_dot_auth_dot_proto_dot_auth__pb2.Claims.SerializeToString,
+            ),
+            'VerifyTokens': grpc.stream_stream_rpc_method_handler(
+                    servicer.VerifyTokens,
+                    request_deserializer=app_dot_auth_dot_proto_dot_auth__pb2.VerifyRequest.FromString,
+                    response_serializer=app_dot_auth_dot_proto_dot_auth__pb2.VerifyResult.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'auth.v1.Auth', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('auth.v1.Auth', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class Auth:
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def Login(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/auth.v1.Auth/Login',
+            app_dot_auth_dot_proto_dot_auth__pb2.Credentials.SerializeToString,
+            app_dot_auth_dot_proto_dot_auth__pb2.Token.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SignUp(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/auth.v1.Auth/SignUp',
+            app_dot_auth_dot_proto_dot_auth__pb2.SignUpRequest.SerializeToString,
+            app_dot_auth_dot_proto_dot_auth__pb2.User.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def VerifyToken(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/auth.v1.Auth/VerifyToken',
+            app_dot_auth_dot_proto_dot_auth__pb2.VerifyRequest.SerializeToString,
+            app_dot_auth_dot_proto_dot_auth__pb2.Claims.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def VerifyTokens(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/auth.v1.Auth/VerifyTokens',
+            app_dot_auth_dot_proto_dot_auth__pb2.VerifyRequest.SerializeToString,
+            app_dot_auth_dot_proto_dot_auth__pb2.VerifyResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
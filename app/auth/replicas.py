@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+from app.utils import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+P = TypeVar("P")
+
+
+class Replica(Generic[P]):
+    def __init__(self, name: str, pool: P, breaker: CircuitBreaker):
+        self.name = name
+        self.pool = pool
+        # failing reads skip the replica until its reset timeout, apart from
+        # the breaker of the primary
+        self.breaker = breaker
+        self.healthy = True
+        self.lag: Optional[float] = None
+        self.reads = 0
+        self.failures = 0
+
+
+class ReplicaSet(Generic[P]):
+    """Read replicas picked round-robin, skipping the unhealthy ones.
+
+    A replica is unhealthy after its connection failed or its replication lag
+    went over 'max_lag', until the next health check passes. It is skipped
+    too while its circuit breaker is open, after 'failure_threshold' reads
+    failed in a row; a read failed on a replica is served by the primary
+    (failover). Keys (emails,
+    user ids) written by this process are remembered for 'lag_window' seconds
+    so their lookups go to the primary while replicas may not have them yet.
+    Other workers and pods do not know about these writes: credentials
+    lookups (logins) missing on a replica are always repeated on the primary.
+
+    Args:
+        replicas: connection pools by replica name
+        lag_window: time (seconds) a written key is read from the primary
+        check_interval: time (seconds) between health checks
+        max_lag: replication lag (seconds) above which a replica is not used
+        miss_fallback: the other lookups (user ids, password hashes) which found
+            nothing on a replica are repeated on the primary too, at the cost
+            of a second query for every unknown email
+        failure_threshold: consecutive failed reads opening the breaker of a replica
+        reset_timeout: time (seconds) a replica is skipped once its breaker opened
+
+    Example:
+        >>> replicas = ReplicaSet({"replica-1:5432": pool1, "replica-2:5432": pool2})
+        >>> replica = replicas.pick("name@email.com")
+        >>> pool = replica.pool if replica else primary_pool
+    """
+
+    def __init__(
+        self,
+        replicas: dict[str, P],
+        lag_window: float = 5,
+        check_interval: float = 5,
+        max_lag: float = 10,
+        miss_fallback: bool = False,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10,
+    ):
+        self.replicas = [
+            Replica(name, pool, CircuitBreaker(failure_threshold, reset_timeout))
+            for name, pool in replicas.items()
+        ]
+        self.lag_window = lag_window
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.miss_fallback = miss_fallback
+        self._next = 0
+        self._written: OrderedDict[Hashable, float] = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.primary_reads = 0
+        self.fallbacks = 0
+        self.failovers = 0
+
+    def pick(self, *keys: Hashable) -> Optional[Replica[P]]:
+        """Next healthy replica, None to read from the primary."""
+        if self.recently_written(*keys):
+            self.primary_reads += 1
+            return None
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next]
+            self._next = (self._next + 1) % len(self.replicas)
+            if replica.healthy and not replica.breaker.is_open():
+                replica.reads += 1
+                return replica
+        self.primary_reads += 1
+        return None
+
+    def written(self, *keys: Hashable):
+        expire_at = time.monotonic() + self.lag_window
+        for key in keys:
+            self._written.pop(key, None)
+            self._written[key] = expire_at
+        self._expire()
+
+    def recently_written(self, *keys: Hashable) -> bool:
+        self._expire()
+        return any(key in self._written for key in keys)
+
+    def _expire(self):
+        # insertion order is expiry order
+        now = time.monotonic()
+        while self._written:
+            key, expire_at = next(iter(self._written.items()))
+            if expire_at > now:
+                break
+            del self._written[key]
+
+    def read_succeeded(self, replica: Replica[P]):
+        replica.breaker.on_success()
+
+    def read_failed(self, replica: Replica[P], e: Exception, disconnect: bool):
+        """Record a failed read, to be served by the primary."""
+        self.failovers += 1
+        replica.breaker.on_failure()
+        if disconnect:
+            self.mark_down(replica, e)
+        else:
+            replica.failures += 1
+
+    def mark_down(self, replica: Replica[P], reason: object):
+        if replica.healthy:
+            logger.warning(f"Read replica {replica.name} marked down: {reason!r}")
+        replica.healthy = False
+        replica.failures += 1
+
+    async def check(self, lag_fn: Callable[[P], Awaitable[float]]):
+        """Update the health of every replica, 'lag_fn' returns its lag in seconds."""
+
+        async def check_one(replica: Replica[P]):
+            try:
+                replica.lag = await lag_fn(replica.pool)
+            except Exception as e:
+                self.mark_down(replica, e)
+                return
+            if replica.lag > self.max_lag:
+                self.mark_down(replica, f"replication lag {replica.lag:.1f} sec.")
+            elif not replica.healthy:
+                logger.info(f"Read replica {replica.name} is back")
+                replica.healthy = True
+
+        await asyncio.gather(*(check_one(replica) for replica in self.replicas))
+
+    async def start(self, lag_fn: Callable[[P], Awaitable[float]]):
+        await self.check(lag_fn)
+        self._task = asyncio.create_task(self._check_periodically(lag_fn))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _check_periodically(self, lag_fn: Callable[[P], Awaitable[float]]):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check(lag_fn)
+
+    def stats(self) -> dict:
+        return {
+            "replicas": {
+                replica.name: {
+                    "healthy": replica.healthy,
+                    "lag": replica.lag,
+                    "reads": replica.reads,
+                    "failures": replica.failures,
+                    "circuit_open": replica.breaker.is_open(),
+                }
+                for replica in self.replicas
+            },
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks,
+            "failovers": self.failovers,
+            "recently_written": len(self._written),
+        }
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.auth.dao import AuthDao
+
+logger = logging.getLogger(__name__)
+
+
+class Denylist:
+    """Revoked token ids ("jti") kept until the token expiry.
+
+    Ids are stored as 64-bit fingerprints in a set, so a lookup is a hash and
+    a set membership test, and an entry takes a small int instead of the id
+    string. A false positive needs two of the ids to share 64 bits. Entries
+    are grouped by expiry in 'bucket' seconds wide buckets, pruning drops
+    whole buckets.
+
+    Args:
+        bucket: expiry bucket width (seconds)
+    """
+
+    def __init__(self, bucket: int = 60):
+        self.bucket = bucket
+        self._fingerprints: set[int] = set()
+        self._expiring: dict[int, list[int]] = {}
+
+    @staticmethod
+    def fingerprint(jti: str) -> int:
+        return int.from_bytes(hashlib.blake2b(jti.encode(), digest_size=8).digest(), "little")
+
+    def add(self, jti: str, expires_at: float):
+        fingerprint = self.fingerprint(jti)
+        if fingerprint in self._fingerprints:
+            return
+        self._fingerprints.add(fingerprint)
+        # bucket by its end, prunable once the end is past
+        bucket_end = math.ceil(expires_at / self.bucket)
+        self._expiring.setdefault(bucket_end, []).append(fingerprint)
+
+    def __contains__(self, jti: str) -> bool:
+        return self.fingerprint(jti) in self._fingerprints
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Drop entries of expired tokens, returns their number."""
+        now = time.time() if now is None else now
+        pruned = 0
+        for bucket_end in [end for end in self._expiring if end * self.bucket <= now]:
+            for fingerprint in self._expiring.pop(bucket_end):
+                self._fingerprints.discard(fingerprint)
+                pruned += 1
+        return pruned
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+
+class TokenRevocations:
+    """Revoked tokens, replicated from the database into a local Denylist.
+
+    Every 'sync_interval' seconds the revocations recorded since the last sync
+    are fetched; the window starts 'overlap' seconds earlier so revocations
+    committed out of order are not missed. A token revoked through another pod
+    is rejected here after one interval at most. Expired revocations are
+    deleted from the database every 'cleanup_interval' seconds.
+
+    Args:
+        dao: storage of the revocations
+        sync_interval: time (seconds) between syncs
+        overlap: time (seconds) each sync window overlaps the previous one
+        cleanup_interval: time (seconds) between deletions of expired revocations
+    """
+
+    def __init__(
+        self,
+        dao: AuthDao,
+        sync_interval: float = 1,
+        overlap: float = 10,
+        cleanup_interval: float = 3600,
+    ):
+        self.dao = dao
+        self.denylist = Denylist()
+        self.sync_interval = sync_interval
+        self.overlap = timedelta(seconds=overlap)
+        self.cleanup_interval = cleanup_interval
+        self.synced_at: Optional[float] = None
+        self._since: Optional[datetime] = None
+        self._cleaned_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.syncs = 0
+        self.failures = 0
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self.denylist
+
+    async def revoke(self, jti: str, expires_at: float):
+        """Record the revocation, effective at once on this pod."""
+        await self.dao.revoke_token(jti, datetime.fromtimestamp(expires_at, timezone.utc))
+        self.denylist.add(jti, expires_at)
+
+    async def sync(self):
+        revocations = await self.dao.get_revocations(self._since)
+        for jti, expires_at, revoked_at in revocations:
+            self.denylist.add(jti, expires_at.replace(tzinfo=timezone.utc).timestamp())
+            since = revoked_at - self.overlap
+            if self._since is None or since > self._since:
+                self._since = since
+        self.denylist.prune()
+        self.synced_at = time.time()
+        self.syncs += 1
+
+    async def start(self):
+        try:
+            await self.sync()
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Token revocations sync failed: {e!r}")
+        self._task = asyncio.create_task(self._sync_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _sync_periodically(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+                if time.monotonic() - self._cleaned_at > self.cleanup_interval:
+                    self._cleaned_at = time.monotonic()
+                    await self.dao.delete_expired_revocations()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Token revocations sync failed: {e!r}")
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.denylist),
+            "syncs": self.syncs,
+            "failures": self.failures,
+            "sync_age": time.time() - self.synced_at if self.synced_at else -1,
+        }
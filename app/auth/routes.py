@@ -1,42 +1,252 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+import math
+import secrets
+from typing import Callable, Optional
 
+import orjson
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Request, Response
+from fastapi.responses import ORJSONResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+from app.auth import bulk
 from app.auth import dependencies as deps
 from app.auth import handlers
-from app.auth.schema import UserCredentials
+from app.auth.admission import Overloaded
+from app.auth.config import import_config, jwt_config, throttle_config
+from app.auth.schema import (
+    ErrorResponse, TokenClaims, TokenResponse, UserCredentials, UserResponse,
+)
+from app.auth.throttle import Throttle, Throttled
+from app.metrics import registry
+from app.utils import CircuitOpen
 
 auth_router = APIRouter(tags=["authentication"], prefix="/api")
+keys_router = APIRouter(tags=["keys"], prefix="/.well-known")
+monitoring_router = APIRouter(tags=["monitoring"])
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+def prebuilt_error(
+    status_code: int, detail: str, headers: Optional[dict] = None
+) -> Callable[[], Response]:
+    """Factory of a constant error response, its body is serialized once.
+
+    Cheaper than raising HTTPException, which goes through the exception
+    handler and serializes the detail on every request.
+    """
+    body = orjson.dumps({"detail": detail})
+
+    def response() -> Response:
+        return Response(body, status_code, headers, media_type="application/json")
+
+    return response
+
+
+invalid_credentials = prebuilt_error(
+    status.HTTP_401_UNAUTHORIZED, "Invalid credentials", {"WWW-Authenticate": "Bearer"}
+)
+invalid_token = prebuilt_error(
+    status.HTTP_401_UNAUTHORIZED, "Invalid token", {"WWW-Authenticate": "Bearer"}
+)
+user_already_exists = prebuilt_error(
+    status.HTTP_422_UNPROCESSABLE_ENTITY, "User already exists"
+)
+unauthorized = {status.HTTP_401_UNAUTHORIZED: {"model": ErrorResponse}}
+too_many_requests = {status.HTTP_429_TOO_MANY_REQUESTS: {"model": ErrorResponse}}
+
+
+def service_unavailable(e: Overloaded | CircuitOpen) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Service overloaded" if isinstance(e, Overloaded) else "Service unavailable",
+        headers={"Retry-After": str(max(math.ceil(e.retry_after), 1))},
+    )
+
+
+def too_many_attempts(e: Throttled) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many attempts",
+        headers={"Retry-After": str(max(math.ceil(e.retry_after), 1))},
+    )
+
+
+def client_address(request: Request) -> Optional[str]:
+    if throttle_config.trust_forwarded:
+        if forwarded := request.headers.get("X-Forwarded-For"):
+            # appended by the ingress, the others are set by the client
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else None
 
 
-@auth_router.post("/login/")
+async def check_throttle(
+    throttle: Optional[Throttle], form_data: UserCredentials, request: Request
+):
+    """Rejects the request before it costs a database lookup or a hash."""
+    if throttle is None:
+        return
+    try:
+        await throttle.check(form_data.email, client_address(request))
+    except Throttled as e:
+        raise too_many_attempts(e)
+
+
+@auth_router.post(
+    "/login/", response_model=TokenResponse, responses=unauthorized | too_many_requests
+)
 async def login(
+        request: Request,
         form_data: UserCredentials,
         dao=Depends(deps.get_dao_provider),
         auth=Depends(deps.get_auth_provider),
         token=Depends(deps.get_token_provider),
+        emails=Depends(deps.get_email_filter),
+        throttle=Depends(deps.get_login_throttle),
 ):
     """Login endpoint."""
 
+    await check_throttle(throttle, form_data, request)
     try:
-        return await handlers.login_handler(form_data, dao, auth, token)
+        result = await handlers.login_handler(form_data, dao, auth, token, emails)
     except handlers.InvalidCredentials:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        return invalid_credentials()
+    except (Overloaded, CircuitOpen) as e:
+        raise service_unavailable(e)
+    # already in the response_model shape, skips its validation and jsonable_encoder
+    return ORJSONResponse(result)
 
 
-@auth_router.post("/sign_up/", status_code=status.HTTP_201_CREATED)
+@auth_router.post(
+    "/sign_up/",
+    status_code=status.HTTP_201_CREATED,
+    response_model=UserResponse,
+    responses=too_many_requests,
+)
 async def sign_up(
+        request: Request,
         form_data: UserCredentials,
         dao=Depends(deps.get_dao_provider),
         auth=Depends(deps.get_auth_provider),
+        emails=Depends(deps.get_email_filter),
+        throttle=Depends(deps.get_sign_up_throttle),
+        idempotency_key: Optional[str] = Header(
+            default=None, alias="Idempotency-Key", max_length=64
+        ),
 ):
-    """New user registration endpoint."""
+    """New user registration endpoint.
+
+    Retrying a request with the same "Idempotency-Key" header returns the
+    original result.
+    """
 
+    await check_throttle(throttle, form_data, request)
     try:
-        return await handlers.sign_up_handler(form_data, dao, auth)
+        return await handlers.sign_up_handler(
+            form_data, dao, auth, emails, idempotency_key
+        )
     except handlers.UserAlreadyExists:
+        return user_already_exists()
+    except handlers.IdempotencyKeyReused:
         raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="User already exists"
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency key reused with other credentials",
         )
+    except (Overloaded, CircuitOpen) as e:
+        raise service_unavailable(e)
+
+
+@auth_router.get("/verify/", response_model=TokenClaims, responses=unauthorized)
+async def verify(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+        token=Depends(deps.get_token_provider),
+):
+    """Bearer token verification endpoint for the API gateway, returns token claims."""
+
+    try:
+        if credentials is None:
+            raise handlers.InvalidToken
+        claims = handlers.verify_handler(credentials.credentials, token)
+    except handlers.InvalidToken:
+        return invalid_token()
+    return ORJSONResponse(claims)
+
+
+@auth_router.post(
+    "/revoke/", status_code=status.HTTP_204_NO_CONTENT, responses=unauthorized
+)
+async def revoke(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+        token=Depends(deps.get_token_provider),
+        revocations=Depends(deps.get_token_revocations),
+):
+    """Revoke the bearer token (logout), every pod rejects it within a second."""
+
+    try:
+        if credentials is None:
+            raise handlers.InvalidToken
+        await handlers.revoke_handler(credentials.credentials, token, revocations)
+    except handlers.InvalidToken:
+        return invalid_token()
+    except handlers.TokenNotRevocable:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Token has no id"
+        )
+    except CircuitOpen as e:
+        raise service_unavailable(e)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@auth_router.post("/users/import/")
+async def import_users(
+        request: Request,
+        import_token: str = Header(alias="X-Import-Token"),
+        dao=Depends(deps.get_dao_provider),
+        auth=Depends(deps.get_auth_provider),
+        emails=Depends(deps.get_email_filter),
+):
+    """Bulk users registration from NDJSON body, one credentials object per line."""
+
+    if not import_config.token or not secrets.compare_digest(
+        import_token, import_config.token
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid import token")
+
+    lines = bulk.iter_lines(request.stream())
+    rows = bulk.import_users(lines, dao, auth, import_config.batch_size, emails)
+    return await bulk.summarize(rows, max_errors=import_config.max_errors)
+
+
+@keys_router.get("/jwks.json")
+async def jwks(request: Request, jwk_set=Depends(deps.get_jwks)):
+    """Public keys to verify issued tokens locally, cacheable by clients."""
+
+    body, etag = jwk_set
+    headers = {"Cache-Control": f"public, max-age={jwt_config.jwks_max_age}", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@monitoring_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics."""
+
+    return Response(
+        content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@monitoring_router.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness probe, answers as long as the event loop runs."""
+
+    return {"status": "ok"}
+
+
+@monitoring_router.get("/readyz", include_in_schema=False)
+async def readyz(health=Depends(deps.get_health_monitor)):
+    """Readiness probe, the result of the last background health check."""
+
+    return ORJSONResponse(
+        content=health.status(),
+        status_code=status.HTTP_200_OK if health.ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
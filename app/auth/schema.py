@@ -1,5 +1,7 @@
 from fastapi import Form
-from pydantic import BaseModel, EmailStr, constr, SecretStr
+from typing import Optional
+
+from pydantic import BaseModel, EmailStr, Extra, constr, SecretStr
 
 
 class UserCredentials(BaseModel):
@@ -10,6 +12,33 @@ class UserCredentials(BaseModel):
         return f"UserCredentials(email='{self.email}')"
 
 
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str
+
+
+class UserResponse(BaseModel):
+    email: EmailStr
+
+    class Config:
+        orm_mode = True
+
+
+class TokenClaims(BaseModel):
+    email: EmailStr
+    exp: int
+    iat: int
+    iss: Optional[str]
+    jti: Optional[str]
+
+    class Config:
+        extra = Extra.allow
+
+
+class ErrorResponse(BaseModel):
+    detail: str
+
+
 class PasswordRequestForm:
     """
     It creates the following Form request parameters in your endpoint:
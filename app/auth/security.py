@@ -1,11 +1,24 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import uuid
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import TypeVar
+from pathlib import Path
+from typing import Container, TypeVar, Optional
 
 import jwt
+from cryptography.hazmat.primitives.serialization import (
+    load_pem_private_key,
+    load_pem_public_key,
+)
 from passlib.hash import argon2
 
-from app.auth.config import JWTConfig
+from app.auth.admission import AdmissionController
+from app.auth.cache import TTLCache
+from app.auth.config import JWTConfig, Argon2Config, argon2_config
 
 
 class BaseToken(ABC):
@@ -25,12 +38,76 @@ class BaseToken(ABC):
 TokenProvider = TypeVar("TokenProvider", bound=BaseToken)
 
 
+class TokenRevoked(jwt.InvalidTokenError):
+    pass
+
+
+class SigningKeys:
+    """Asymmetric (RS256, EdDSA, ...) key set loaded from a directory of PEM files.
+
+    A "<kid>.pem" file holds a private key, "<kid>.pub.pem" the public key of a
+    retired one, still accepted until the tokens it signed expire. Tokens are
+    signed by the 'kid' key, or by the last private key in name order.
+    """
+
+    def __init__(self, keys_dir: str, algorithm: str, kid: Optional[str] = None):
+        self.algorithm = algorithm
+        self.public_keys: dict = {}
+        private_keys: dict = {}
+        for path in sorted(Path(keys_dir).glob("*.pem")):
+            if path.name.endswith(".pub.pem"):
+                key_id = path.name.removesuffix(".pub.pem")
+                self.public_keys[key_id] = load_pem_public_key(path.read_bytes())
+            else:
+                key = load_pem_private_key(path.read_bytes(), password=None)
+                private_keys[path.stem] = key
+                self.public_keys[path.stem] = key.public_key()
+
+        if not private_keys:
+            raise ValueError(f"No private key found in '{keys_dir}'")
+        self.kid = kid or list(private_keys)[-1]
+        self.signing_key = private_keys[self.kid]
+
+    def verifying_key(self, token: str | bytes):
+        kid = jwt.get_unverified_header(token).get("kid")
+        try:
+            return self.public_keys[kid]
+        except KeyError:
+            raise jwt.InvalidSignatureError(f"Unknown signing key: {kid}")
+
+    def jwks(self) -> dict:
+        """Public keys as a JWK set."""
+        algorithm = jwt.get_algorithm_by_name(self.algorithm)
+        keys = []
+        for kid, key in self.public_keys.items():
+            jwk = algorithm.to_jwk(key, as_dict=True)
+            jwk.update(kid=kid, use="sig", alg=self.algorithm)
+            keys.append(jwk)
+        return {"keys": keys}
+
+
 class JWTToken(BaseToken):
-    def __init__(self, config: JWTConfig, typ: str = "bearer"):
+    """JWT provider, signing with the shared 'key' or, if 'keys_dir' is
+    configured, with asymmetric keys identified by the "kid" header.
+
+    Tokens whose "jti" claim is in 'revoked' (e.g. revocation.TokenRevocations)
+    fail verification.
+    """
+
+    def __init__(
+        self,
+        config: JWTConfig,
+        typ: str = "bearer",
+        revoked: Optional[Container[str]] = None,
+    ):
         super().__init__(config, typ)
+        self.revoked = revoked
+        self.keys: Optional[SigningKeys] = None
+        if config.keys_dir:
+            self.keys = SigningKeys(config.keys_dir, config.algorithm, config.kid)
 
     def create_token(self, user_data: dict) -> str:
-        """Generates JWT token with registered claim names: "exp", "iat", "iss".
+        """Generates JWT token with registered claim names: "exp", "iat", "iss", "jti".
 
         Args:
             user_data (dict): user data to add to a payload
@@ -39,20 +116,70 @@ class JWTToken(BaseToken):
             minutes=self.config.expire_min  # type: ignore[arg-type]
         )
 
-        payload = dict(exp=expire, iat=datetime.utcnow(), iss=self.config.issuer)
+        payload = dict(
+            exp=expire, iat=datetime.utcnow(), iss=self.config.issuer, jti=uuid.uuid4().hex
+        )
         payload.update(**user_data)
+        if self.keys is None:
+            key, headers = self.config.key, None
+        else:
+            key, headers = self.keys.signing_key, {"kid": self.keys.kid}
         return jwt.encode(
-            payload=payload, key=self.config.key, algorithm=self.config.algorithm
+            payload=payload, key=key, algorithm=self.config.algorithm, headers=headers
         )
 
     def verify_token(self, token: str | bytes):
+        return self._check_revoked(self.decode(token))
+
+    def decode(self, token: str | bytes) -> dict:
+        """Claims of a token with a valid signature, issuer and expiry."""
+        key = self.config.key if self.keys is None else self.keys.verifying_key(token)
         return jwt.decode(
             jwt=token,
-            key=self.config.key,
+            key=key,
             algorithms=[self.config.algorithm],
             issuer=self.config.issuer,
         )
 
+    def _check_revoked(self, payload: dict) -> dict:
+        if self.revoked is not None:
+            jti = payload.get("jti")
+            if jti is not None and jti in self.revoked:
+                raise TokenRevoked("Token is revoked")
+        return payload
+
+    def jwks(self) -> dict:
+        """Keys to verify tokens with, empty for a shared (HMAC) key."""
+        return {"keys": []} if self.keys is None else self.keys.jwks()
+
+
+class CachedJWTToken(JWTToken):
+    """JWT provider remembering already verified tokens.
+
+    Tokens are keyed by their SHA-256 digest and kept no longer than their
+    "exp" claim, so a hot token skips decoding and signature check. The
+    revocation check is done on every call, a cached token revoked later is
+    rejected too.
+    """
+
+    def __init__(
+        self,
+        config: JWTConfig,
+        cache: TTLCache,
+        typ: str = "bearer",
+        revoked: Optional[Container[str]] = None,
+    ):
+        super().__init__(config, typ, revoked)
+        self.cache = cache
+
+    def verify_token(self, token: str | bytes):
+        key = hashlib.sha256(token.encode() if isinstance(token, str) else token).digest()
+        payload = self.cache.get(key)
+        if payload is None:
+            payload = self.decode(token)
+            self.cache.set(key, payload, expire_at=payload.get("exp"))
+        return dict(self._check_revoked(payload))
+
 
 class BaseAuth(ABC):
     @classmethod
@@ -65,19 +192,109 @@ class BaseAuth(ABC):
     def hash_password(cls, plain_secret: str) -> str:
         pass
 
+    @classmethod
+    def needs_update(cls, hashed_value: str) -> bool:
+        """Whether the hash was made with outdated settings and should be replaced."""
+        return False
+
+    async def averify_password(self, plain_secret: str, hashed_value: str) -> bool:
+        return self.verify_password(plain_secret, hashed_value)
+
+    async def ahash_password(self, plain_secret: str, background: bool = False) -> str:
+        """'background': a low priority hash (bulk import), it gives way to the others."""
+        return self.hash_password(plain_secret)
+
+    async def startup(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
 
 AuthProvider = TypeVar("AuthProvider", bound=BaseAuth)
 
 
+def argon2_hasher(config: Argon2Config):
+    return argon2.using(
+        memory_cost=config.memory_cost,
+        rounds=config.time_cost,
+        parallelism=config.parallelism,
+    )
+
+
 class Argon2Auth(BaseAuth):
+    hasher = argon2_hasher(argon2_config)
+
     @classmethod
     def verify_password(cls, plain_secret: str, hashed_value: str) -> bool:
         try:
-            return argon2.verify(secret=plain_secret, hash=hashed_value)
+            return cls.hasher.verify(secret=plain_secret, hash=hashed_value)
         except ValueError:
             return False
 
     @classmethod
     def hash_password(cls, plain_secret: str) -> str:
         """Hash secret string with auto-generated salt."""
-        return argon2.using(memory_cost=32768).hash(plain_secret)
+        return cls.hasher.hash(plain_secret)
+
+    @classmethod
+    def needs_update(cls, hashed_value: str) -> bool:
+        try:
+            return cls.hasher.needs_update(hashed_value)
+        except ValueError:
+            return False
+
+
+class AsyncArgon2Auth(Argon2Auth):
+    """Argon2 hashing offloaded to a process pool, so the event loop is never
+    blocked by CPU-bound work.
+
+    Args:
+        workers: size of the process pool (defaults to the number of CPUs).
+        admission: if set, bounds concurrent operations by their memory usage
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        admission: Optional[AdmissionController] = None,
+    ):
+        self.workers = workers
+        self.admission = admission
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _run(self, func, *args, background: bool = False):
+        loop = asyncio.get_running_loop()
+        if self.admission is None:
+            return await loop.run_in_executor(self.executor, func, *args)
+        async with self.admission.admit(background):
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    async def averify_password(self, plain_secret: str, hashed_value: str) -> bool:
+        return await self._run(Argon2Auth.verify_password, plain_secret, hashed_value)
+
+    async def ahash_password(self, plain_secret: str, background: bool = False) -> str:
+        return await self._run(Argon2Auth.hash_password, plain_secret, background=background)
+
+    async def startup(self) -> None:
+        """Spawn every worker and make it import the hashing backend upfront,
+        so the first requests do not pay the process start-up cost."""
+        workers = self.workers or os.cpu_count() or 1
+        await asyncio.gather(
+            *(self.ahash_password("warm-up") for _ in range(workers))
+        )
+
+    async def shutdown(self) -> None:
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
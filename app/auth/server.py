@@ -0,0 +1,81 @@
+"""Production entrypoint, gunicorn managing uvicorn worker processes.
+
+With 'SERVER_PRELOAD' the app is imported once by the server process, the
+forked workers share its modules (copy-on-write) and start in milliseconds.
+Each worker then runs the startup phase of 'app.auth.app', which opens its
+connections and hashing processes; the readiness probe passes once all of
+them are done. The import and startup steps durations are logged and exposed
+as 'auth_import_seconds' and 'auth_startup_seconds' metrics.
+
+Usage:
+    python -m app.auth.server
+    # import time of every module
+    python -X importtime -m app.auth.server 2> imports.log
+"""
+import logging
+import sys
+import tempfile
+import time
+
+from gunicorn.app.base import BaseApplication
+
+from app.auth.config import log_config, server_config
+from app.logger import setup_logger
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# set before the fork, every worker has the same value
+import_seconds = registry.gauge(
+    "auth_import_seconds", "Time to import the app.", multiprocess="max"
+)
+
+
+def import_app():
+    start_time = time.perf_counter()
+    modules = len(sys.modules)
+    from app.auth.app import app
+
+    elapsed = time.perf_counter() - start_time
+    import_seconds.set(value=elapsed)
+    logger.info(
+        f"App imported in {elapsed * 1000:.0f} ms, {len(sys.modules) - modules} modules"
+    )
+    return app
+
+
+class AuthServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return import_app()
+
+
+def main():
+    setup_logger(
+        log_config.level,
+        json_format=log_config.json,
+        sampling=log_config.sampling,
+        queue_size=log_config.queue_size,
+    )
+    if server_config.workers > 1:
+        # metrics of a scrape cover every worker, not the one answering it
+        registry.share(tempfile.mkdtemp(prefix="auth-metrics-"), server_config.metrics_interval)
+    AuthServer({
+        "bind": f"{server_config.host}:{server_config.port}",
+        "workers": server_config.workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": server_config.preload,
+        "timeout": server_config.timeout,
+        "graceful_timeout": server_config.graceful_timeout,
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
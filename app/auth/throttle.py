@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Throttled(BaseException):
+    """Too many attempts, retry after 'retry_after' seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class WindowCounters(ABC):
+    """Attempts of every key counted in fixed windows."""
+
+    @abstractmethod
+    async def incr(self, key: str, index: int) -> tuple[int, int]:
+        """Count an attempt in the window 'index', returns (previous, current) window counts."""
+
+    def evict(self, index: int) -> int:
+        """Drop keys idle since before the window 'index', returns their number."""
+        return 0
+
+    def __len__(self) -> int:
+        return 0
+
+
+class LocalWindowCounters(WindowCounters):
+    """In-process counters, a [window index, previous count, current count] list per key."""
+
+    def __init__(self):
+        self._counters: dict[str, list[int]] = {}
+
+    async def incr(self, key: str, index: int) -> tuple[int, int]:
+        counter = self._counters.get(key)
+        if counter is None:
+            self._counters[key] = [index, 0, 1]
+            return 0, 1
+        if counter[0] != index:
+            counter[1] = counter[2] if counter[0] == index - 1 else 0
+            counter[0], counter[2] = index, 0
+        counter[2] += 1
+        return counter[1], counter[2]
+
+    def evict(self, index: int) -> int:
+        # nothing counted in this window nor the previous one, the estimate is 0
+        idle = [key for key, counter in self._counters.items() if counter[0] < index - 1]
+        for key in idle:
+            del self._counters[key]
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+class RedisWindowCounters(WindowCounters):
+    """Counters shared by every replica, one Redis key per key and window.
+
+    Keys expire on their own two windows after they were last counted.
+
+    Args:
+        client: redis.asyncio.Redis client
+        prefix: prefix of the Redis keys
+        window: window width (seconds)
+    """
+
+    def __init__(self, client, prefix: str, window: float):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = math.ceil(window * 2)
+
+    async def incr(self, key: str, index: int) -> tuple[int, int]:
+        current = f"{self.prefix}:{key}:{index}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.incr(current)
+            pipe.expire(current, self.ttl)
+            pipe.get(f"{self.prefix}:{key}:{index - 1}")
+            count, _, previous = await pipe.execute()
+        return int(previous or 0), int(count)
+
+
+class SlidingWindowLimiter:
+    """At most 'limit' attempts of a key in any 'window' seconds.
+
+    The sliding window is estimated from two fixed window counts: the
+    previous count weighted by the part of it still in the sliding window,
+    plus the current count. Every attempt is counted, rejected ones too, so
+    a client keeps being rejected as long as it keeps trying.
+
+    Args:
+        limit: max number of attempts in a window
+        window: window width (seconds)
+        counters: storage of the counts, in-process by default
+    """
+
+    def __init__(
+        self, limit: int, window: float, counters: Optional[WindowCounters] = None
+    ):
+        self.limit = limit
+        self.window = window
+        self.counters = counters if counters is not None else LocalWindowCounters()
+        self.allowed = 0
+        self.throttled = 0
+
+    async def acquire(self, key: str):
+        """Count an attempt, raises Throttled if the key is over the limit."""
+        index, elapsed = divmod(time.time(), self.window)
+        previous, current = await self.counters.incr(key, int(index))
+        if previous * (1 - elapsed / self.window) + current <= self.limit:
+            self.allowed += 1
+            return
+        self.throttled += 1
+        raise Throttled(self._retry_after(previous, current, elapsed))
+
+    def _retry_after(self, previous: int, current: int, elapsed: float) -> float:
+        # time until one more attempt fits, if no other one is made meanwhile
+        room = self.limit - 1
+        if current <= room:
+            # the previous window weight has to decay
+            return self.window * (1 - (room - current) / previous) - elapsed
+        # next window, the current one becomes the previous
+        return self.window - elapsed + self.window * (1 - room / current)
+
+    def evict(self) -> int:
+        return self.counters.evict(int(time.time() // self.window))
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.counters),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+        }
+
+
+class Throttle:
+    """Attempts limits of an endpoint per email and per client address.
+
+    Checked before any database or hashing work, so a client iterating
+    passwords, or emails, costs a dictionary lookup per attempt once
+    throttled. Counters of keys idle for a window are evicted every window.
+    The counters backend failing lets attempts through.
+
+    Args:
+        email: limiter of the attempts per email
+        client: limiter of the attempts per client address
+
+    Example:
+        >>> throttle = Throttle(SlidingWindowLimiter(10, 60), SlidingWindowLimiter(100, 60))
+        >>> await throttle.check("user@example.com", "203.0.113.7")
+    """
+
+    def __init__(self, email: SlidingWindowLimiter, client: SlidingWindowLimiter):
+        self.limiters = {"email": email, "client": client}
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self, email: str, client: Optional[str]):
+        """Count the attempt, raises Throttled if one of its keys is over the limit."""
+        keys = {"email": email.lower(), "client": client}
+        try:
+            for name, limiter in self.limiters.items():
+                if keys[name] is not None:
+                    await limiter.acquire(keys[name])
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Throttle check failed: {e!r}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._evict_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _evict_periodically(self):
+        interval = min(limiter.window for limiter in self.limiters.values())
+        while True:
+            await asyncio.sleep(interval)
+            for limiter in self.limiters.values():
+                limiter.evict()
+
+    def stats(self) -> dict:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
@@ -1,19 +1,196 @@
+import atexit
+import contextvars
+import json
 import logging
+import os
+import queue
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
 
 LOG_FORMAT = "%(levelname)s: [%(asctime)s.%(msecs)03d] %(message)s"
 LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
 log_formatter = logging.Formatter(fmt=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
 
+# id of the request being served, added to its log records
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with the request id and the 'extra' fields."""
+
+    # attributes every record has, the others were passed as 'extra'
+    reserved = set(vars(logging.makeLogRecord({}))) | {"message", "request_id"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None) is not None:
+            entry["request_id"] = record.request_id  # type: ignore[attr-defined]
+        for key, value in vars(record).items():
+            if key not in self.reserved:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """At most 'rate' records per second of a noisy logger (and its children).
+
+    Records of WARNING and above always pass. Every logger is a token bucket
+    refilled at its rate, holding up to one second of records.
+
+    Args:
+        rates: records per second by logger name, e.g. {"sqlalchemy.engine": 10}
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+        self._buckets: dict[str, list[float]] = {}  # [tokens, last refill]
+        self._sampled: dict[str, Optional[str]] = {}  # record logger -> sampled logger
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        name = self._sampled.get(record.name, "")
+        if name == "":
+            name = self._sampled[record.name] = self._sampled_logger(record.name)
+        if name is None:
+            return True
+
+        rate = self.rates[name]
+        now = time.monotonic()
+        bucket = self._buckets.setdefault(name, [rate, now])
+        bucket[0] = min(bucket[0] + (now - bucket[1]) * rate, rate)
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        self.sampled_out += 1
+        return False
+
+    def _sampled_logger(self, name: str) -> Optional[str]:
+        while name not in self.rates:
+            if "." not in name:
+                return None
+            name = name.rsplit(".", 1)[0]
+        return name
+
+
+class AppQueueHandler(QueueHandler):
+    """Puts records on a queue, formatted and written by a QueueListener.
+
+    Only the request id, which depends on the calling task, is resolved
+    here; even the message is built in the listener thread, so arguments
+    must not be changed after the logging call. Beyond 'max_size' queued
+    records (the output is stuck) records are dropped instead of blocking.
+    """
+
+    def __init__(self, queue_: queue.SimpleQueue, max_size: int = 10000):
+        super().__init__(queue_)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()  # type: ignore[attr-defined]
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(record)
+
+
+_listener: Optional[QueueListener] = None
+_listener_pid: Optional[int] = None
+
+
+def stop_listener():
+    """Write the queued records and stop the listener thread."""
+    global _listener
+    # a forked worker inherits the listener object, not its thread
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+
+
+atexit.register(stop_listener)
+
 
 def setup_logger(
-    log_level: int = logging.INFO, formatter: logging.Formatter = log_formatter
+    log_level: int = logging.INFO,
+    formatter: logging.Formatter = log_formatter,
+    json_format: bool = False,
+    sampling: Optional[dict[str, float]] = None,
+    queue_size: int = 10000,
+    stream: Optional[TextIO] = None,
 ):
-    # set level for root logger
+    """Root logger writing to stderr (or 'stream') from a background thread.
+
+    The thread logging a record only puts it on a queue, a QueueListener
+    thread formats and writes it, so the event loop never waits for the
+    output. Calling it again replaces the handler and its listener, e.g. in
+    a forked worker, which needs its own listener thread.
+
+    Args:
+        log_level: level of the root logger
+        formatter: text formatter, unless 'json_format'
+        json_format: one JSON object per line (JSONFormatter)
+        sampling: records per second of noisy loggers below WARNING
+        queue_size: max number of records waiting to be written
+        stream: output, stderr by default
+    """
+    global _listener, _listener_pid
     logger = logging.getLogger()
     logger.setLevel(log_level)
 
-    handler = logging.StreamHandler()
-    handler.setFormatter(formatter)
+    stop_listener()
+    for old_handler in logger.handlers[:]:
+        if getattr(old_handler, "app_handler", False):
+            logger.removeHandler(old_handler)
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JSONFormatter() if json_format else formatter)
+    output.setLevel(log_level)
+
+    handler = AppQueueHandler(queue.SimpleQueue(), queue_size)
+    handler.app_handler = True  # type: ignore[attr-defined]
     handler.setLevel(log_level)
+    if sampling:
+        handler.addFilter(SamplingFilter(sampling))
     logger.addHandler(handler)
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener_pid = os.getpid()
+    _listener.start()
     return logger
+
+
+def log_stats() -> dict:
+    """Queue depth, dropped and sampled out records of the app handler."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, AppQueueHandler):
+            sampled_out = sum(
+                f.sampled_out for f in handler.filters if isinstance(f, SamplingFilter)
+            )
+            return {
+                "queue_depth": handler.queue.qsize(),
+                "dropped": handler.dropped,
+                "sampled_out": sampled_out,
+            }
+    return {}
@@ -0,0 +1,361 @@
+import asyncio
+import functools
+import json
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Sequence
+
+# seconds, from a cached token check to a slow password hash
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        """(name suffix, formatted labels, value) of every time series."""
+
+    def snapshot(self) -> dict:
+        """JSON serializable state, see 'from_snapshot'."""
+        return {
+            "name": self.name,
+            "type": self.type,
+            "documentation": self.documentation,
+            "labelnames": self.labelnames,
+            "values": [[labels, value] for labels, value in self.values.items()],  # type: ignore
+        }
+
+    @abstractmethod
+    def merge(self, values: Iterable[tuple[Sequence[str], object]]):
+        """Add values of the same metric from another process."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing value.
+
+    Example:
+        >>> requests = Counter("requests_total", "Requests.", ["route"])
+        >>> requests.inc("/api/login/")
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield "", _format_labels(self.labelnames, labels), value
+
+    def merge(self, values):
+        for labels, value in values:
+            self.inc(*labels, amount=value)
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. set from component stats at scrape time.
+
+    'multiprocess' sets how the values of processes sharing a registry merge:
+    "sum" for amounts of the pod (connections), "max" or "min" for values
+    that do not add up (lag, ratios, durations), "all" keeps one series per
+    process with a "pid" label.
+    """
+
+    type = "gauge"
+    modes = ("all", "sum", "max", "min")
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        multiprocess: str = "all",
+    ):
+        if multiprocess not in self.modes:
+            raise ValueError(f"Unknown multiprocess mode: {multiprocess}")
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess = multiprocess
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot() | {"multiprocess": self.multiprocess}
+        if self.multiprocess == "all":
+            pid = str(os.getpid())
+            snapshot["labelnames"] = self.labelnames + ("pid",)
+            snapshot["values"] = [
+                [[*labels, pid], value] for labels, value in self.values.items()
+            ]
+        return snapshot
+
+    def merge(self, values):
+        for labels, value in values:
+            labels = tuple(labels)
+            if labels not in self.values or self.multiprocess == "all":
+                self.values[labels] = value
+            elif self.multiprocess == "sum":
+                self.values[labels] += value
+            elif self.multiprocess == "max":
+                self.values[labels] = max(self.values[labels], value)
+            else:
+                self.values[labels] = min(self.values[labels], value)
+
+
+class Histogram(Metric):
+    """Distribution of observed values (latencies) in cumulative buckets.
+
+    Example:
+        >>> latency = Histogram("query_seconds", "Query latency.", ["query"])
+        >>> with latency.time("get_credentials"):
+        >>>    ...
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per labels: [count per bucket (+Inf last), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        # the first bucket with 'le' >= value
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, *labels)
+
+    def timed(self, *labels: str):
+        """Decorator observing the duration of every call of an async function."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapped_f(*args, **kwargs):
+                start_time = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start_time, *labels)
+
+            return wrapped_f
+
+        return decorator
+
+    def snapshot(self) -> dict:
+        return super().snapshot() | {"buckets": self.buckets}
+
+    def merge(self, values):
+        for labels, (counts, total) in values:
+            series = self.values.setdefault(
+                tuple(labels), [[0] * (len(self.buckets) + 1), 0.0]
+            )
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+
+    def samples(self):
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for le, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucket = _format_labels(self.labelnames, labels, f'le="{_format_value(le)}"')
+                yield "_bucket", bucket, cumulative
+            formatted = _format_labels(self.labelnames, labels)
+            yield "_sum", formatted, total
+            yield "_count", formatted, cumulative
+
+
+def from_snapshot(data: dict) -> Metric:
+    """Empty metric of the 'snapshot' kind, its values are added by 'merge'."""
+    if data["type"] == "histogram":
+        return Histogram(data["name"], data["documentation"], data["labelnames"], data["buckets"])
+    if data["type"] == "gauge":
+        return Gauge(
+            data["name"], data["documentation"], data["labelnames"], data["multiprocess"]
+        )
+    return Counter(data["name"], data["documentation"], data["labelnames"])
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Metrics exposed together in the Prometheus text format.
+
+    Updates are plain dict and list operations without locks, as they all run
+    on the event loop thread, so metrics are cheap enough for the hot path.
+    Collectors are called at scrape time, so stats kept by components (pools,
+    caches) are only converted when somebody asks for them.
+
+    Metrics are kept by every process, a server with several workers 'share's
+    them: each worker writes its snapshot to a common directory every
+    'interval' seconds and the one serving a scrape merges all snapshots, so
+    counters are totals of the pod and gauges are merged by their
+    'multiprocess' mode.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: list[Callable[[], Iterable[Metric]]] = []
+        self.shared_dir: Optional[Path] = None
+        self.share_interval: float = 5
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))  # type: ignore
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        multiprocess: str = "all",
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, multiprocess))  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None,
+    ) -> Histogram:
+        histogram = Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS)
+        return self.register(histogram)  # type: ignore
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]]):
+        self.collectors.append(collector)
+
+    def collect(self) -> list[Metric]:
+        metrics = list(self.metrics.values())
+        for collector in self.collectors:
+            metrics.extend(collector())
+        return metrics
+
+    def render(self) -> str:
+        metrics = self.collect()
+        if self.shared_dir is not None:
+            metrics = self._merge_processes(metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def share(self, directory: str, interval: float = 5):
+        """Aggregate metrics of the processes (forked workers) sharing 'directory'."""
+        self.shared_dir = Path(directory)
+        self.share_interval = interval
+
+    def dump(self, metrics: Optional[list[Metric]] = None):
+        """Write the snapshot of this process."""
+        assert self.shared_dir is not None
+        path = self.shared_dir / f"{os.getpid()}.json"
+        tmp_path = path.with_suffix(".tmp")
+        snapshot = [metric.snapshot() for metric in metrics or self.collect()]
+        tmp_path.write_text(json.dumps(snapshot))
+        # readers never see a partially written file
+        os.replace(tmp_path, path)
+
+    def _merge_processes(self, metrics: list[Metric]) -> list[Metric]:
+        self.dump(metrics)
+        merged: dict[str, Metric] = {}
+        for path in self.shared_dir.glob("*.json"):  # type: ignore[union-attr]
+            if not _alive(int(path.stem)):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for data in snapshot:
+                if data["name"] not in merged:
+                    merged[data["name"]] = from_snapshot(data)
+                merged[data["name"]].merge(data["values"])
+        return list(merged.values())
+
+    async def start_sharing(self):
+        if self.shared_dir is None:
+            return
+        self.dump()
+        self._task = asyncio.create_task(self._dump_periodically())
+
+    async def stop_sharing(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        (self.shared_dir / f"{os.getpid()}.json").unlink(missing_ok=True)  # type: ignore
+
+    async def _dump_periodically(self):
+        while True:
+            await asyncio.sleep(self.share_interval)
+            self.dump()
+
+
+registry = Registry()
@@ -1,15 +1,123 @@
 import asyncio
+import functools
 import logging
-from typing import Type, Any, Union, Tuple
+import random
+import time
+from dataclasses import dataclass
+from typing import Type, Any, Union, Tuple, Optional
+
+from app.metrics import Counter, registry
 
 logger = logging.getLogger(__name__)
 
 
+class CircuitOpen(Exception):
+    """Call rejected without trying, the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"circuit open, retry after {retry_after:.1f} sec.")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fails fast while a shared dependency (e.g. database) is known to be down.
+
+    After 'failure_threshold' consecutive failures the circuit opens and calls are
+    rejected with CircuitOpen for 'reset_timeout' seconds. Then it is half-open:
+    a single probe call goes through, its success closes the circuit and its
+    failure opens it again.
+
+    Args:
+        failure_threshold: consecutive failures to open the circuit
+        reset_timeout: time (seconds) the circuit stays open before a probe
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def is_open(self) -> bool:
+        """Open and not due for a probe yet, without changing the state."""
+        if self.state == self.CLOSED:
+            return False
+        return time.monotonic() < self.opened_at + self.reset_timeout
+
+    def before_call(self):
+        if self.state == self.CLOSED:
+            return
+        retry_after = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == self.OPEN and retry_after <= 0:
+            self.state = self.HALF_OPEN
+            return
+        # open, or half-open with the probe still running
+        raise CircuitOpen(max(retry_after, 0))
+
+    def on_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def on_inconclusive(self):
+        # a probe interrupted, or failed before reaching the resource, proves
+        # nothing, let the next call probe again
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+
+    def on_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+@dataclass
+class RetryStats:
+    calls: int = 0
+    retries: int = 0
+    failures: int = 0
+    rejected: int = 0
+
+
+# per decorated function, keyed by "module.qualname"
+retry_stats: dict[str, RetryStats] = {}
+
+
+def collect_retry_stats():
+    metrics = {
+        field: Counter(f"retry_{field}_total", doc, ["function"])
+        for field, doc in (
+            ("calls", "Calls of functions decorated with Retry."),
+            ("retries", "Retries fired by Retry."),
+            ("failures", "Calls failed after the last attempt."),
+            ("rejected", "Calls rejected by an open circuit breaker."),
+        )
+    }
+    for function, stats in retry_stats.items():
+        if not stats.calls:
+            continue
+        for field, counter in metrics.items():
+            counter.inc(function, amount=getattr(stats, field))
+    return metrics.values()
+
+
+registry.add_collector(collect_retry_stats)
+
+
 class Retry:
     """Retrying async decorated function on exception.
 
         Options 'on_exc' and 'exclude_exc' will match exact exception type you pass
-        regardless of exception hierarchy. Do not set both.
+        regardless of exception hierarchy, unless 'subclasses' is set. Do not set both.
+
+        Delay before the n-th retry is 'delay * backoff ** (n - 1)', capped by
+        'max_delay'. With 'jitter' the actual delay is random between 0 and that
+        value ("full jitter"), so clients failing together do not retry in lockstep.
 
         Args:
             attempts: how many times to try
@@ -17,6 +125,14 @@ class Retry:
             on_exc: a collection of exception type to retry only.
             exclude_exc: does not retry on the given exceptions.
             If 'on_exc' and 'exclude_exc' not set then retry always.
+            backoff: multiplier applied to the delay after every retry
+            max_delay: upper bound (seconds) of a single delay
+            jitter: randomize delays
+            deadline: total time budget (seconds), no retry is scheduled past it
+            breaker: circuit breaker shared by functions using the same resource,
+            only retryable exceptions count as its failures and only returned
+            calls as its successes
+            subclasses: 'on_exc' and 'exclude_exc' match subclasses of their types too
 
         Example:
             >>> @Retry(attempts=3, exclude_exc=(ConnectionError,))
@@ -30,40 +146,100 @@ class Retry:
         delay: int | float = 2,
         on_exc: Union[Tuple, Tuple[Type[Any]]] = (),
         exclude_exc: Union[Tuple, Tuple[Type[Any]]] = (),
+        backoff: float = 1,
+        max_delay: Optional[float] = None,
+        jitter: bool = False,
+        deadline: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        subclasses: bool = False,
     ):
         self.attempts = attempts + 1
         self.delay = delay
         self.include_exc = on_exc
         self.exclude_exc = exclude_exc
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.breaker = breaker
+        self.subclasses = subclasses
 
     def __call__(self, func):
+        stats = retry_stats.setdefault(f"{func.__module__}.{func.__qualname__}", RetryStats())
+
+        @functools.wraps(func)
         async def wrapped_f(*args, **kwargs):
             retry_left = self.attempts
+            deadline = self.deadline and time.monotonic() + self.deadline
+            stats.calls += 1
 
             while retry_left > 0:
                 retry_left -= 1
+                if self.breaker is not None:
+                    try:
+                        self.breaker.before_call()
+                    except CircuitOpen:
+                        stats.rejected += 1
+                        raise
                 try:
-                    return await func(*args, **kwargs)
+                    result = await func(*args, **kwargs)
                 except Exception as e:
-                    if retry_left == 0 or self._stop_retry(e):
+                    stop_retry = self._stop_retry(e)
+                    if self.breaker is not None:
+                        if stop_retry:
+                            self.breaker.on_inconclusive()
+                        else:
+                            self.breaker.on_failure()
+                    delay = self._next_delay(self.attempts - retry_left)
+                    if (
+                        retry_left == 0
+                        or stop_retry
+                        or (deadline and time.monotonic() + delay > deadline)
+                    ):
+                        stats.failures += 1
                         raise
+                    stats.retries += 1
                     logger.debug(
                         f"<{e.__class__.__name__}> raised while running '{func.__name__}': "
-                        f"retrying after {self.delay} sec. (attempts={retry_left})"
+                        f"retrying after {delay:.2f} sec. (attempts={retry_left})"
                     )
-                if self.delay:
-                    await asyncio.sleep(self.delay)
+                except BaseException:
+                    # cancelled, or stopped by the caller's own errors (Overloaded,
+                    # InvalidCredentials) without a round trip to the resource
+                    if self.breaker is not None:
+                        self.breaker.on_inconclusive()
+                    raise
+                else:
+                    if self.breaker is not None:
+                        self.breaker.on_success()
+                    return result
+                if delay:
+                    await asyncio.sleep(delay)
         return wrapped_f
 
+    def _next_delay(self, retry: int) -> float:
+        """Delay before the given retry (1-based)."""
+        delay = self.delay * self.backoff ** (retry - 1)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
     def _stop_retry(self, exp) -> bool:
         """Check if exception match given conditions for retry."""
 
         if not self.include_exc and not self.exclude_exc:
             return False
 
-        if self.include_exc and exp.__class__ not in self.include_exc:
+        if self.include_exc and not self._match(exp, self.include_exc):
             return True
 
-        if self.exclude_exc and exp.__class__ in self.exclude_exc:
+        if self.exclude_exc and self._match(exp, self.exclude_exc):
             return True
         return False
+
+    def _match(self, exp, exc_types) -> bool:
+        if self.subclasses:
+            return isinstance(exp, tuple(exc_types))
+        return exp.__class__ in exc_types
@@ -1,12 +1,270 @@
+"""Load test scenarios of the auth service.
+
+Every scenario logs in as the users seeded with the same prefix, password and
+count, run against a local Postgres or the SQLite stand-in:
+
+    export POSTGRES_DRIVER=sqlite+aiosqlite POSTGRES_DATABASE=/tmp/auth.db
+    python -m app.auth.cli seed-users --count 10000 --create-tables
+    # every simulated user comes from one address, and DuplicateSignUpUser
+    # signs up every race email more often than the per-email default allows
+    export THROTTLE_LOGIN_CLIENT_LIMIT=1000000 THROTTLE_SIGN_UP_CLIENT_LIMIT=1000000
+    export THROTTLE_SIGN_UP_EMAIL_LIMIT=1000000
+    uvicorn app.auth.app:app --port 8080
+
+    locust --headless -u 100 -r 20 -t 2m --host http://localhost:8080 LoginHeavyUser
+    locust --headless -u 50 -r 50 -t 1m --host http://localhost:8080 CredentialStuffingUser
+    locust --headless -u 20 -r 20 -t 1m --host http://localhost:8080 DuplicateSignUpUser
+    locust --headless -u 200 -r 50 -t 1m --host http://localhost:8080 VerifyFloodUser
+
+At the end of the run p50/p95/p99 latency and error rate of every request
+name are checked against SLOS (or the '--slo-file' JSON with the same
+layout); locust exits with 1 if one is exceeded. Responses a scenario
+expects (401 for a wrong password, 422 for a duplicate sign-up, 429 for a
+throttled credential stuffing attempt) are not errors, any other status is.
+"""
+import json
+import os
+import random
+import time
 import uuid
+from typing import NamedTuple, Optional
+
+from locust import HttpUser, between, constant, events, task
+
+login_route = "/api/login/"
+sign_up_route = "/api/sign_up/"
+verify_route = "/api/verify/"
+
+# same defaults as 'python -m app.auth.cli seed-users'
+SEED_PREFIX = os.getenv("LOAD_SEED_PREFIX", default="load")
+SEED_PASSWORD = os.getenv("LOAD_SEED_PASSWORD", default="load-password")
+SEED_COUNT = int(os.getenv("LOAD_SEED_COUNT", default=10000))
+
+
+def seed_email(number: int) -> str:
+    return f"{SEED_PREFIX}-{number}@example.com"
+
+
+def random_seed_email() -> str:
+    return seed_email(random.randrange(SEED_COUNT))
+
+
+def new_email() -> str:
+    return f"new-{uuid.uuid4().hex[:16]}@example.com"
+
+
+class SLO(NamedTuple):
+    p50: float  # ms
+    p95: float
+    p99: float
+    error_rate: float
+
+
+# by request name, login and sign-up are bound by the password hash cost
+SLOS = {
+    "login": SLO(p50=150, p95=400, p99=800, error_rate=0.01),
+    "login (wrong password)": SLO(p50=150, p95=400, p99=800, error_rate=0.01),
+    "login (unknown email)": SLO(p50=150, p95=400, p99=800, error_rate=0.01),
+    "sign_up": SLO(p50=150, p95=400, p99=800, error_rate=0.01),
+    "sign_up (race)": SLO(p50=150, p95=500, p99=1000, error_rate=0.01),
+    "verify": SLO(p50=10, p95=25, p99=50, error_rate=0.001),
+    "verify (invalid token)": SLO(p50=10, p95=25, p99=50, error_rate=0.001),
+}
+
+
+class AuthClient(HttpUser):
+    abstract = True
+
+    def post_credentials(self, route: str, name: str, email: str, password: str,
+                         expected: tuple[int, ...], headers: Optional[dict] = None):
+        with self.client.post(
+            route,
+            json={"email": email, "password": password},
+            headers=headers,
+            name=name,
+            catch_response=True,
+        ) as response:
+            if response.status_code in expected:
+                response.success()
+            else:
+                response.failure(f"status {response.status_code}")
+            return response
+
+    def login(self, email: str, password: str = SEED_PASSWORD) -> Optional[str]:
+        response = self.post_credentials(login_route, "login", email, password, (200,))
+        if response.status_code != 200:
+            return None
+        return response.json()["access_token"]
+
+    def verify(self, token: str, name: str = "verify", expected: int = 200):
+        with self.client.get(
+            verify_route,
+            headers={"Authorization": f"Bearer {token}"},
+            name=name,
+            catch_response=True,
+        ) as response:
+            if response.status_code == expected:
+                response.success()
+            else:
+                response.failure(f"status {response.status_code}")
+
+
+class LoginHeavyUser(AuthClient):
+    """Steady state: mostly logins and token checks, few failed logins and sign-ups."""
+
+    wait_time = between(0.5, 2)
+
+    def on_start(self):
+        self.token = self.login(random_seed_email())
+
+    @task(8)
+    def login_seeded_user(self):
+        self.token = self.login(random_seed_email()) or self.token
+
+    @task(10)
+    def verify_token(self):
+        if self.token:
+            self.verify(self.token)
+
+    @task(1)
+    def login_wrong_password(self):
+        self.post_credentials(
+            login_route, "login (wrong password)", random_seed_email(), "wrong-password", (401,)
+        )
+
+    @task(1)
+    def sign_up(self):
+        self.post_credentials(sign_up_route, "sign_up", new_email(), SEED_PASSWORD, (201,))
+
+
+class CredentialStuffingUser(AuthClient):
+    """Burst of logins with leaked emails and wrong passwords, no think time.
+
+    Half of the emails are registered, each attempt costs a password hash
+    unless the email filter rejects unknown emails first, or the per-email
+    throttle rejects it with 429 before any work.
+    """
+
+    wait_time = constant(0)
+
+    @task(1)
+    def login_wrong_password(self):
+        self.post_credentials(
+            login_route,
+            "login (wrong password)",
+            random_seed_email(),
+            uuid.uuid4().hex[:12],
+            (401, 429),
+        )
+
+    @task(1)
+    def login_unknown_email(self):
+        self.post_credentials(
+            login_route, "login (unknown email)", new_email(), uuid.uuid4().hex[:12], (401, 429)
+        )
+
+
+class DuplicateSignUpUser(AuthClient):
+    """Concurrent sign-ups of the same email, e.g. a double submitted form.
+
+    All users of the run sign up the email of the current 'race_window'; each
+    attempt must get 201 or 422 (the scenario does not count how many got 201,
+    it loads the duplicate check rather than asserting on it). Retries with the
+    same Idempotency-Key get the original 201.
+    """
+
+    wait_time = between(0, 0.2)
+    race_window = 1  # seconds
+    # shared by the workers of a distributed run, so they race on the same emails
+    run_id = os.getenv("LOAD_RUN_ID", default=uuid.uuid4().hex[:8])
+
+    def race_email(self) -> str:
+        return f"race-{self.run_id}-{int(time.time() / self.race_window)}@example.com"
+
+    @task(3)
+    def sign_up_same_email(self):
+        self.post_credentials(
+            sign_up_route, "sign_up (race)", self.race_email(), SEED_PASSWORD, (201, 422)
+        )
+
+    @task(1)
+    def sign_up_retried(self):
+        email, headers = new_email(), {"Idempotency-Key": uuid.uuid4().hex}
+        for _ in range(2):
+            self.post_credentials(
+                sign_up_route, "sign_up", email, SEED_PASSWORD, (201,), headers=headers
+            )
+
+
+class VerifyFloodUser(AuthClient):
+    """API gateway checking the bearer token of every request, no think time."""
+
+    wait_time = constant(0)
+
+    def on_start(self):
+        self.token = self.login(random_seed_email())
+
+    @task(20)
+    def verify_token(self):
+        if self.token:
+            self.verify(self.token)
+
+    @task(1)
+    def verify_invalid_token(self):
+        self.verify(uuid.uuid4().hex, name="verify (invalid token)", expected=401)
+
+
+@events.init_command_line_parser.add_listener
+def add_slo_arguments(parser):
+    parser.add_argument("--slo-file", default="", help="JSON SLOs by request name")
+    parser.add_argument("--slo-report", default="", help="write the SLO check results to a file")
+
+
+def load_slos(path: str) -> dict[str, SLO]:
+    if not path:
+        return SLOS
+    with open(path) as file:
+        return {name: SLO(**slo) for name, slo in json.load(file).items()}
+
+
+def check_slos(stats, slos: dict[str, SLO]) -> list[dict]:
+    results = []
+    for name, slo in slos.items():
+        entry = stats.entries.get((name, "POST")) or stats.entries.get((name, "GET"))
+        if entry is None or not entry.num_requests:
+            continue
+        measured = {
+            "p50": entry.get_response_time_percentile(0.5),
+            "p95": entry.get_response_time_percentile(0.95),
+            "p99": entry.get_response_time_percentile(0.99),
+            "error_rate": entry.fail_ratio,
+        }
+        breaches = [key for key, value in measured.items() if value > getattr(slo, key)]
+        results.append({
+            "name": name,
+            "requests": entry.num_requests,
+            **measured,
+            "slo": slo._asdict(),
+            "breaches": breaches,
+        })
+    return results
 
-from locust import HttpUser, task
 
-sing_in_route = "/api/sign_up/"
+@events.quitting.add_listener
+def gate_on_slos(environment, **kwargs):
+    options = environment.parsed_options
+    results = check_slos(environment.stats, load_slos(options.slo_file if options else ""))
 
+    for result in results:
+        print(
+            f"{result['name']:<24} {result['requests']:>8} req  p50 {result['p50']:>6.0f} ms"
+            f"  p95 {result['p95']:>6.0f} ms  p99 {result['p99']:>6.0f} ms"
+            f"  errors {result['error_rate']:.2%}"
+            + (f"  SLO exceeded: {', '.join(result['breaches'])}" if result["breaches"] else "")
+        )
+    if options and options.slo_report:
+        with open(options.slo_report, "w") as file:
+            json.dump(results, file, indent=2)
 
-class AuthUser(HttpUser):
-    @task
-    def register_user(self):
-        data = {"email": f"user{uuid.uuid4().time}@mail.ru", "password": "superpassword"}
-        self.client.post(url=sing_in_route, json=data)
+    if any(result["breaches"] for result in results):
+        environment.process_exit_code = 1
@@ -0,0 +1,57 @@
+"""covering indexes for the login credentials lookup
+
+Revision ID: 2c1f0a7d9e3b
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+from app.auth.config import pg_config
+
+# revision identifiers, used by Alembic.
+revision = "2c1f0a7d9e3b"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+schema = pg_config.schema
+
+# (table, index, key column, included column)
+indexes = [
+    ("users", "ix_users_email", "email", "id"),
+    ("pwdhashes", "ix_pwdhashes_user_id", "user_id", "value"),
+]
+
+
+def _legacy_name(table, column):
+    # name given by SQLAlchemy to the former 'index=True' columns, it includes
+    # the schema of the MetaData
+    return f"ix_{schema}_{table}_{column}" if schema else f"ix_{table}_{column}"
+
+
+def _replace_index(table, names, name, column, include):
+    # build the new index aside first so uniqueness is never left unenforced
+    op.create_index(
+        f"{name}_tmp",
+        table,
+        [column],
+        unique=True,
+        schema=schema,
+        postgresql_include=include,
+    )
+    prefix = f'"{schema}".' if schema else ""
+    for old_name in names:
+        op.execute(f'DROP INDEX IF EXISTS {prefix}"{old_name}"')
+    op.execute(f'ALTER INDEX {prefix}"{name}_tmp" RENAME TO "{name}"')
+
+
+def upgrade() -> None:
+    for table, name, column, include in indexes:
+        names = (_legacy_name(table, column), name)
+        _replace_index(table, names, name, column, [include])
+
+
+def downgrade() -> None:
+    for table, name, column, _ in indexes:
+        _replace_index(table, (name,), _legacy_name(table, column), column, [])
@@ -0,0 +1,42 @@
+"""revoked tokens
+
+Revision ID: 4d8a6f2b1e7c
+Revises: 7b4e2d1c0f9a
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from app.auth.config import pg_config
+
+# revision identifiers, used by Alembic.
+revision = "4d8a6f2b1e7c"
+down_revision = "7b4e2d1c0f9a"
+branch_labels = None
+depends_on = None
+
+schema = pg_config.schema
+
+
+def upgrade() -> None:
+    op.create_table(
+        "revoked_tokens",
+        sa.Column("jti", sa.String(64), primary_key=True),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column(
+            "revoked_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        schema=schema,
+    )
+    op.create_index(
+        "ix_revoked_tokens_revoked_at", "revoked_tokens", ["revoked_at"], schema=schema
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_revoked_tokens_revoked_at", "revoked_tokens", schema=schema)
+    op.drop_table("revoked_tokens", schema=schema)
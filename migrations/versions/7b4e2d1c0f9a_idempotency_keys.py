@@ -0,0 +1,44 @@
+"""sign-up idempotency keys
+
+Revision ID: 7b4e2d1c0f9a
+Revises: 2c1f0a7d9e3b
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from app.auth.config import pg_config
+
+# revision identifiers, used by Alembic.
+revision = "7b4e2d1c0f9a"
+down_revision = "2c1f0a7d9e3b"
+branch_labels = None
+depends_on = None
+
+schema = pg_config.schema
+users_id = f"{schema}.users.id" if schema else "users.id"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("key", sa.String(64), primary_key=True),
+        sa.Column(
+            "user_id",
+            sa.Integer,
+            sa.ForeignKey(users_id, ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        schema=schema,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("idempotency_keys", schema=schema)
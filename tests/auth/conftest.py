@@ -1,9 +1,13 @@
-from typing import Optional
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
 import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, TextClause
+from sqlalchemy.schema import CreateSchema, DropSchema
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     create_async_engine, async_sessionmaker,
@@ -13,8 +17,9 @@ from sqlalchemy.orm import sessionmaker, clear_mappers
 from app.auth.app import app
 from app.auth.config import JWTConfig, PostgresConfig
 from app.auth.dao import AuthDao
-from app.auth.models import PWDHash, User
+from app.auth.models import PWDHash, User, Credentials
 from app.auth.orm import metadata, register_mapping
+from app.auth.pgdao import AsyncpgAuthDao, PgPool
 from app.auth.schema import UserCredentials
 from app.auth.security import JWTToken, Argon2Auth
 
@@ -24,6 +29,16 @@ from app.auth.security import JWTToken, Argon2Auth
 class FakeAuthDao(AuthDao):
     def __init__(self, data: dict):
         self.db = data
+        self.idempotency_keys = {}
+        self.reachable = True
+        self.waiting = 0
+
+    async def ping(self):
+        if not self.reachable:
+            raise ConnectionError("database is down")
+
+    def pool_stats(self) -> dict:
+        return {"checked_out": 0, "waiting": self.waiting}
 
     async def get_user_id(self, email: str) -> Optional[int]:
         for user in self.db:
@@ -35,9 +50,73 @@ class FakeAuthDao(AuthDao):
             if pwd[1].user_id == user_id:
                 return pwd[1].value
 
+    async def get_users_after(self, user_id: int) -> list[tuple[int, str]]:
+        return [(user[0], user[1].email) for user in self.db if user[0] > user_id]
+
+    async def get_credentials(self, email: str) -> Optional[Credentials]:
+        user_id = await self.get_user_id(email)
+        if user_id:
+            return Credentials(user_id, await self.get_pwdhash_value(user_id))
+
     async def add_one(self, item) -> int:
         return 1
 
+    async def update_pwdhash(self, user_id: int, value: str):
+        for pwd in self.db.values():
+            if pwd[1].user_id == user_id:
+                pwd[1].value = value
+
+    async def create_user(
+        self, email: str, pwdhash: str, idempotency_key: Optional[str] = None
+    ) -> Optional[int]:
+        if not await self.get_user_id(email):
+            if idempotency_key is not None:
+                if idempotency_key in self.idempotency_keys:
+                    return None
+                self.idempotency_keys[idempotency_key] = email
+            return 1
+
+    async def get_idempotent_result(self, key: str) -> Optional[str]:
+        return self.idempotency_keys.get(key)
+
+
+class FakeRedis:
+    """Commands of a redis.asyncio pipeline used by RedisWindowCounters."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.down = False
+        self._commands = []
+
+    def pipeline(self, transaction: bool = True):
+        return self
+
+    async def __aenter__(self):
+        self._commands = []
+        return self
+
+    async def __aexit__(self, *exc):
+        self._commands = []
+
+    def incr(self, key: str):
+        def command():
+            self.data[key] = self.data.get(key, 0) + 1
+            return self.data[key]
+
+        self._commands.append(command)
+
+    def expire(self, key: str, seconds: int):
+        self._commands.append(lambda: self.ttls.update({key: seconds}) or True)
+
+    def get(self, key: str):
+        self._commands.append(lambda: str(self.data[key]).encode() if key in self.data else None)
+
+    async def execute(self) -> list:
+        if self.down:
+            raise ConnectionError("redis is down")
+        return [command() for command in self._commands]
+
 
 @pytest.fixture(scope="module")
 def auth_tokenizer():
@@ -93,8 +172,14 @@ async def recreate_tables(engine: AsyncEngine, schema):
         await conn.run_sync(metadata.create_all)
 
 
-@pytest_asyncio.fixture
-async def auth_dao():
+@pytest_asyncio.fixture(
+    params=["sqlalchemy", pytest.param("asyncpg", marks=pytest.mark.postgres)]
+)
+async def auth_dao(request):
+    if request.param == "asyncpg":
+        async for dao in asyncpg_auth_dao():
+            yield dao
+        return
     conf = PostgresConfig(schema="test")
     engine = create_async_engine(url="sqlite+aiosqlite:///")
     await recreate_tables(engine, conf.schema)
@@ -102,6 +187,41 @@ async def auth_dao():
     yield AuthDao(pool)
 
 
+@asynccontextmanager
+async def throwaway_schema() -> AsyncIterator[tuple[AsyncEngine, str]]:
+    """A new schema of the Postgres database, dropped on exit.
+
+    The tables of the ORM metadata are created in it by the engine, which
+    translates their schema, the configured schema is never touched.
+    """
+    conf = PostgresConfig()
+    schema = f"auth_test_{uuid.uuid4().hex[:8]}"
+    engine = create_async_engine(
+        url=conf.url, execution_options={"schema_translate_map": {metadata.schema: schema}}
+    )
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(CreateSchema(schema))
+    except (OSError, DBAPIError) as e:
+        await engine.dispose()
+        pytest.skip(f"Postgres is not available: {e!r}")
+    try:
+        yield engine, schema
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(DropSchema(schema, cascade=True))
+        await engine.dispose()
+
+
+async def asyncpg_auth_dao():
+    async with throwaway_schema() as (engine, schema):
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+        dao = AsyncpgAuthDao(PgPool(PostgresConfig().dsn, max_size=2), schema=schema)
+        yield dao
+        await dao.shutdown()
+
+
 # E2E:
 
 @pytest.fixture
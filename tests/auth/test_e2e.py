@@ -5,10 +5,20 @@ from app.auth.schema import UserCredentials
 
 sign_up_endpoint = "/api/sign_up"
 login_endpoint = "/api/login"
+verify_endpoint = "/api/verify"
+revoke_endpoint = "/api/revoke/"
+jwks_endpoint = "/.well-known/jwks.json"
 
 new_user_form_data = UserCredentials(email="abc@mail.post", password="-123456789")
 
 
+def metric_value(test_app, series: str) -> float:
+    for line in test_app.get("/metrics").text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
 @pytest.mark.usefixtures("test_tables_teardown")
 def test_hostname_route(test_app):
     response = test_app.get("/")
@@ -35,3 +45,130 @@ def test_register_existing_user_return_status_422(test_app):
 def test_login_new_user_return_status_401(test_app):
     result = test_app.post(login_endpoint, data=new_user_form_data.json())
     assert result.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_verify_valid_token_return_claims(test_app, auth_tokenizer):
+    token = auth_tokenizer.create_token({"email": new_user_form_data.email})
+    result = test_app.get(verify_endpoint, headers={"Authorization": f"Bearer {token}"})
+    assert result.status_code == status.HTTP_200_OK
+    assert result.json()["email"] == new_user_form_data.email
+
+
+def test_verify_invalid_token_return_status_401(test_app):
+    result = test_app.get(verify_endpoint, headers={"Authorization": "Bearer abc.def"})
+    assert result.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.usefixtures("test_tables_teardown")
+def test_login_registered_user_return_token(test_app):
+    test_app.post(sign_up_endpoint, data=new_user_form_data.json())
+    credentials = {"email": new_user_form_data.email, "password": "-123456789"}
+    result = test_app.post(login_endpoint, json=credentials)
+
+    assert result.status_code == status.HTTP_200_OK
+    assert result.headers["content-type"] == "application/json"
+    assert set(result.json()) == {"access_token", "token_type"}
+
+
+@pytest.mark.usefixtures("test_tables_teardown")
+def test_invalid_credentials_prebuilt_response(test_app):
+    result = test_app.post(login_endpoint, data=new_user_form_data.json())
+    assert result.json() == {"detail": "Invalid credentials"}
+    assert result.headers["www-authenticate"] == "Bearer"
+
+    result = test_app.get(verify_endpoint)
+    assert result.status_code == status.HTTP_401_UNAUTHORIZED
+    assert result.json() == {"detail": "Invalid token"}
+    assert result.headers["www-authenticate"] == "Bearer"
+
+
+def test_openapi_declares_response_models(test_app):
+    paths = test_app.get("/openapi.json").json()["paths"]
+
+    login_responses = paths["/api/login/"]["post"]["responses"]
+    assert login_responses["200"]["content"]["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/TokenResponse"
+    }
+    assert "401" in login_responses
+    assert "UserResponse" in str(paths["/api/sign_up/"]["post"]["responses"]["201"])
+    assert "TokenClaims" in str(paths["/api/verify/"]["get"]["responses"]["200"])
+
+
+@pytest.mark.usefixtures("test_tables_teardown")
+def test_revoked_token_return_status_401(test_app, auth_tokenizer):
+    token = auth_tokenizer.create_token({"email": new_user_form_data.email})
+    headers = {"Authorization": f"Bearer {token}"}
+    assert test_app.get(verify_endpoint, headers=headers).status_code == status.HTTP_200_OK
+
+    result = test_app.post(revoke_endpoint, headers=headers)
+    assert result.status_code == status.HTTP_204_NO_CONTENT
+    assert test_app.get(verify_endpoint, headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+    assert test_app.post(revoke_endpoint, headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.usefixtures("test_tables_teardown")
+def test_login_attempts_over_limit_return_status_429(test_app):
+    credentials = {"email": "throttled@mail.post", "password": "-123456789"}
+    for _ in range(10):
+        result = test_app.post(login_endpoint, json=credentials)
+        assert result.status_code == status.HTTP_401_UNAUTHORIZED
+    lookups = 'auth_db_query_seconds_count{query="get_credentials"}'
+    before = metric_value(test_app, lookups)
+    assert before >= 10
+
+    result = test_app.post(login_endpoint, json=credentials)
+    assert result.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(result.headers["retry-after"]) >= 1
+    assert metric_value(test_app, lookups) == before
+
+
+def test_jwks_cacheable(test_app):
+    result = test_app.get(jwks_endpoint)
+    assert result.status_code == status.HTTP_200_OK
+    assert "keys" in result.json()
+    assert result.headers["cache-control"].startswith("public, max-age=")
+
+    etag = result.headers["etag"]
+    result = test_app.get(jwks_endpoint, headers={"If-None-Match": etag})
+    assert result.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_metrics_count_requests_by_route(test_app):
+    test_app.get(verify_endpoint, headers={"Authorization": "Bearer abc.def"})
+    result = test_app.get("/metrics")
+
+    assert result.status_code == status.HTTP_200_OK
+    assert result.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'auth_http_requests_total{route="/api/verify/",method="GET",status="401"}' in result.text
+    assert 'auth_token_seconds_count{operation="verify"}' in result.text
+    assert "auth_db_pool_checked_out" in result.text
+
+
+def test_healthz_return_ok(test_app):
+    result = test_app.get("/healthz")
+
+    assert result.status_code == status.HTTP_200_OK
+    assert result.json() == {"status": "ok"}
+
+
+def test_readyz_report_checks(test_app):
+    result = test_app.get("/readyz")
+
+    assert result.status_code == status.HTTP_200_OK
+    assert result.json()["ready"]
+    assert result.json()["checks"]["database"]["ok"]
+
+
+def test_metrics_startup_steps_measured(test_app):
+    result = test_app.get("/metrics")
+
+    for step in ("total", "mapping", "providers", "database", "hashing", "tokens"):
+        assert f'auth_startup_seconds{{step="{step}"}}' in result.text
+
+
+def test_request_id_returned(test_app):
+    result = test_app.get("/healthz", headers={"X-Request-ID": "req-1"})
+    assert result.headers["x-request-id"] == "req-1"
+
+    result = test_app.get("/healthz")
+    assert len(result.headers["x-request-id"]) == 32
@@ -0,0 +1,136 @@
+import pytest
+import pytest_asyncio
+
+grpc = pytest.importorskip("grpc")
+
+from app.auth.grpc_server import AuthServicer, create_server  # noqa: E402
+from app.auth.proto import auth_pb2, auth_pb2_grpc  # noqa: E402
+from app.auth.throttle import SlidingWindowLimiter, Throttle  # noqa: E402
+
+
+@pytest_asyncio.fixture
+async def stub(fake_dao, test_auth, auth_tokenizer):
+    login_throttle = Throttle(SlidingWindowLimiter(3, 60), SlidingWindowLimiter(100, 60))
+    server = create_server(
+        AuthServicer(fake_dao, test_auth, auth_tokenizer, login_throttle=login_throttle)
+    )
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+        yield auth_pb2_grpc.AuthStub(channel)
+    await server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_login_registered_user_return_token(stub, user_form_data, auth_tokenizer):
+    token = await stub.Login(
+        auth_pb2.Credentials(email=user_form_data.email, password=user_form_data.password)
+    )
+
+    assert token.token_type == "bearer"
+    assert auth_tokenizer.verify_token(token.access_token)["email"] == user_form_data.email
+
+
+@pytest.mark.asyncio
+async def test_login_errors_mapped_to_status_codes(stub, user_form_data):
+    with pytest.raises(grpc.aio.AioRpcError) as e:
+        await stub.Login(auth_pb2.Credentials(email="not an email", password="123456789"))
+    assert e.value.code() == grpc.StatusCode.INVALID_ARGUMENT
+
+    wrong_password = auth_pb2.Credentials(email=user_form_data.email, password="wrong-password")
+    for _ in range(3):
+        with pytest.raises(grpc.aio.AioRpcError) as e:
+            await stub.Login(wrong_password)
+        assert e.value.code() == grpc.StatusCode.UNAUTHENTICATED
+
+    with pytest.raises(grpc.aio.AioRpcError) as e:
+        await stub.Login(wrong_password)
+    assert e.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+    assert int(dict(e.value.trailing_metadata())["retry-after"]) >= 1
+
+
+@pytest.mark.asyncio
+async def test_login_spoofed_forwarded_address_ignored(fake_dao, test_auth, auth_tokenizer):
+    login_throttle = Throttle(SlidingWindowLimiter(100, 60), SlidingWindowLimiter(2, 60))
+    server = create_server(
+        AuthServicer(fake_dao, test_auth, auth_tokenizer, login_throttle=login_throttle)
+    )
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+        stub = auth_pb2_grpc.AuthStub(channel)
+        credentials = auth_pb2.Credentials(email="test@email.com", password="wrong-password")
+        codes = []
+        for i in range(3):
+            with pytest.raises(grpc.aio.AioRpcError) as e:
+                await stub.Login(credentials, metadata=(("x-forwarded-for", f"10.0.0.{i}"),))
+            codes.append(e.value.code())
+    await server.stop(None)
+
+    assert codes == [grpc.StatusCode.UNAUTHENTICATED] * 2 + [grpc.StatusCode.RESOURCE_EXHAUSTED]
+
+
+@pytest.mark.asyncio
+async def test_sign_up_registered_user_already_exists(stub, new_user_form_data, user_form_data):
+    user = await stub.SignUp(
+        auth_pb2.SignUpRequest(
+            email=new_user_form_data.email, password=new_user_form_data.password
+        )
+    )
+    assert user.email == new_user_form_data.email
+
+    with pytest.raises(grpc.aio.AioRpcError) as e:
+        await stub.SignUp(
+            auth_pb2.SignUpRequest(email=user_form_data.email, password=user_form_data.password)
+        )
+    assert e.value.code() == grpc.StatusCode.ALREADY_EXISTS
+
+
+@pytest.mark.asyncio
+async def test_verify_token_return_claims(stub, auth_tokenizer):
+    token = auth_tokenizer.create_token({"email": "test@email.com"})
+    claims = await stub.VerifyToken(auth_pb2.VerifyRequest(token=token))
+    assert claims.email == "test@email.com"
+    assert claims.jti
+
+    with pytest.raises(grpc.aio.AioRpcError) as e:
+        await stub.VerifyToken(auth_pb2.VerifyRequest(token="abc.def"))
+    assert e.value.code() == grpc.StatusCode.UNAUTHENTICATED
+
+
+@pytest.mark.asyncio
+async def test_verify_tokens_stream_results_in_order(stub, auth_tokenizer):
+    tokens = [
+        auth_tokenizer.create_token({"email": "a@email.com"}),
+        "abc.def",
+        auth_tokenizer.create_token({"email": "b@email.com"}),
+    ]
+
+    async def requests():
+        for token in tokens:
+            yield auth_pb2.VerifyRequest(token=token)
+
+    results = [result async for result in stub.VerifyTokens(requests())]
+    assert [result.valid for result in results] == [True, False, True]
+    assert [result.claims.email for result in results] == ["a@email.com", "", "b@email.com"]
+
+
+@pytest.mark.asyncio
+async def test_verify_tokens_unexpected_error_counted_as_unknown(stub, monkeypatch):
+    from app.auth import grpc_server
+
+    def broken_verify_handler(token, tokenizer):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(grpc_server.handlers, "verify_handler", broken_verify_handler)
+    unknown = grpc_server.requests_total.values.get(("VerifyTokens", "UNKNOWN"), 0)
+    timed = sum(grpc_server.request_seconds.values.get(("VerifyTokens",), [[0], 0.0])[0])
+
+    async def requests():
+        yield auth_pb2.VerifyRequest(token="abc.def")
+
+    with pytest.raises(grpc.aio.AioRpcError) as e:
+        [result async for result in stub.VerifyTokens(requests())]
+    assert e.value.code() == grpc.StatusCode.UNKNOWN
+    assert grpc_server.requests_total.values[("VerifyTokens", "UNKNOWN")] == unknown + 1
+    assert sum(grpc_server.request_seconds.values[("VerifyTokens",)][0]) == timed + 1
@@ -1,11 +1,37 @@
+import asyncio
+import importlib.util
+import time
+from pathlib import Path
+
 import pytest
+import sqlalchemy as sa
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
-from app.auth.dao import AuthDao
+from app.auth import bulk
+from app.auth.bloom import EmailFilter
+from app.auth.cleanup import IdempotencyKeysCleanup
+from app.auth.config import PostgresConfig
+from app.auth.dao import AuthDao, db_breaker
+from app.auth.dependencies import create_engine
 from app.auth.models import User, PWDHash
+from app.auth.pgdao import AsyncpgAuthDao, PgPool
+from app.auth.orm import metadata
+from app.auth.pool import InstrumentedPool, warm_up
+from app.auth.replicas import ReplicaSet
+from app.auth.revocation import TokenRevocations
+from tests.auth.conftest import recreate_tables, throwaway_schema
 
 pytestmark = pytest.mark.usefixtures("mappers")
 
 
+def dao_like(auth_dao: AuthDao, **kwargs) -> AuthDao:
+    """Another DAO of the tables of 'auth_dao', with other settings."""
+    if isinstance(auth_dao, AsyncpgAuthDao):
+        kwargs["schema"] = auth_dao.schema
+    return type(auth_dao)(auth_dao.pool, **kwargs)
+
+
 @pytest.mark.asyncio
 async def test_auth_dao_get_user_id_by_email(auth_dao: AuthDao):
     user = User(email="test668@email.com")
@@ -15,6 +41,8 @@ async def test_auth_dao_get_user_id_by_email(auth_dao: AuthDao):
     assert queried_id == registered_id
 
 
+# pwdhashes of unknown users violate the foreign key of Postgres
+@pytest.mark.parametrize("auth_dao", ["sqlalchemy"], indirect=True)
 @pytest.mark.asyncio
 async def test_auth_dao_add_one(auth_dao: AuthDao):
     data_hash1 = PWDHash(value="123456789", user_id=15)
@@ -24,6 +52,7 @@ async def test_auth_dao_add_one(auth_dao: AuthDao):
     assert (data_id1, data_id2) == (1, 2)
 
 
+@pytest.mark.parametrize("auth_dao", ["sqlalchemy"], indirect=True)
 @pytest.mark.asyncio
 async def test_auth_dao_get_pwdhash_by_user_id(auth_dao: AuthDao):
     data_hash1 = PWDHash(value="123456789", user_id=15)
@@ -33,3 +62,434 @@ async def test_auth_dao_get_pwdhash_by_user_id(auth_dao: AuthDao):
     result1 = await auth_dao.get_pwdhash_value(user_id=15)
     result2 = await auth_dao.get_pwdhash_value(user_id=1000)
     assert (result1, result2) == ("123456789", "133133133")
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_get_credentials_by_email(auth_dao: AuthDao):
+    user = User(email="test668@email.com")
+    data_hash = PWDHash(value="123456789")
+    data_hash.users = user  # type: ignore
+    await auth_dao.add_one(data_hash)
+
+    credentials = await auth_dao.get_credentials(user.email)
+    unknown = await auth_dao.get_credentials("unknown@email.com")
+    assert credentials == (data_hash.user_id, "123456789")
+    assert unknown is None
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_create_user(auth_dao: AuthDao):
+    user_id = await auth_dao.create_user("test668@email.com", "123456789")
+
+    credentials = await auth_dao.get_credentials("test668@email.com")
+    assert credentials == (user_id, "123456789")
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_create_existing_user_return_none(auth_dao: AuthDao):
+    await auth_dao.create_user("test668@email.com", "123456789")
+    user_id = await auth_dao.create_user("test668@email.com", "133133133")
+
+    credentials = await auth_dao.get_credentials("test668@email.com")
+    assert user_id is None
+    assert credentials.value == "123456789"
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_create_users_skip_registered(auth_dao: AuthDao):
+    await auth_dao.create_user("test1@email.com", "111111111")
+    users = [
+        ("test1@email.com", "123456789"),
+        ("test2@email.com", "222222222"),
+        ("test3@email.com", "333333333"),
+    ]
+    created = await auth_dao.create_users(users)
+
+    assert set(created) == {"test2@email.com", "test3@email.com"}
+    credentials = await auth_dao.get_credentials("test1@email.com")
+    assert credentials.value == "111111111"
+
+
+async def as_stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_import_users_report_every_line(auth_dao: AuthDao, test_auth):
+    chunks = as_stream(
+        b'{"email": "test1@email.com", "password": "123456789"}\n{"email": "te',
+        b'st2@email.com", "password": "1"}\n\nnot json\n',
+        b'{"email": "test1@email.com", "password": "987654321"}',
+    )
+    lines = bulk.iter_lines(chunks)
+    rows = [row async for row in bulk.import_users(lines, auth_dao, test_auth, 2)]
+
+    assert [(row.line, row.status) for row in rows] == [
+        (2, "error"),
+        (4, "error"),
+        (5, "exists"),
+        (1, "created"),
+    ]
+    credentials = await auth_dao.get_credentials("test1@email.com")
+    assert test_auth.verify_password("123456789", credentials.value)
+
+
+@pytest.mark.asyncio
+async def test_import_users_reject_too_long_email(auth_dao: AuthDao, test_auth):
+    long_email = "a" * 40 + "@email.com"
+    lines = as_stream(
+        b'{"email": "%s", "password": "123456789"}\n' % long_email.encode(),
+        b'{"email": "test1@email.com", "password": "123456789"}',
+    )
+    rows = [row async for row in bulk.import_users(lines, auth_dao, test_auth)]
+
+    assert [(row.line, row.status) for row in rows] == [(1, "error"), (2, "created")]
+    assert await auth_dao.get_user_id(long_email) is None
+
+
+@pytest.mark.postgres
+@pytest.mark.asyncio
+@pytest.mark.parametrize("driver", ["sqlalchemy", "asyncpg"])
+async def test_import_users_row_rejected_by_database_fails_alone(
+        driver, test_auth, monkeypatch
+):
+    # past the length check, sqlite does not enforce the column length
+    monkeypatch.setattr(bulk, "MAX_EMAIL_LENGTH", 320)
+    long_email = "a" * 40 + "@email.com"
+    lines = as_stream(
+        b'{"email": "test1@email.com", "password": "123456789"}\n',
+        b'{"email": "%s", "password": "123456789"}\n' % long_email.encode(),
+        b'{"email": "test2@email.com", "password": "123456789"}',
+    )
+    async with throwaway_schema() as (engine, schema):
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+        if driver == "asyncpg":
+            dao = AsyncpgAuthDao(PgPool(PostgresConfig().dsn, max_size=2), schema=schema)
+        else:
+            dao = AuthDao(async_sessionmaker(bind=engine, expire_on_commit=False))
+        try:
+            rows = [row async for row in bulk.import_users(lines, dao, test_auth)]
+            assert [(row.line, row.status) for row in rows] == [
+                (1, "created"),
+                (2, "error"),
+                (3, "created"),
+            ]
+            assert "too long" in rows[1].detail
+            assert await dao.get_user_id("test2@email.com") is not None
+        finally:
+            if driver == "asyncpg":
+                await dao.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_coalesce_concurrent_lookups(auth_dao: AuthDao):
+    dao = dao_like(auth_dao, coalesce_window=0.01)
+    user_id = await dao.create_user("test1@email.com", "123456789")
+    emails = ["test1@email.com", "test2@email.com", "test1@email.com"]
+
+    user_ids = await asyncio.gather(*(dao.get_user_id(email) for email in emails))
+    credentials = await asyncio.gather(*(dao.get_credentials(e) for e in emails))
+    assert user_ids == [user_id, None, user_id]
+    assert credentials == [(user_id, "123456789"), None, (user_id, "123456789")]
+    assert dao.loader_stats()["get_credentials"]["batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_email_filter_built_from_users_table(auth_dao: AuthDao):
+    await auth_dao.create_users([(f"user{i}@email.com", "123456789") for i in range(50)])
+    emails = EmailFilter(auth_dao, capacity=100)
+    assert emails.might_exist("unknown@email.com")
+
+    await emails.rebuild()
+    assert all(emails.might_exist(f"user{i}@email.com") for i in range(50))
+    assert not emails.might_exist("unknown@email.com")
+    assert emails.stats()["items"] == 50
+
+    # registered through another pod
+    await auth_dao.create_user("other@email.com", "123456789")
+    assert not emails.might_exist("other@email.com")
+    assert await emails.might_be_registered("other@email.com")
+    assert not await emails.might_be_registered("unknown@email.com")
+    assert emails.stats()["items"] == 51
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_update_pwdhash(auth_dao: AuthDao):
+    user_id = await auth_dao.create_user("test668@email.com", "123456789")
+    await auth_dao.update_pwdhash(user_id, "987654321")
+
+    assert await auth_dao.get_pwdhash_value(user_id) == "987654321"
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_create_user_store_idempotency_key(auth_dao: AuthDao):
+    await auth_dao.create_user("test668@email.com", "123456789", idempotency_key="k1")
+    await auth_dao.create_user("test668@email.com", "123456789", idempotency_key="k2")
+
+    assert await auth_dao.get_idempotent_result("k1") == "test668@email.com"
+    assert await auth_dao.get_idempotent_result("k2") is None
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_live_idempotency_key_not_taken_over(auth_dao: AuthDao):
+    # concurrent sign-ups of two emails with one key, the second one lost the race
+    user_id = await auth_dao.create_user("test668@email.com", "123456789", idempotency_key="k1")
+
+    assert await auth_dao.create_user("test1@email.com", "123456789", idempotency_key="k1") is None
+    assert await auth_dao.get_user_id("test1@email.com") is None
+    assert await auth_dao.get_idempotent_result("k1") == "test668@email.com"
+    assert await auth_dao.get_user_id("test668@email.com") == user_id
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_expired_idempotency_key_reused(auth_dao: AuthDao):
+    dao = dao_like(auth_dao, idempotency_ttl=-1)
+    await dao.create_user("test668@email.com", "123456789", idempotency_key="k1")
+
+    user_id = await dao.create_user("test1@email.com", "123456789", idempotency_key="k1")
+    assert user_id is not None
+    assert await dao.get_user_id("test1@email.com") == user_id
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_expired_idempotency_key_ignored(auth_dao: AuthDao):
+    dao = dao_like(auth_dao, idempotency_ttl=-1)
+    await dao.create_user("test668@email.com", "123456789", idempotency_key="k1")
+
+    assert await dao.get_idempotent_result("k1") is None
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_create_user_repeated_after_lost_reply(auth_dao: AuthDao):
+    # a retry of a committed call runs the same statement with the same salted hash
+    user_id = await auth_dao.create_user("test668@email.com", "hash-1", idempotency_key="k1")
+
+    assert await auth_dao.create_user("test668@email.com", "hash-1", "k1") == user_id
+    assert await auth_dao.create_user("test668@email.com", "hash-2") is None
+    assert await auth_dao.get_idempotent_result("k1") == "test668@email.com"
+
+    users = [("test668@email.com", "hash-1"), ("test1@email.com", "hash-1")]
+    created = await auth_dao.create_users(users)
+    assert await auth_dao.create_users(users) == created
+    assert set(created) == {"test668@email.com", "test1@email.com"}
+
+
+@pytest.mark.asyncio
+async def test_expired_idempotency_keys_deleted(auth_dao: AuthDao):
+    await auth_dao.create_user("test668@email.com", "123456789", idempotency_key="k1")
+    cleanup = IdempotencyKeysCleanup(auth_dao)
+    assert await cleanup.cleanup() == 0
+
+    cleanup.dao = dao_like(auth_dao, idempotency_ttl=-1)
+    assert await cleanup.cleanup() == 1
+    assert cleanup.stats() == {"runs": 2, "deleted": 1, "failures": 0}
+
+
+@pytest.mark.asyncio
+async def test_pool_warm_up_opens_connections(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/test.db", poolclass=InstrumentedPool, pool_size=3
+    )
+    await warm_up(engine, 3)
+
+    stats = AuthDao(async_sessionmaker(engine)).pool_stats()
+    assert stats["checked_in"] == 3
+    assert stats["checked_out"] == 0
+    assert stats["checkouts"] == 3
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_record_waiters_and_timeouts(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/test.db",
+        poolclass=InstrumentedPool, pool_size=1, max_overflow=0, pool_timeout=0.2,
+    )
+    async with engine.connect():
+        waiter = asyncio.create_task(engine.connect().start())
+        await asyncio.sleep(0.05)
+        assert engine.pool.stats()["waiting"] == 1
+        assert engine.pool.stats()["checked_out"] == 1
+
+        with pytest.raises(PoolTimeout):
+            await waiter
+
+    stats = engine.pool.stats()
+    assert stats["waiting"] == 0
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_time"] >= 0.2
+    await engine.dispose()
+
+
+async def lagging_replica() -> async_sessionmaker:
+    # an empty database stands for a replica which did not replay anything yet
+    engine = create_async_engine(url="sqlite+aiosqlite:///")
+    await recreate_tables(engine, "test")
+    return async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+@pytest.mark.parametrize("auth_dao", ["sqlalchemy"], indirect=True)
+@pytest.mark.asyncio
+async def test_auth_dao_read_your_writes_from_primary(auth_dao: AuthDao):
+    replicas = ReplicaSet({"replica": await lagging_replica()}, miss_fallback=False)
+    dao = AuthDao(auth_dao.pool, replicas=replicas)
+    user_id = await dao.create_user("test1@email.com", "123456789")
+    await auth_dao.create_user("test2@email.com", "123456789")
+
+    assert await dao.get_credentials("test1@email.com") == (user_id, "123456789")
+    assert await dao.get_pwdhash_value(user_id) == "123456789"
+    # not written by this dao, read from the replica
+    assert await dao.get_user_id("test2@email.com") is None
+    assert replicas.stats()["replicas"]["replica"]["reads"] == 1
+
+
+@pytest.mark.parametrize("auth_dao", ["sqlalchemy"], indirect=True)
+@pytest.mark.asyncio
+async def test_auth_dao_credentials_written_by_other_process_found(auth_dao: AuthDao):
+    replicas = ReplicaSet({"replica": await lagging_replica()}, miss_fallback=False)
+    dao = AuthDao(auth_dao.pool, replicas=replicas)
+    # another worker or pod signed the user up, the replica did not replay it yet
+    user_id = await auth_dao.create_user("test1@email.com", "123456789")
+
+    assert await dao.get_credentials("test1@email.com") == (user_id, "123456789")
+    assert await dao.get_many_credentials(["test1@email.com"]) == {
+        "test1@email.com": (user_id, "123456789")
+    }
+    assert replicas.stats()["fallbacks"] == 2
+
+
+@pytest.mark.parametrize("auth_dao", ["sqlalchemy"], indirect=True)
+@pytest.mark.asyncio
+async def test_auth_dao_replica_miss_fallback_to_primary(auth_dao: AuthDao):
+    replicas = ReplicaSet(
+        {"replica": await lagging_replica()}, lag_window=0, miss_fallback=True
+    )
+    dao = AuthDao(auth_dao.pool, replicas=replicas)
+    user_id = await dao.create_user("test1@email.com", "123456789")
+
+    assert await dao.get_credentials("test1@email.com") == (user_id, "123456789")
+    assert await dao.get_user_ids(["test1@email.com", "test2@email.com"]) == {
+        "test1@email.com": user_id
+    }
+    assert replicas.stats()["fallbacks"] == 2
+
+
+@pytest.mark.parametrize("auth_dao", ["sqlalchemy"], indirect=True)
+@pytest.mark.asyncio
+async def test_auth_dao_failed_replica_read_served_by_primary(auth_dao: AuthDao, tmp_path):
+    # no such directory, every connection fails
+    engine = create_async_engine(url=f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db")
+    replicas = ReplicaSet(
+        {"replica": async_sessionmaker(bind=engine)}, failure_threshold=2, reset_timeout=60
+    )
+    dao = AuthDao(auth_dao.pool, replicas=replicas)
+    await auth_dao.create_user("test1@email.com", "123456789")
+    db_failures = db_breaker.failures
+
+    for _ in range(3):
+        assert await dao.get_user_id("test1@email.com") is not None
+
+    stats = replicas.stats()
+    assert stats["failovers"] == 2
+    assert stats["replicas"]["replica"]["circuit_open"]
+    assert stats["primary_reads"] == 1
+    assert db_breaker.state == db_breaker.CLOSED and db_breaker.failures == db_failures
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_stand_in_shared_by_engines(tmp_path):
+    config = PostgresConfig(
+        driver="sqlite+aiosqlite", database=str(tmp_path / "auth.db"), schema="test"
+    )
+    engine1, engine2 = create_engine(config), create_engine(config)
+    async with engine1.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    dao1 = AuthDao(async_sessionmaker(engine1, expire_on_commit=False))
+    dao2 = AuthDao(async_sessionmaker(engine2, expire_on_commit=False))
+
+    created = await dao1.create_users([("load-0@example.com", "hash"), ("load-1@example.com", "hash")])
+    assert await dao2.get_credentials("load-1@example.com") == (created["load-1@example.com"], "hash")
+    assert await dao2.create_user("load-0@example.com", "other-hash") is None
+    assert dao1.pool_stats()["checkouts"] > 0
+    await engine1.dispose()
+    await engine2.dispose()
+
+
+@pytest.mark.asyncio
+async def test_token_revocations_synced_between_pods(auth_dao: AuthDao):
+    now = time.time()
+    pod1, pod2 = TokenRevocations(auth_dao), TokenRevocations(auth_dao)
+    await pod2.sync()
+
+    await pod1.revoke("jti-1", now + 60)
+    await pod1.revoke("jti-expired", now - 1)
+    assert "jti-1" in pod1 and "jti-1" not in pod2
+
+    await pod2.sync()
+    assert "jti-1" in pod2 and "jti-expired" not in pod2
+    assert await auth_dao.delete_expired_revocations() == 1
+
+
+def baseline_metadata(schema: str) -> sa.MetaData:
+    """The tables as created by the ORM before the covering indexes."""
+    metadata = sa.MetaData(schema=schema)
+    sa.Table(
+        "users",
+        metadata,
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("email", sa.String(40), unique=True, index=True),
+    )
+    sa.Table(
+        "pwdhashes",
+        metadata,
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column(
+            "user_id",
+            sa.Integer,
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            unique=True,
+            index=True,
+        ),
+        sa.Column("value", sa.String(), nullable=False),
+    )
+    return metadata
+
+
+@pytest.mark.postgres
+@pytest.mark.asyncio
+async def test_covering_indexes_migration_on_baseline_schema():
+    pytest.importorskip("alembic")
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    versions = Path(__file__).parents[2] / "migrations" / "versions"
+    path = next(versions.glob("2c1f0a7d9e3b_*.py"))
+    spec = importlib.util.spec_from_file_location("covering_indexes", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    def run(conn, step):
+        with Operations.context(MigrationContext.configure(conn)):
+            step()
+        inspector = sa.inspect(conn)
+        return {
+            index["name"]: index["dialect_options"].get("postgresql_include", [])
+            for table in ("users", "pwdhashes")
+            for index in inspector.get_indexes(table, schema=migration.schema)
+        }
+
+    async with throwaway_schema() as (engine, schema):
+        migration.schema = schema
+        async with engine.begin() as conn:
+            await conn.run_sync(baseline_metadata(schema).create_all)
+            upgraded = await conn.run_sync(run, migration.upgrade)
+            downgraded = await conn.run_sync(run, migration.downgrade)
+
+    assert upgraded == {"ix_users_email": ["id"], "ix_pwdhashes_user_id": ["value"]}
+    assert downgraded == {
+        f"ix_{schema}_users_email": [],
+        f"ix_{schema}_pwdhashes_user_id": [],
+    }
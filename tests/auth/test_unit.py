@@ -1,15 +1,35 @@
+import asyncio
 import datetime
 
 import jwt
 import pytest
 import time
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+    PublicFormat,
+)
+from passlib.hash import argon2
 from pydantic import ValidationError
 
 from app.auth import handlers as h
+from app.auth.cli import generate_private_key
+from app.auth.admission import AdmissionController, Overloaded
+from app.auth.bloom import BloomFilter, EmailFilter
+from app.auth.cache import TTLCache
 from app.auth.config import JWTConfig
+from app.auth.health import HealthMonitor
+from app.auth.loader import BatchLoader
 from app.auth.models import User
+from app.auth.replicas import ReplicaSet
+from app.auth.revocation import Denylist
 from app.auth.schema import UserCredentials
-from app.auth.security import JWTToken
+from app.auth.security import JWTToken, AsyncArgon2Auth, CachedJWTToken, TokenRevoked
+from app.auth.throttle import (
+    RedisWindowCounters, SlidingWindowLimiter, Throttle, Throttled,
+)
+from tests.auth.conftest import FakeRedis
 
 
 def test_empty_email_credentials_raises_error():
@@ -17,6 +37,22 @@ def test_empty_email_credentials_raises_error():
         UserCredentials(email="", password="123456789")
 
 
+def write_private_key(keys_dir, kid, algorithm):
+    key = generate_private_key(algorithm)
+    keys_dir.mkdir(exist_ok=True)
+    (keys_dir / f"{kid}.pem").write_bytes(
+        key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption())
+    )
+    return key
+
+
+def retire_key(keys_dir, kid, key):
+    (keys_dir / f"{kid}.pem").unlink()
+    (keys_dir / f"{kid}.pub.pem").write_bytes(
+        key.public_key().public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
+    )
+
+
 class TestJWT:
 
     def test_jwt_token_create_token(self, auth_tokenizer, username="user"):
@@ -44,6 +80,106 @@ class TestJWT:
         with pytest.raises(jwt.DecodeError):
             auth_tokenizer.verify_token(token)
 
+    def test_cached_jwt_token_verified_once(self, auth_tokenizer, username="user"):
+        tokenizer = CachedJWTToken(JWTConfig(), cache=TTLCache(maxsize=10))
+        user_token = auth_tokenizer.create_token({"username": username})
+
+        payloads = [tokenizer.verify_token(user_token) for _ in range(3)]
+        assert payloads[0]["username"] == username
+        assert payloads[0] == payloads[2]
+        assert (tokenizer.cache.misses, tokenizer.cache.hits) == (1, 2)
+
+    def test_cached_jwt_token_expire_with_token(self, auth_tokenizer, username="user"):
+        tokenizer = CachedJWTToken(JWTConfig(), cache=TTLCache(maxsize=10))
+        expire = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+        user_token = auth_tokenizer.create_token({"username": username, "exp": expire})
+        tokenizer.verify_token(user_token)
+
+        time.sleep(1.1)
+        with pytest.raises(jwt.ExpiredSignatureError):
+            tokenizer.verify_token(user_token)
+
+    def test_cached_jwt_token_revoked_after_cached(self, auth_tokenizer, username="user"):
+        revoked = Denylist()
+        tokenizer = CachedJWTToken(JWTConfig(), cache=TTLCache(maxsize=10), revoked=revoked)
+        user_token = auth_tokenizer.create_token({"username": username})
+        claims = tokenizer.verify_token(user_token)
+
+        revoked.add(claims["jti"], claims["exp"])
+        with pytest.raises(TokenRevoked):
+            tokenizer.verify_token(user_token)
+        assert tokenizer.cache.hits == 1
+
+    @pytest.mark.parametrize("algorithm", ["RS256", "EdDSA"])
+    def test_asymmetric_jwt_token_signed_with_kid(self, tmp_path, algorithm):
+        write_private_key(tmp_path, "key1", algorithm)
+        tokenizer = JWTToken(JWTConfig(algorithm=algorithm, keys_dir=str(tmp_path)))
+        user_token = tokenizer.create_token({"username": "user"})
+
+        assert jwt.get_unverified_header(user_token)["kid"] == "key1"
+        assert tokenizer.verify_token(user_token)["username"] == "user"
+        assert [key["kid"] for key in tokenizer.jwks()["keys"]] == ["key1"]
+
+    def test_asymmetric_jwt_token_rotated_key_still_verified(self, tmp_path):
+        old_key = write_private_key(tmp_path, "key1", "EdDSA")
+        config = JWTConfig(algorithm="EdDSA", keys_dir=str(tmp_path))
+        old_token = JWTToken(config).create_token({"username": "user"})
+
+        retire_key(tmp_path, "key1", old_key)
+        write_private_key(tmp_path, "key2", "EdDSA")
+        tokenizer = JWTToken(config)
+
+        assert jwt.get_unverified_header(tokenizer.create_token({}))["kid"] == "key2"
+        assert tokenizer.verify_token(old_token)["username"] == "user"
+
+    def test_asymmetric_jwt_token_unknown_kid_raise_error(self, tmp_path):
+        write_private_key(tmp_path / "other", "key1", "EdDSA")
+        write_private_key(tmp_path, "key2", "EdDSA")
+        other = JWTToken(JWTConfig(algorithm="EdDSA", keys_dir=str(tmp_path / "other")))
+        tokenizer = JWTToken(JWTConfig(algorithm="EdDSA", keys_dir=str(tmp_path)))
+
+        with pytest.raises(jwt.InvalidSignatureError):
+            tokenizer.verify_token(other.create_token({}))
+
+    def test_verify_handler_invalid_token_raises_error(self, auth_tokenizer):
+        with pytest.raises(h.InvalidToken):
+            h.verify_handler("dlkfjal;kdfjsl;kfjdlkfjsdf", auth_tokenizer)
+
+
+def test_denylist_pruned_after_expiry():
+    denylist = Denylist(bucket=60)
+    denylist.add("a", expires_at=1000)
+    denylist.add("b", expires_at=1100)
+    denylist.add("a", expires_at=1000)
+    assert "a" in denylist and "b" in denylist and "c" not in denylist
+    assert len(denylist) == 2
+
+    # "a" bucket ends at 1020
+    assert denylist.prune(now=1010) == 0
+    assert denylist.prune(now=1020) == 1
+    assert "a" not in denylist and "b" in denylist
+
+
+def test_ttl_cache_evict_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_entry_expired():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, expire_at=time.time() - 1)
+    cache.set("b", 2, expire_at=time.time() + 3600)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
 
 def test_argon_auth_return_hash(test_auth):
     start_time = time.time()
@@ -61,6 +197,64 @@ def test_argon_auth_validate_hash(test_auth):
     assert test_auth.verify_password(test_string, data_hash)
 
 
+def test_argon_auth_outdated_hash_needs_update(test_auth):
+    outdated_hash = argon2.using(memory_cost=1024, rounds=1).hash("some_p@ssw0rd")
+    data_hash = test_auth.hash_password("some_p@ssw0rd")
+
+    assert test_auth.verify_password("some_p@ssw0rd", outdated_hash)
+    assert test_auth.needs_update(outdated_hash)
+    assert not test_auth.needs_update(data_hash)
+
+
+@pytest.mark.asyncio
+async def test_login_rehash_outdated_password(
+        user_form_data, fake_dao, test_auth, auth_tokenizer
+):
+    outdated_hash = argon2.using(memory_cost=1024, rounds=1).hash(user_form_data.password)
+    await fake_dao.update_pwdhash(12, outdated_hash)
+    await h.login_handler(user_form_data, fake_dao, test_auth, auth_tokenizer)
+
+    new_hash = await fake_dao.get_pwdhash_value(12)
+    assert new_hash != outdated_hash
+    assert not test_auth.needs_update(new_hash)
+    assert test_auth.verify_password(user_form_data.password, new_hash)
+
+
+@pytest.mark.asyncio
+async def test_login_skip_rehash_without_hashing_slot(
+        user_form_data, fake_dao, test_auth, auth_tokenizer, monkeypatch
+):
+    outdated_hash = argon2.using(memory_cost=1024, rounds=1).hash(user_form_data.password)
+    await fake_dao.update_pwdhash(12, outdated_hash)
+    # a single slot and no queue
+    admission = AdmissionController(32, 32, max_queue=0)
+
+    async def ahash_password(plain_secret: str) -> str:
+        async with admission.admit():
+            return test_auth.hash_password(plain_secret)
+
+    monkeypatch.setattr(test_auth, "ahash_password", ahash_password)
+    async with admission.admit():
+        result = await h.login_handler(user_form_data, fake_dao, test_auth, auth_tokenizer)
+
+    assert auth_tokenizer.verify_token(result["access_token"])["email"] == user_form_data.email
+    assert await fake_dao.get_pwdhash_value(12) == outdated_hash
+    assert admission.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_argon_auth_hash_in_worker_pool():
+    test_auth = AsyncArgon2Auth(workers=1)
+    await test_auth.startup()
+    try:
+        data_hash = await test_auth.ahash_password("some_p@ssw0rd")
+        assert data_hash.startswith("$argon2id$v=")
+        assert await test_auth.averify_password("some_p@ssw0rd", data_hash)
+        assert not await test_auth.averify_password("other_p@ssw0rd", data_hash)
+    finally:
+        await test_auth.shutdown()
+
+
 @pytest.mark.asyncio
 async def test_login_registered_user_return_token(
         user_form_data, fake_dao, test_auth, auth_tokenizer
@@ -89,9 +283,402 @@ async def test_sign_up_new_user_return_user_model(
     assert user.email == new_user_form_data.email
 
 
+@pytest.mark.asyncio
+async def test_sign_up_repeated_with_idempotency_key_not_hashed_again(
+        new_user_form_data, fake_dao, test_auth, call_counter
+):
+    await h.sign_up_handler(new_user_form_data, fake_dao, test_auth, idempotency_key="k1")
+    test_auth.ahash_password = call_counter
+    try:
+        user = await h.sign_up_handler(
+            new_user_form_data, fake_dao, test_auth, idempotency_key="k1"
+        )
+    finally:
+        del test_auth.ahash_password
+
+    assert user.email == new_user_form_data.email
+    assert call_counter.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_sign_up_idempotency_key_reused_raises_error(
+        new_user_form_data, user_form_data, fake_dao, test_auth
+):
+    await h.sign_up_handler(new_user_form_data, fake_dao, test_auth, idempotency_key="k1")
+
+    with pytest.raises(h.IdempotencyKeyReused):
+        await h.sign_up_handler(user_form_data, fake_dao, test_auth, idempotency_key="k1")
+
+
 @pytest.mark.asyncio
 async def test_sign_up_registered_user_raises_error(
         user_form_data, fake_dao, test_auth, auth_tokenizer
 ):
     with pytest.raises(h.UserAlreadyExists):
         await h.sign_up_handler(user_form_data, fake_dao, test_auth)
+
+
+def test_bloom_filter_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    emails = [f"user{i}@email.com" for i in range(1000)]
+    for email in emails:
+        bloom.add(email)
+
+    false_positives = sum(f"other{i}@email.com" in bloom for i in range(10000))
+    assert all(email in bloom for email in emails)
+    assert false_positives / 10000 < 0.02
+    assert bloom.false_positive_rate == pytest.approx(0.01, rel=0.2)
+
+
+@pytest.mark.asyncio
+async def test_login_unknown_email_rejected_by_filter(
+        new_user_form_data, fake_dao, test_auth, auth_tokenizer, call_counter
+):
+    emails = EmailFilter(fake_dao)
+    emails._filter = BloomFilter(capacity=10)
+    fake_dao.get_credentials = call_counter
+
+    with pytest.raises(h.InvalidCredentials):
+        await h.login_handler(new_user_form_data, fake_dao, test_auth, auth_tokenizer, emails)
+    assert call_counter.calls == 0
+    assert emails.stats()["catch_ups"] == 1
+
+
+@pytest.mark.asyncio
+async def test_login_user_registered_through_other_pod_caught_up(
+        user_form_data, fake_dao, test_auth, auth_tokenizer
+):
+    # built before the user signed up on another pod
+    emails = EmailFilter(fake_dao)
+    emails._filter = BloomFilter(capacity=10)
+
+    result = await h.login_handler(user_form_data, fake_dao, test_auth, auth_tokenizer, emails)
+    assert auth_tokenizer.verify_token(result["access_token"])["email"] == user_form_data.email
+    assert emails.might_exist(user_form_data.email)
+
+
+@pytest.mark.asyncio
+async def test_email_filter_concurrent_misses_share_catch_up(fake_dao, call_counter):
+    emails = EmailFilter(fake_dao)
+    emails._filter = BloomFilter(capacity=10)
+    get_users_after = fake_dao.get_users_after
+
+    async def slow_get_users_after(user_id: int):
+        await asyncio.sleep(0.01)
+        return await get_users_after(user_id)
+
+    fake_dao.get_users_after = slow_get_users_after
+    first = [asyncio.create_task(emails.might_be_registered(f"a{i}@email.com")) for i in range(5)]
+    await asyncio.sleep(0.005)
+    # the running catch-up may have read the table before their users were committed
+    later = [asyncio.create_task(emails.might_be_registered(f"b{i}@email.com")) for i in range(5)]
+    found = await asyncio.gather(*first, *later)
+
+    assert not any(found)
+    assert emails.stats()["catch_ups"] == 2
+
+
+@pytest.mark.asyncio
+async def test_sign_up_new_user_added_to_filter(new_user_form_data, fake_dao, test_auth):
+    emails = EmailFilter(fake_dao)
+    emails._filter = BloomFilter(capacity=10)
+    await h.sign_up_handler(new_user_form_data, fake_dao, test_auth, emails)
+
+    assert emails.might_exist(new_user_form_data.email)
+
+
+@pytest.mark.asyncio
+async def test_sign_up_registered_user_found_by_filter_check(
+        user_form_data, fake_dao, test_auth
+):
+    emails = EmailFilter(fake_dao)
+    emails._filter = BloomFilter(capacity=10)
+    emails.add(user_form_data.email)
+
+    with pytest.raises(h.UserAlreadyExists):
+        await h.sign_up_handler(user_form_data, fake_dao, test_auth, emails)
+
+
+class TestBatchLoader:
+
+    @staticmethod
+    def make_loader(batches: list, window=0.01, max_batch=100, fail=False):
+        async def batch_fn(keys):
+            batches.append(keys)
+            await asyncio.sleep(0.01)
+            if fail:
+                raise ConnectionError
+            return {key: key.upper() for key in keys if key != "missing"}
+
+        return BatchLoader(batch_fn, window=window, max_batch=max_batch)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_loads_coalesced_into_one_batch(self):
+        batches = []
+        loader = self.make_loader(batches)
+        result = await asyncio.gather(*(loader.load(k) for k in ("a", "b", "a", "missing")))
+
+        assert result == ["A", "B", "A", None]
+        assert batches == [["a", "b", "missing"]]
+        assert loader.stats()["coalescing_ratio"] == 4
+
+    @pytest.mark.asyncio
+    async def test_in_flight_load_shared(self):
+        batches = []
+        loader = self.make_loader(batches, window=0)
+        first = asyncio.create_task(loader.load("a"))
+        await asyncio.sleep(0.005)
+        assert await asyncio.gather(first, loader.load("a")) == ["A", "A"]
+        assert batches == [["a"]]
+
+    @pytest.mark.asyncio
+    async def test_max_batch_dispatched_immediately(self):
+        batches = []
+        loader = self.make_loader(batches, window=10, max_batch=2)
+        result = await asyncio.wait_for(
+            asyncio.gather(loader.load("a"), loader.load("b")), timeout=1
+        )
+        assert result == ["A", "B"]
+
+    @pytest.mark.asyncio
+    async def test_batch_error_raised_for_every_key(self):
+        loader = self.make_loader([], fail=True)
+        result = await asyncio.gather(
+            loader.load("a"), loader.load("b"), return_exceptions=True
+        )
+        assert all(isinstance(e, ConnectionError) for e in result)
+
+
+class TestAdmissionController:
+
+    @staticmethod
+    async def hold(admission: AdmissionController, seconds: float):
+        async with admission.admit():
+            await asyncio.sleep(seconds)
+
+    @pytest.mark.asyncio
+    async def test_concurrency_bounded_by_memory_budget(self):
+        admission = AdmissionController(memory_budget=100, operation_memory=32)
+        tasks = [asyncio.create_task(self.hold(admission, 0.05)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+
+        assert admission.slots == 3
+        assert admission.stats()["active"] == 3
+        assert admission.stats()["queue_depth"] == 2
+        await asyncio.gather(*tasks)
+        assert admission.stats()["admitted"] == 5
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejected(self):
+        admission = AdmissionController(32, 32, max_queue=1, max_wait=1)
+        tasks = [asyncio.create_task(self.hold(admission, 0.05)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(Overloaded) as e:
+            await self.hold(admission, 0)
+        assert e.value.retry_after == 1
+        assert admission.stats()["rejected"] == 1
+        await asyncio.gather(*tasks)
+
+    @pytest.mark.asyncio
+    async def test_wait_deadline_exceeded_rejected(self):
+        admission = AdmissionController(32, 32, max_queue=1, max_wait=0.01)
+        task = asyncio.create_task(self.hold(admission, 0.05))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded):
+            await self.hold(admission, 0)
+        assert admission.stats()["timed_out"] == 1
+        await task
+
+    @pytest.mark.asyncio
+    async def test_background_operations_give_way(self):
+        admission = AdmissionController(32, 32, max_queue=1, max_wait=1)
+        order = []
+
+        async def run(name: str, background: bool):
+            async with admission.admit(background):
+                order.append(name)
+                await asyncio.sleep(0.02)
+
+        holder = asyncio.create_task(self.hold(admission, 0.05))
+        await asyncio.sleep(0.01)
+        imports = [asyncio.create_task(run(f"import{i}", True)) for i in range(8)]
+        await asyncio.sleep(0.01)
+        # the background waiters do not fill the queue
+        assert admission.stats()["background_waiting"] == 8
+        login = asyncio.create_task(run("login", False))
+        await asyncio.gather(holder, login, *imports)
+
+        assert order[0] == "login"
+        assert admission.stats()["rejected"] == 0
+
+
+class TestReplicaSet:
+
+    def test_round_robin_skip_unhealthy(self):
+        replicas = ReplicaSet({"r1": 1, "r2": 2, "r3": 3})
+        replicas.mark_down(replicas.replicas[1], "test")
+
+        picked = [replicas.pick().pool for _ in range(4)]
+        assert picked == [1, 3, 1, 3]
+
+    def test_no_healthy_replica_read_primary(self):
+        replicas = ReplicaSet({"r1": 1})
+        replicas.mark_down(replicas.replicas[0], "test")
+
+        assert replicas.pick() is None
+        assert replicas.stats()["primary_reads"] == 1
+
+    def test_recently_written_read_primary(self):
+        replicas = ReplicaSet({"r1": 1}, lag_window=0.05)
+        replicas.written("test@email.com", 12)
+
+        assert replicas.pick("test@email.com") is None
+        assert replicas.pick(12) is None
+        assert replicas.pick("other@email.com").pool == 1
+        time.sleep(0.05)
+        assert replicas.pick("test@email.com").pool == 1
+
+    def test_failing_replica_skipped_until_reset_timeout(self):
+        replicas = ReplicaSet({"r1": 1, "r2": 2}, failure_threshold=2, reset_timeout=0.05)
+        r1 = replicas.replicas[0]
+        for _ in range(2):
+            replicas.read_failed(r1, TimeoutError(), disconnect=False)
+
+        assert r1.healthy
+        assert [replicas.pick().pool for _ in range(3)] == [2, 2, 2]
+        time.sleep(0.05)
+        assert replicas.pick().pool == 1
+        replicas.read_succeeded(r1)
+        assert not replicas.stats()["replicas"]["r1"]["circuit_open"]
+
+    @pytest.mark.asyncio
+    async def test_health_check(self):
+        replicas = ReplicaSet({"r1": 1, "r2": 2, "r3": 3}, max_lag=1)
+        lags = {1: 0.5, 2: 5.0}
+
+        async def lag_fn(pool):
+            return lags[pool]
+
+        await replicas.check(lag_fn)
+        assert [r.healthy for r in replicas.replicas] == [True, False, False]
+
+        lags.update({2: 0.0, 3: 0.0})
+        await replicas.check(lag_fn)
+        assert [r.healthy for r in replicas.replicas] == [True, True, True]
+
+
+class TestHealthMonitor:
+
+    @pytest.mark.asyncio
+    async def test_not_ready_before_start(self, fake_dao, test_auth):
+        health = HealthMonitor(fake_dao, test_auth)
+        await health.check()
+        assert not health.ready
+
+        await health.start()
+        assert health.ready
+        assert health.status()["checks"]["database"]["ok"]
+        await health.stop()
+        assert not health.ready
+
+    @pytest.mark.asyncio
+    async def test_database_unreachable_not_ready(self, fake_dao, test_auth):
+        health = HealthMonitor(fake_dao, test_auth, interval=0.01)
+        await health.start()
+        fake_dao.reachable = False
+        await asyncio.sleep(0.05)
+
+        assert not health.ready
+        assert "database is down" in health.status()["checks"]["database"]["error"]
+        fake_dao.reachable = True
+        await asyncio.sleep(0.05)
+        assert health.ready
+        await health.stop()
+
+    @pytest.mark.asyncio
+    async def test_pool_saturated_not_ready(self, fake_dao, test_auth):
+        health = HealthMonitor(fake_dao, test_auth, max_pool_waiting=2)
+        fake_dao.waiting = 3
+        await health.start()
+
+        assert not health.ready
+        assert not health.status()["checks"]["pool"]["ok"]
+        await health.stop()
+
+    @pytest.mark.asyncio
+    async def test_stale_result_not_ready(self, fake_dao, test_auth):
+        health = HealthMonitor(fake_dao, test_auth, interval=0.01)
+        await health.start()
+        health._task.cancel()
+        await asyncio.sleep(0.05)
+
+        assert not health.ready
+        await health.stop()
+
+
+class TestThrottle:
+
+    @pytest.mark.asyncio
+    async def test_attempts_over_limit_throttled(self):
+        limiter = SlidingWindowLimiter(limit=3, window=60)
+        for _ in range(3):
+            await limiter.acquire("user@email.com")
+
+        with pytest.raises(Throttled) as e:
+            await limiter.acquire("user@email.com")
+        assert 0 < e.value.retry_after <= 120
+        await limiter.acquire("other@email.com")
+        assert limiter.stats() == {"keys": 2, "allowed": 4, "throttled": 1}
+
+    @pytest.mark.asyncio
+    async def test_previous_window_weighted(self):
+        limiter = SlidingWindowLimiter(limit=10, window=0.5)
+        await asyncio.sleep(0.5 - time.time() % 0.5)
+        for _ in range(10):
+            await limiter.acquire("key")
+        await asyncio.sleep(0.5 - time.time() % 0.5 + 0.01)
+
+        # a new fixed window, but about 98% of the previous one still counts
+        with pytest.raises(Throttled):
+            await limiter.acquire("key")
+
+    @pytest.mark.asyncio
+    async def test_idle_keys_evicted(self):
+        throttle = Throttle(SlidingWindowLimiter(5, 0.05), SlidingWindowLimiter(5, 0.05))
+        await throttle.check("user@email.com", "10.0.0.1")
+        await throttle.start()
+        await asyncio.sleep(0.2)
+
+        assert throttle.stats()["email"]["keys"] == throttle.stats()["client"]["keys"] == 0
+        await throttle.stop()
+
+    @pytest.mark.asyncio
+    async def test_email_case_insensitive_client_optional(self):
+        throttle = Throttle(SlidingWindowLimiter(1, 60), SlidingWindowLimiter(1, 60))
+        await throttle.check("User@Email.com", None)
+
+        with pytest.raises(Throttled):
+            await throttle.check("user@email.com", None)
+        assert throttle.stats()["client"]["keys"] == 0
+
+    @pytest.mark.asyncio
+    async def test_redis_counters_shared_fail_open(self):
+        redis = FakeRedis()
+        pods = [
+            Throttle(
+                SlidingWindowLimiter(2, 60, RedisWindowCounters(redis, "login:email", 60)),
+                SlidingWindowLimiter(100, 60, RedisWindowCounters(redis, "login:client", 60)),
+            )
+            for _ in range(2)
+        ]
+        await pods[0].check("user@email.com", "10.0.0.1")
+        await pods[1].check("user@email.com", "10.0.0.2")
+        with pytest.raises(Throttled):
+            await pods[0].check("user@email.com", "10.0.0.3")
+        assert set(redis.ttls.values()) == {120}
+
+        redis.down = True
+        await pods[0].check("user@email.com", "10.0.0.1")
+        assert pods[0].failures == 1
@@ -0,0 +1,199 @@
+import datetime
+import json
+import os
+import platform
+import statistics
+import time
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+
+def throughput(
+    func, *args, duration: float = 0.5, batch: int = 100, rounds: int = 5
+) -> list[float]:
+    """Calls per second of 'func(*args)' in each of 'rounds' rounds of 'duration' seconds.
+
+    Noise (other processes, GC, CPU frequency) moves single rounds both
+    ways, results are the median of the rounds, ignoring 2 outliers of 5.
+    """
+    results = []
+    for _ in range(rounds):
+        calls = 0
+        start_time = time.perf_counter()
+        deadline = start_time + duration
+        while time.perf_counter() < deadline:
+            for _ in range(batch):
+                func(*args)
+            calls += batch
+        results.append(calls / (time.perf_counter() - start_time))
+    return results
+
+
+async def athroughput(
+    func, *args, duration: float = 0.5, batch: int = 10, rounds: int = 5
+) -> list[float]:
+    """Calls per second of 'await func(*args)', run one after another, in each round."""
+    results = []
+    for _ in range(rounds):
+        calls = 0
+        start_time = time.perf_counter()
+        deadline = start_time + duration
+        while time.perf_counter() < deadline:
+            for _ in range(batch):
+                await func(*args)
+            calls += batch
+        results.append(calls / (time.perf_counter() - start_time))
+    return results
+
+
+def machine() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+# saved runs making a baseline, a regression is a drop the runs never showed
+BASELINE_RUNS = 5
+NOISE_MARGIN = 2
+
+
+def noise(runs: list[float]) -> float:
+    """Largest relative drop of a run below the median of the runs."""
+    return 1 - min(runs) / statistics.median(runs)
+
+
+class BenchmarkResults:
+    """Throughput of every benchmark, compared with a stored baseline.
+
+    Results are keyed by '<module>::<test>::<name>'. A baseline entry is the
+    median of the last 'BASELINE_RUNS' saved runs. A result below it by more
+    than the threshold is a regression: the threshold is 'NOISE_MARGIN' times
+    the noise of the saved runs, at least the default one, unless the entry
+    sets its own. Runs of one machine differ by more than the rounds of one
+    run, so a baseline is saved several times before comparing with it.
+    Baselines only make sense for the machine they were recorded on, runs
+    of another machine are dropped by '--benchmark-save'.
+
+    Args:
+        baseline: baseline file content, empty if there is none
+        threshold: minimum allowed throughput loss, 0.3 is 30%
+        compare: regressions fail the benchmark
+
+    Example:
+        $ for run in 1 2 3 4 5; do pytest --benchmark tests/benchmarks --benchmark-save; done
+        $ pytest --benchmark tests/benchmarks --benchmark-compare --benchmark-json results.json
+    """
+
+    def __init__(self, baseline: dict, threshold: float = 0.3, compare: bool = False):
+        self.baseline = baseline.get("results", {})
+        self.same_machine = baseline.get("machine") == machine()
+        self.threshold = threshold
+        self.compare = compare
+        self.results: dict[str, dict] = {}
+
+    def threshold_of(self, base: dict) -> float:
+        if "threshold" in base:
+            return base["threshold"]
+        return max(self.threshold, NOISE_MARGIN * noise(base.get("runs", [base["ops"]])))
+
+    def record(self, name: str, rounds: list[float]) -> Optional[str]:
+        """Store the median of the rounds, return the regression message if it is one."""
+        if name in self.results:
+            raise ValueError(f"Benchmark {name} recorded twice, give it a name")
+        ops = statistics.median(rounds)
+        result = {"ops": round(ops, 1), "us": round(1e6 / ops, 3)}
+        self.results[name] = result
+
+        base = self.baseline.get(name)
+        if base is None:
+            return None
+        threshold = self.threshold_of(base)
+        result["baseline_ops"] = base["ops"]
+        result["threshold"] = round(threshold, 3)
+        result["change"] = round(ops / base["ops"] - 1, 3)
+        if ops < base["ops"] * (1 - threshold):
+            return (
+                f"{name}: {ops:.0f} ops/s is {-result['change']:.0%} slower "
+                f"than the baseline {base['ops']:.0f} ops/s (threshold {threshold:.0%})"
+            )
+        return None
+
+    def dump(self) -> dict:
+        return {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "machine": machine(),
+            "results": self.results,
+        }
+
+    def save_baseline(self, path: Path):
+        # keep thresholds tuned by hand and results of benchmarks not run now
+        results = dict(self.baseline)
+        for name, result in self.results.items():
+            base = results.get(name, {})
+            runs = base.get("runs", []) if self.same_machine else []
+            runs = (runs + [result["ops"]])[-BASELINE_RUNS:]
+            ops = statistics.median(runs)
+            entry = {"ops": round(ops, 1), "us": round(1e6 / ops, 3), "runs": runs}
+            if "threshold" in base:
+                entry["threshold"] = base["threshold"]
+            results[name] = entry
+        baseline = self.dump() | {"results": dict(sorted(results.items()))}
+        path.write_text(json.dumps(baseline, indent=2) + "\n")
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(request):
+    config = request.config
+    baseline_path = Path(config.getoption("--benchmark-baseline"))
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    results = BenchmarkResults(
+        baseline,
+        threshold=config.getoption("--benchmark-threshold"),
+        compare=config.getoption("--benchmark-compare"),
+    )
+    yield results
+
+    if json_path := config.getoption("--benchmark-json"):
+        Path(json_path).write_text(json.dumps(results.dump(), indent=2) + "\n")
+    if config.getoption("--benchmark-save"):
+        results.save_baseline(baseline_path)
+
+
+def _recorder(request, benchmark_results: BenchmarkResults):
+    test = f"{request.node.module.__name__.rsplit('.', 1)[-1]}::{request.node.name}"
+
+    def record(func, name: Optional[str], rounds: list[float]) -> float:
+        name = f"{test}::{name or getattr(func, '__qualname__', repr(func))}"
+        regression = benchmark_results.record(name, rounds)
+        if regression and benchmark_results.compare:
+            pytest.fail(regression)
+        return statistics.median(rounds)
+
+    return record
+
+
+@pytest.fixture
+def benchmark(request, benchmark_results):
+    """'throughput' recording its result under 'name' (the function name by default)."""
+    record = _recorder(request, benchmark_results)
+
+    def run(func, *args, name: Optional[str] = None, **kwargs) -> float:
+        return record(func, name, throughput(func, *args, **kwargs))
+
+    return run
+
+
+@pytest.fixture
+def async_benchmark(request, benchmark_results):
+    """'athroughput' recording its result under 'name' (the function name by default)."""
+    record = _recorder(request, benchmark_results)
+
+    async def run(func, *args, name: Optional[str] = None, **kwargs) -> float:
+        return record(func, name, await athroughput(func, *args, **kwargs))
+
+    return run
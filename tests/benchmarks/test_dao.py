@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy.orm import clear_mappers
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.auth.config import PostgresConfig
+from app.auth.dao import AuthDao
+from app.auth.orm import metadata, register_mapping
+from app.auth.pgdao import AsyncpgAuthDao, PgPool
+from tests.auth.conftest import recreate_tables, throwaway_schema
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.mark.asyncio
+async def test_auth_dao_query_throughput(async_benchmark):
+    # the aiosqlite database of the integration tests, measures the DAO and
+    # ORM overhead rather than the database
+    engine = create_async_engine(url="sqlite+aiosqlite:///")
+    await recreate_tables(engine, PostgresConfig(schema="test").schema)
+    dao = AuthDao(async_sessionmaker(bind=engine, expire_on_commit=False))
+    register_mapping()
+    try:
+        user_id = await dao.create_user("test@email.com", "123456789")
+        user_id_ops = await async_benchmark(dao.get_user_id, "test@email.com")
+        pwdhash_ops = await async_benchmark(dao.get_pwdhash_value, user_id)
+        credentials_ops = await async_benchmark(dao.get_credentials, "test@email.com")
+    finally:
+        clear_mappers()
+        await engine.dispose()
+
+    print(
+        f"\nAuthDao on sqlite: get_user_id {user_id_ops:.0f} ops/s, "
+        f"get_pwdhash_value {pwdhash_ops:.0f} ops/s, get_credentials {credentials_ops:.0f} ops/s"
+    )
+    # one query instead of two
+    assert credentials_ops > user_id_ops * 0.8
+
+
+@pytest.mark.postgres
+@pytest.mark.asyncio
+async def test_get_credentials_throughput_asyncpg_dao(async_benchmark):
+    async with throwaway_schema() as (engine, schema):
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+        orm_dao = AuthDao(async_sessionmaker(engine, expire_on_commit=False))
+        pg_dao = AsyncpgAuthDao(PgPool(PostgresConfig().dsn, max_size=1), schema=schema)
+        await orm_dao.create_user("test@email.com", "123456789")
+        try:
+            orm = await async_benchmark(
+                orm_dao.get_credentials, "test@email.com", name="sqlalchemy"
+            )
+            pg = await async_benchmark(pg_dao.get_credentials, "test@email.com", name="asyncpg")
+        finally:
+            await pg_dao.shutdown()
+
+    print(
+        f"\nget_credentials: sqlalchemy {orm:.0f} ops/s ({1e6 / orm:.0f} us), "
+        f"asyncpg {pg:.0f} ops/s ({1e6 / pg:.0f} us)"
+    )
+    assert pg > orm * 1.5
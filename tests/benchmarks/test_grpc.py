@@ -0,0 +1,62 @@
+import httpx
+import pytest
+
+grpc = pytest.importorskip("grpc")
+
+from app.auth import dependencies as deps  # noqa: E402
+from app.auth.app import app  # noqa: E402
+from app.auth.config import JWTConfig  # noqa: E402
+from app.auth.grpc_server import AuthServicer, create_server  # noqa: E402
+from app.auth.proto import auth_pb2, auth_pb2_grpc  # noqa: E402
+from app.auth.security import JWTToken  # noqa: E402
+
+pytestmark = pytest.mark.benchmark
+
+STREAM_BATCH = 100
+
+
+@pytest.mark.asyncio
+async def test_verify_token_grpc_against_rest(async_benchmark):
+    # the REST route is called in-process (no socket, no HTTP parsing), the
+    # gRPC calls go through a localhost connection, so REST is favored
+    tokenizer = JWTToken(JWTConfig())
+    token = tokenizer.create_token({"email": "test@email.com"})
+    app.dependency_overrides[deps.get_token_provider] = lambda: tokenizer
+    server = create_server(AuthServicer(None, None, tokenizer))
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    try:
+        headers = {"Authorization": f"Bearer {token}"}
+        async with httpx.AsyncClient(
+            app=app, base_url="http://test", headers=headers
+        ) as client:
+            rest_ops = await async_benchmark(client.get, "/api/verify/", name="rest")
+
+        async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = auth_pb2_grpc.AuthStub(channel)
+            request = auth_pb2.VerifyRequest(token=token)
+            unary_ops = await async_benchmark(stub.VerifyToken, request, name="grpc")
+
+            async def verify_batch():
+                async def requests():
+                    for _ in range(STREAM_BATCH):
+                        yield request
+
+                async for _ in stub.VerifyTokens(requests()):
+                    pass
+
+            stream_ops = await async_benchmark(
+                verify_batch, name=f"grpc stream x{STREAM_BATCH}", batch=1
+            )
+    finally:
+        app.dependency_overrides.clear()
+        await server.stop(None)
+
+    stream_tokens = stream_ops * STREAM_BATCH
+    print(
+        f"\nverify: REST {rest_ops:.0f} ops/s, gRPC {unary_ops:.0f} ops/s, "
+        f"gRPC stream {stream_tokens:.0f} tokens/s"
+    )
+    # a stream pays the call overhead once for the whole batch
+    assert stream_tokens > unary_ops * 2
+    assert stream_tokens > rest_ops * 2
@@ -0,0 +1,66 @@
+import io
+import logging
+import time
+
+import pytest
+
+from app.logger import log_formatter, setup_logger, stop_listener
+
+pytestmark = pytest.mark.benchmark
+
+
+class SlowStream(io.StringIO):
+    """Output blocking on every write, like a full pipe to the log collector."""
+
+    def write(self, s: str) -> int:
+        time.sleep(0.0001)
+        return len(s)
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    level, handlers = root.level, root.handlers[:]
+    # only the handlers measured
+    root.handlers = []
+    root.setLevel(logging.INFO)
+    yield root
+    stop_listener()
+    root.handlers = handlers
+    root.setLevel(level)
+
+
+def stream_handler(stream) -> logging.Handler:
+    """The handler of the previous setup_logger, writing in the logging thread."""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(log_formatter)
+    return handler
+
+
+@pytest.mark.parametrize("stream", [io.StringIO, SlowStream])
+def test_logging_overhead(benchmark, root_logger, stream):
+    logger = logging.getLogger("app.bench")
+    noisy = logging.getLogger("sqlalchemy.engine.Engine")
+    handler = stream_handler(stream())
+    root_logger.addHandler(handler)
+    sync_ops = benchmark(logger.info, "user %s logged in", 12, name="stream")
+    root_logger.removeHandler(handler)
+
+    # large enough not to drop records, the cost of enqueuing them is measured
+    setup_logger(stream=stream(), sampling={"sqlalchemy.engine": 10}, queue_size=10**7)
+    queue_ops = benchmark(logger.info, "user %s logged in", 12, name="queue")
+    sampled_ops = benchmark(noisy.info, "SELECT %s", 1, name="sampled out")
+    setup_logger(stream=stream(), json_format=True, queue_size=10**7)
+    json_ops = benchmark(logger.info, "user %s logged in", 12, name="queue json")
+
+    print(
+        f"\n{stream.__name__}: stream {sync_ops:.0f} ops/s, queue {queue_ops:.0f} ops/s, "
+        f"queue json {json_ops:.0f} ops/s, sampled out {sampled_ops:.0f} ops/s"
+    )
+    if stream is SlowStream:
+        # the logging thread never waits for the output
+        assert queue_ops > sync_ops * 3
+    else:
+        # the listener thread formats the records, competing for the GIL
+        assert queue_ops > sync_ops * 0.4
+        assert sampled_ops > queue_ops
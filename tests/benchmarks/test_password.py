@@ -0,0 +1,40 @@
+import pytest
+
+from app.auth.config import Argon2Config
+from app.auth.security import Argon2Auth, argon2_hasher
+
+pytestmark = pytest.mark.benchmark
+
+# (memory_cost KiB, time_cost), the default is the deployed cost
+COSTS = [(8192, 1), (32768, 3), (65536, 3)]
+
+
+def auth_with_cost(memory_cost: int, time_cost: int) -> type[Argon2Auth]:
+    config = Argon2Config(memory_cost=memory_cost, time_cost=time_cost)
+    return type("Argon2Auth", (Argon2Auth,), {"hasher": argon2_hasher(config)})
+
+
+@pytest.mark.parametrize("memory_cost, time_cost", COSTS)
+def test_hash_password_throughput(benchmark, memory_cost, time_cost):
+    auth = auth_with_cost(memory_cost, time_cost)
+
+    ops = benchmark(auth.hash_password, "superpassword", batch=1)
+    print(f"\nhash_password m={memory_cost} t={time_cost}: {ops:.1f} ops/s ({1e3 / ops:.1f} ms)")
+    assert ops > 0
+
+
+@pytest.mark.parametrize("memory_cost, time_cost", COSTS)
+def test_verify_password_throughput(benchmark, memory_cost, time_cost):
+    auth = auth_with_cost(memory_cost, time_cost)
+    hashed = auth.hash_password("superpassword")
+
+    ok = benchmark(auth.verify_password, "superpassword", hashed, batch=1)
+    wrong = benchmark(
+        auth.verify_password, "wrongpassword", hashed, name="verify_password_wrong", batch=1
+    )
+    print(
+        f"\nverify_password m={memory_cost} t={time_cost}: {ok:.1f} ops/s, "
+        f"wrong password {wrong:.1f} ops/s"
+    )
+    # a wrong password costs as much as a right one, no timing oracle
+    assert wrong == pytest.approx(ok, rel=0.5)
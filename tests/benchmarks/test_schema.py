@@ -0,0 +1,24 @@
+import pytest
+from pydantic import ValidationError
+
+from app.auth.schema import UserCredentials
+
+pytestmark = pytest.mark.benchmark
+
+
+def parse_invalid(data: dict):
+    try:
+        UserCredentials.parse_obj(data)
+    except ValidationError:
+        pass
+
+
+def test_user_credentials_validation_throughput(benchmark):
+    valid = {"email": "test@email.com", "password": "superpassword"}
+    invalid = {"email": "test.email.com", "password": "123"}
+
+    ok = benchmark(UserCredentials.parse_obj, valid, name="UserCredentials.parse_obj")
+    error = benchmark(parse_invalid, invalid)
+    print(f"\nUserCredentials: valid {ok:.0f} ops/s, invalid {error:.0f} ops/s")
+    # email validation dominates, it should stay well under a millisecond
+    assert ok > 2000
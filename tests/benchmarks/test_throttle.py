@@ -0,0 +1,26 @@
+import pytest
+
+from app.auth.throttle import SlidingWindowLimiter, Throttle, Throttled
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.mark.asyncio
+async def test_throttle_check_throughput(async_benchmark):
+    throttle = Throttle(SlidingWindowLimiter(10**9, 60), SlidingWindowLimiter(10**9, 60))
+    throttled = Throttle(SlidingWindowLimiter(1, 60), SlidingWindowLimiter(10**9, 60))
+
+    async def rejected():
+        try:
+            await throttled.check("user@email.com", "10.0.0.1")
+        except Throttled:
+            pass
+
+    allowed_ops = await async_benchmark(
+        throttle.check, "user@email.com", "10.0.0.1", name="allowed", batch=100
+    )
+    rejected_ops = await async_benchmark(rejected, name="rejected", batch=100)
+    print(f"\nthrottle check: allowed {allowed_ops:.0f} ops/s, rejected {rejected_ops:.0f} ops/s")
+    # paid by every login and sign-up, a rejection replaces a lookup and a hash
+    assert allowed_ops > 50000
+    assert rejected_ops > 20000
@@ -0,0 +1,19 @@
+import pytest
+
+from app.auth.config import JWTConfig
+from app.auth.security import JWTToken
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_token_throughput(benchmark):
+    tokenizer = JWTToken(JWTConfig())
+    user_data = {"email": "test@email.com"}
+    token = tokenizer.create_token(user_data)
+
+    create = benchmark(tokenizer.create_token, user_data)
+    verify = benchmark(tokenizer.verify_token, token)
+    print(f"\ncreate_token: {create:.0f} ops/s, verify_token: {verify:.0f} ops/s")
+    # both run on the event loop for every login and verify request
+    assert create > 1000
+    assert verify > 1000
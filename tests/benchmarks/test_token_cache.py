@@ -0,0 +1,19 @@
+import pytest
+
+from app.auth.cache import TTLCache
+from app.auth.config import JWTConfig
+from app.auth.security import JWTToken, CachedJWTToken
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_verify_token_throughput_with_cache(benchmark):
+    config = JWTConfig()
+    tokenizer = JWTToken(config)
+    cached_tokenizer = CachedJWTToken(config, cache=TTLCache(maxsize=100))
+    token = tokenizer.create_token({"email": "test@email.com"})
+
+    uncached = benchmark(tokenizer.verify_token, token)
+    cached = benchmark(cached_tokenizer.verify_token, token)
+    print(f"\nverify_token: {uncached:.0f} ops/s, cached: {cached:.0f} ops/s")
+    assert cached > uncached * 5
@@ -12,3 +12,59 @@ class CallCounter:
 @pytest.fixture(scope="function")
 def call_counter():
     return CallCounter()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark", action="store_true", default=False, help="run benchmarks"
+    )
+    parser.addoption(
+        "--postgres",
+        action="store_true",
+        default=False,
+        help="run the tests needing the Postgres database configured by the POSTGRES_* "
+        "variables, in a schema created and dropped by the tests",
+    )
+    parser.addoption(
+        "--benchmark-json", default=None, metavar="PATH", help="write benchmark results to PATH"
+    )
+    parser.addoption(
+        "--benchmark-compare",
+        action="store_true",
+        default=False,
+        help="fail benchmarks slower than the baseline by more than the threshold",
+    )
+    parser.addoption(
+        "--benchmark-save",
+        action="store_true",
+        default=False,
+        help="store the benchmark results as the new baseline",
+    )
+    parser.addoption(
+        "--benchmark-baseline",
+        default="tests/benchmarks/baseline.json",
+        metavar="PATH",
+        help="benchmark baseline file",
+    )
+    parser.addoption(
+        "--benchmark-threshold",
+        type=float,
+        # runs on one CPU differ by up to 25% without a code change
+        default=0.3,
+        help="minimum allowed throughput loss against the baseline, 0.3 is 30%%",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: performance benchmark, run with --benchmark")
+    config.addinivalue_line("markers", "postgres: needs a Postgres database, run with --postgres")
+
+
+def pytest_collection_modifyitems(config, items):
+    skip_benchmark = pytest.mark.skip(reason="need --benchmark option to run")
+    skip_postgres = pytest.mark.skip(reason="need --postgres option to run")
+    for item in items:
+        if "benchmark" in item.keywords and not config.getoption("--benchmark"):
+            item.add_marker(skip_benchmark)
+        if "postgres" in item.keywords and not config.getoption("--postgres"):
+            item.add_marker(skip_postgres)
@@ -0,0 +1,81 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from app.logger import (
+    AppQueueHandler, SamplingFilter, log_stats, request_id, setup_logger, stop_listener,
+)
+
+
+@pytest.fixture
+def output():
+    root = logging.getLogger()
+    level = root.level
+    yield io.StringIO()
+    stop_listener()
+    for handler in root.handlers[:]:
+        if getattr(handler, "app_handler", False):
+            root.removeHandler(handler)
+    root.setLevel(level)
+
+
+def app_handlers() -> list[logging.Handler]:
+    return [h for h in logging.getLogger().handlers if getattr(h, "app_handler", False)]
+
+
+def test_setup_logger_idempotent(output):
+    setup_logger(stream=output)
+    setup_logger(stream=output)
+    logging.getLogger("test").info("once")
+    stop_listener()
+
+    assert len(app_handlers()) == 1
+    assert output.getvalue().count("once") == 1
+
+
+def test_json_records_written_by_listener(output):
+    setup_logger(stream=output, json_format=True)
+    token = request_id.set("req-1")
+    try:
+        logging.getLogger("test").info("user %s", 12, extra={"user_id": 12})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("test").exception("failed")
+    finally:
+        request_id.reset(token)
+    stop_listener()
+
+    first, second = map(json.loads, output.getvalue().splitlines())
+    assert first["message"] == "user 12"
+    assert (first["level"], first["logger"], first["request_id"]) == ("INFO", "test", "req-1")
+    assert first["user_id"] == 12
+    assert "ValueError: boom" in second["exception"]
+
+
+def test_noisy_logger_sampled_below_warning():
+    sampling = SamplingFilter({"sqlalchemy.engine": 5})
+    records = [
+        logging.makeLogRecord({"name": "sqlalchemy.engine.Engine", "levelno": logging.INFO})
+        for _ in range(100)
+    ]
+
+    assert sum(map(sampling.filter, records)) == 5
+    assert sampling.sampled_out == 95
+    assert sampling.filter(
+        logging.makeLogRecord({"name": "sqlalchemy.engine.Engine", "levelno": logging.WARNING})
+    )
+    assert sampling.filter(logging.makeLogRecord({"name": "sqlalchemy", "levelno": logging.INFO}))
+
+
+def test_full_queue_drops_records(output):
+    setup_logger(stream=output)
+    handler = AppQueueHandler(queue.SimpleQueue(), max_size=1)
+    handler.handle(logging.makeLogRecord({"msg": "kept"}))
+    handler.handle(logging.makeLogRecord({"msg": "dropped"}))
+
+    assert handler.dropped == 1
+    assert set(log_stats()) == {"queue_depth", "dropped", "sampled_out"}
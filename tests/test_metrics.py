@@ -0,0 +1,136 @@
+import json
+import os
+
+import pytest
+
+from app.metrics import Counter, Gauge, Histogram, Metric, Registry
+
+
+def test_counter_render_labels():
+    counter = Counter("requests_total", "Requests.", ["route", "status"])
+    counter.inc("/api/login/", "200")
+    counter.inc("/api/login/", "200")
+    counter.inc("/api/login/", "401")
+
+    assert counter.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/api/login/",status="200"} 2',
+        'requests_total{route="/api/login/",status="401"} 1',
+    ]
+
+
+def test_metric_without_merge_not_created():
+    class Untyped(Metric):
+        def samples(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Untyped("untyped", "Untyped.")
+
+
+def test_histogram_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    assert histogram.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 5.65",
+        "latency_seconds_count 4",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_histogram_timed_observe_failed_calls():
+    histogram = Histogram("query_seconds", "Query time.", ["query"])
+
+    @histogram.timed("get")
+    async def query(fail: bool):
+        if fail:
+            raise ConnectionError
+
+    await query(False)
+    with pytest.raises(ConnectionError):
+        await query(True)
+    assert 'query_seconds_count{query="get"} 2' in histogram.render()
+
+
+def test_registry_render_collected_metrics():
+    registry = Registry()
+    registry.counter("calls_total", "Calls.").inc()
+
+    def collect():
+        gauge = Counter("collected_total", "Collected.")
+        gauge.inc(amount=3)
+        return [gauge]
+
+    registry.add_collector(collect)
+    assert registry.render().splitlines()[2::3] == ["calls_total 1", "collected_total 3"]
+
+
+def test_registry_shared_by_processes_sum_metrics(tmp_path):
+    # a worker writing the same metrics, and one which exited
+    other_worker = Registry()
+    other_worker.counter("requests_total", "Requests.", ["route"]).inc("/login", amount=2)
+    other_worker.histogram("latency_seconds", "Latency.", buckets=(0.1, 1)).observe(0.5)
+    snapshot = [metric.snapshot() for metric in other_worker.collect()]
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(snapshot))
+    (tmp_path / "999999999.json").write_text(json.dumps(snapshot))
+
+    registry = Registry()
+    registry.share(str(tmp_path))
+    registry.counter("requests_total", "Requests.", ["route"]).inc("/login")
+    registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1)).observe(0.05)
+    gauge = Gauge("connections", "Connections.", multiprocess="sum")
+    gauge.set(value=4)
+    registry.add_collector(lambda: [gauge])
+    lines = registry.render().splitlines()
+
+    assert 'requests_total{route="/login"} 3' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert "latency_seconds_count 2" in lines
+    assert "connections 4" in lines
+    assert not (tmp_path / "999999999.json").exists()
+
+
+def test_registry_shared_by_processes_merge_gauges_by_mode(tmp_path):
+    def gauges(rate: float, connections: int) -> list[Gauge]:
+        ratio = Gauge("false_positive_rate", "Rate.", multiprocess="max")
+        ratio.set(value=rate)
+        pool = Gauge("connections", "Connections.", multiprocess="sum")
+        pool.set(value=connections)
+        per_process = Gauge("avg_wait_seconds", "Wait.", ["pool"])
+        per_process.set("primary", value=rate)
+        return [ratio, pool, per_process]
+
+    snapshot = [metric.snapshot() for metric in gauges(0.03, 2)]
+    for data in snapshot:
+        for labels, _ in data["values"]:
+            if data["multiprocess"] == "all":
+                labels[-1] = str(os.getppid())
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(snapshot))
+
+    registry = Registry()
+    registry.share(str(tmp_path))
+    registry.add_collector(lambda: gauges(0.01, 4))
+    lines = registry.render().splitlines()
+
+    assert "false_positive_rate 0.03" in lines
+    assert "connections 6" in lines
+    assert f'avg_wait_seconds{{pool="primary",pid="{os.getpid()}"}} 0.01' in lines
+    assert f'avg_wait_seconds{{pool="primary",pid="{os.getppid()}"}} 0.03' in lines
+
+
+@pytest.mark.asyncio
+async def test_registry_stop_sharing_remove_snapshot(tmp_path):
+    registry = Registry()
+    registry.share(str(tmp_path), interval=0.01)
+    await registry.start_sharing()
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+    await registry.stop_sharing()
+    assert list(tmp_path.iterdir()) == []
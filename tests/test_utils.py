@@ -1,7 +1,7 @@
 import pytest
 import time
 
-from app.utils import Retry
+from app.utils import Retry, CircuitBreaker, CircuitOpen, retry_stats
 
 
 async def unreliable_function(exc, cnt):
@@ -93,3 +93,123 @@ async def test_retry_if_not_match_excluded_exc(call_counter, exclude_exc, func_e
     with pytest.raises(func_exp):
         await func(func_exp, call_counter)
     assert call_counter.calls == attempts + 1
+
+
+@pytest.mark.asyncio
+async def test_retry_exponential_backoff_delay(call_counter, exc=TimeoutError):
+    func = Retry(attempts=3, delay=0.1, backoff=2, max_delay=0.3)(unreliable_function)
+    start_time = time.time()
+    with pytest.raises(exc):
+        await func(exc, call_counter)
+    run_time = time.time() - start_time
+    assert round(run_time, 1) == 0.6  # 0.1 + 0.2 + 0.3 (capped)
+
+
+def test_retry_jitter_delay_within_bounds():
+    retry = Retry(delay=1, backoff=2, jitter=True)
+    delays = [retry._next_delay(3) for _ in range(100)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+@pytest.mark.asyncio
+async def test_retry_stop_on_deadline(call_counter, exc=TimeoutError):
+    func = Retry(attempts=10, delay=0.2, deadline=0.5)(unreliable_function)
+    start_time = time.time()
+    with pytest.raises(exc):
+        await func(exc, call_counter)
+    assert call_counter.calls == 3
+    assert time.time() - start_time < 0.5
+
+
+@pytest.mark.asyncio
+async def test_retry_stats_per_function(call_counter, exc=TimeoutError):
+    async def stats_function(cnt):
+        return await unreliable_function(exc, cnt)
+
+    func = Retry(attempts=2, delay=0)(stats_function)
+    with pytest.raises(exc):
+        await func(call_counter)
+    stats = retry_stats[f"{__name__}.{stats_function.__qualname__}"]
+    assert (stats.calls, stats.retries, stats.failures) == (1, 2, 1)
+
+
+@pytest.mark.parametrize('subclasses, calls', [(False, 1), (True, 3)])
+@pytest.mark.asyncio
+async def test_retry_on_exc_subclasses(call_counter, subclasses, calls):
+    func = Retry(attempts=2, delay=0, on_exc=(ConnectionError,), subclasses=subclasses)(
+        unreliable_function
+    )
+    with pytest.raises(BrokenPipeError):
+        await func(BrokenPipeError, call_counter)
+    assert call_counter.calls == calls
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fail_fast_when_open(call_counter, exc=ConnectionError):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    func = Retry(attempts=5, delay=0, breaker=breaker)(unreliable_function)
+
+    with pytest.raises(CircuitOpen):
+        await func(exc, call_counter)
+    assert call_counter.calls == 2
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpen):
+        await func(exc, call_counter)
+    assert call_counter.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_half_open_probe(call_counter, exc=ConnectionError):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    failing = Retry(attempts=0, delay=0, breaker=breaker)(unreliable_function)
+    reliable = Retry(attempts=0, delay=0, breaker=breaker)(reliable_function)
+
+    with pytest.raises(exc):
+        await failing(exc, call_counter)
+    with pytest.raises(CircuitOpen):
+        await reliable(call_counter)
+
+    time.sleep(0.1)
+    with pytest.raises(exc):
+        await failing(exc, call_counter)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.1)
+    assert await reliable(call_counter) == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_ignore_not_retried_exc(call_counter):
+    breaker = CircuitBreaker(failure_threshold=1)
+    func = Retry(attempts=1, delay=0, exclude_exc=(ValueError,), breaker=breaker)(
+        unreliable_function
+    )
+    with pytest.raises(ValueError):
+        await func(ValueError, call_counter)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class Overloaded(BaseException):
+    pass
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_half_open_not_closed_without_success(call_counter):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    failing = Retry(attempts=0, delay=0, breaker=breaker)(unreliable_function)
+    reliable = Retry(attempts=0, delay=0, breaker=breaker)(reliable_function)
+
+    with pytest.raises(ConnectionError):
+        await failing(ConnectionError, call_counter)
+    time.sleep(0.1)
+    with pytest.raises(Overloaded):
+        await failing(Overloaded, call_counter)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # the next call probes again
+    assert await reliable(call_counter) == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+